@@ -6,3 +6,4 @@ twitch_id = "TWITCH CLIENT ID"
 twitch_secret = "TWITCH CLIENT SECRET"
 twitch_token = "TWITCH APPLICATION ACCESS TOKEN"
 google_callback_verification = "GOOGLE DOMAIN VERIFICATION FILE"
+user_agent = "REDDIT USER AGENT"
@@ -0,0 +1,144 @@
+"""Benchmark of the surrender@20 post parser against the previous string slicing
+
+Reads Blogger post objects saved as JSON files from a corpus directory, parses
+each of them with the old find/regex code and with ext.posts, and prints the
+time per post, the peak memory of a parse and how often the results differ.
+
+    python -m bench.post_parser --fetch 200 --corpus bench/posts
+    python -m bench.post_parser --corpus bench/posts --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import tracemalloc
+
+import aiohttp
+
+from ext import posts
+
+POSTS_URL = "https://www.googleapis.com/blogger/v3/blogs/8141971962311514602/posts"
+
+cleanr = re.compile('<.*?>')
+
+
+# the parsing as it was done inline in the webserver before ext.posts existed
+def legacy_parse(content):
+    startImgPos = content.find('<img', 0, len(content)) + 4
+    linkTag = None
+    if(startImgPos > -1):
+        endImgPos = content.find('>', startImgPos, len(content))
+        imageTag = content[startImgPos:endImgPos]
+        if "'" in imageTag:
+            apostrophe = "'"
+        else:
+            apostrophe = '"'
+        startSrcPos = imageTag.find('src=' + apostrophe, 0, len(content)) + 5
+        endSrcPos = imageTag.find(apostrophe, startSrcPos, len(content))
+        linkTag = imageTag[startSrcPos:endSrcPos]
+
+    brokentext = content.replace("<br />", "\n")
+    cleantext = re.sub(cleanr, '', brokentext).replace("&nbsp;", " ").replace("amp;", "")
+    lowered = cleantext.lower()
+    paragraphs = cleantext.split("\n")
+
+    firstpart = " ".join(cleantext.split("\n")[0:5])
+    start = firstpart.find("[")
+    end = firstpart.rfind("]")
+    note = firstpart[start:end + 1]
+    return cleantext, lowered, paragraphs, linkTag, note
+
+
+# saves the latest posts of the blog into the corpus directory
+async def fetch(count, corpus):
+    import auth_token
+    os.makedirs(corpus, exist_ok=True)
+    saved = 0
+    page_token = None
+    async with aiohttp.ClientSession() as session:
+        while saved < count:
+            params = {"key": auth_token.google, "maxResults": str(min(count - saved, 20)),
+                      "fields": "nextPageToken,items(id,updated,title,content)"}
+            if page_token is not None:
+                params["pageToken"] = page_token
+            async with session.get(POSTS_URL, params=params) as resp:
+                page = await resp.json()
+            for item in page.get("items", []):
+                with open(os.path.join(corpus, item["id"] + ".json"), "w") as file:
+                    json.dump(item, file)
+                saved += 1
+            page_token = page.get("nextPageToken")
+            if page_token is None:
+                break
+    print(f"Saved {saved} posts to {corpus}")
+
+
+def load(corpus):
+    contents = []
+    for filename in sorted(os.listdir(corpus)):
+        if filename.endswith(".json"):
+            with open(os.path.join(corpus, filename)) as file:
+                contents.append(json.load(file)["content"])
+    return contents
+
+
+# seconds per post and peak bytes allocated while parsing the largest post
+def measure(function, contents, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in contents:
+            function(content)
+    seconds = (time.perf_counter() - start) / (repeat * len(contents))
+
+    largest = max(contents, key=len)
+    tracemalloc.start()
+    function(largest)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="bench/posts", help="directory of saved post JSON files")
+    parser.add_argument("--fetch", type=int, default=0, help="download this many of the latest posts first")
+    parser.add_argument("--repeat", type=int, default=10, help="times every post is parsed")
+    args = parser.parse_args()
+
+    if args.fetch > 0:
+        asyncio.run(fetch(args.fetch, args.corpus))
+    contents = load(args.corpus)
+    if len(contents) == 0:
+        print(f"No posts in {args.corpus}, use --fetch to download some")
+        return
+
+    legacy_seconds, legacy_peak = measure(legacy_parse, contents, args.repeat)
+    seconds, peak = measure(posts.parse, contents, args.repeat)
+
+    # how the results differ
+    image_differs = 0
+    legacy_garbage = 0
+    note_differs = 0
+    for content in contents:
+        _, _, _, legacy_image, legacy_note = legacy_parse(content)
+        document = posts.parse(content)
+        if legacy_image != document.image:
+            image_differs += 1
+        if "<img" not in content and legacy_image is not None:
+            legacy_garbage += 1
+        if legacy_note != document.note:
+            note_differs += 1
+
+    size = sum(len(content) for content in contents) / len(contents)
+    print(f"{len(contents)} posts, {size / 1024:.1f} KiB on average, largest {max(map(len, contents)) / 1024:.1f} KiB")
+    print(f"{'parser':>8} {'ms/post':>8} {'peak KiB':>9}")
+    print(f"{'legacy':>8} {legacy_seconds * 1000:>8.3f} {legacy_peak / 1024:>9.1f}")
+    print(f"{'posts':>8} {seconds * 1000:>8.3f} {peak / 1024:>9.1f}")
+    print(f"images differ in {image_differs} posts, {legacy_garbage} of them had no image but got one from the slicing")
+    print(f"notes differ in {note_differs} posts")
+
+
+if __name__ == "__main__":
+    main()
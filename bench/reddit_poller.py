@@ -0,0 +1,246 @@
+"""Offline scale benchmark for the Reddit poller
+
+Starts a fake reddit listing server and fake discord channels and drives the
+real Reddit cog against them on an in-memory sqlite database, nothing is sent
+to reddit.com or discord.
+
+    python -m bench.reddit_poller --subreddits 100 1000 10000 --duration 120
+"""
+import argparse
+import asyncio
+import random
+import resource
+import time
+
+import aiohttp
+from aiohttp import web
+
+import config
+from ext import delivery
+from ext import migrations
+from ext import reddit
+from ext import sqlite
+from ext import subscriptions
+from ext import writebehind
+
+
+class FakeReddit:
+    """Serves /r/<names>/new.json listings of generated posts"""
+
+    def __init__(self, count, busy_fraction, busy_rate, quiet_rate, latency, error_rate, slow_fraction, slow_latency):
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.start = time.time()
+        # subreddit name -> (id, posts per second)
+        self.subreddits = {}
+        for i in range(count):
+            rate = busy_rate if random.random() < busy_fraction else quiet_rate
+            self.subreddits[f"sub{i}"] = (f"t5_{i}", rate)
+        # listings including one of these subreddits take slow_latency to answer
+        self.slow = {name for name in self.subreddits if random.random() < slow_fraction}
+        # subreddit name -> list of posts, oldest first
+        self.posts = {name: [] for name in self.subreddits}
+        self.next_post = {name: self.start + random.expovariate(rate)
+                          for name, (_, rate) in self.subreddits.items()}
+
+        self.app = web.Application()
+        self.app.add_routes([web.get("/r/{names}/new.json", self.listing)])
+
+    # create all posts that are due by now
+    def generate(self, name):
+        now = time.time()
+        subreddit_id, rate = self.subreddits[name]
+        posts = self.posts[name]
+        while self.next_post[name] <= now:
+            post_id = f"{subreddit_id[3:]}x{len(posts)}"
+            posts.append({"id": post_id, "name": "t3_" + post_id, "subreddit_id": subreddit_id, "subreddit": name,
+                          "created_utc": self.next_post[name], "title": f"Post {len(posts)} in {name}",
+                          "permalink": f"/r/{name}/comments/{post_id}/", "author": "bench", "selftext": "",
+                          "over_18": False, "thumbnail": "self", "domain": "self." + name, "url": ""})
+            self.next_post[name] += random.expovariate(rate)
+        return posts
+
+    # every post that was created so far
+    def all_posts(self):
+        for name in self.subreddits:
+            yield from self.generate(name)
+
+    async def listing(self, request):
+        self.requests += 1
+        names = request.match_info["names"].split("+")
+        if any(name in self.slow for name in names):
+            await asyncio.sleep(self.slow_latency)
+        else:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503)
+
+        posts = []
+        for name in names:
+            if name in self.subreddits:
+                posts.extend(self.generate(name))
+        posts.sort(key=lambda post: post["created_utc"], reverse=True)
+
+        limit = int(request.query.get("limit", 25))
+        before = request.query.get("before")
+        if before is not None:
+            # the posts right after the cursor, still sorted newest first
+            names = [post["name"] for post in posts]
+            if before not in names:
+                posts = []
+            else:
+                posts = posts[:names.index(before)][-limit:]
+        posts = posts[:limit]
+
+        return web.json_response({"data": {"children": [{"kind": "t3", "data": post} for post in posts]}})
+
+
+class FakeChannel:
+    """Discord channel that records the messages sent to it"""
+
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.guild = self
+        self.sent = []
+
+    def is_nsfw(self):
+        return False
+
+    async def send(self, content=None, embed=None):
+        self.sent.append(embed.url)
+        return self
+
+
+# an in-memory sqlite database holding the subreddits, where every guild has its own channel
+async def seed_database(fake_reddit, guilds_per_subreddit):
+    pool = await sqlite.SqlitePool.open(":memory:")
+    await migrations.migrate(pool)
+    guilds = []
+    subreddits = []
+    subscriptions = []
+    for name, (subreddit_id, _) in fake_reddit.subreddits.items():
+        subreddits.append((subreddit_id, name, None, fake_reddit.start, False, "", ""))
+        for i in range(guilds_per_subreddit):
+            guild_id = len(guilds)
+            guilds.append((guild_id, f"guild{guild_id}", guild_id))
+            subscriptions.append((subreddit_id, guild_id))
+    async with pool.acquire() as db:
+        async with db.transaction():
+            await db.executemany("INSERT INTO Guilds (ID, Name, RedditNotifChannel) VALUES ($1, $2, $3)", guilds)
+            await db.executemany("INSERT INTO Subreddits (ID, Name, LastPostID, LastPostTime, Over18, Icon, Description) \
+                                  VALUES ($1, $2, $3, $4, $5, $6, $7)", subreddits)
+            await db.executemany("INSERT INTO SubredditSubscriptions (Subreddit, Guild) VALUES ($1, $2)", subscriptions)
+    return pool
+
+
+class FakeBot:
+    """Just enough of a discord bot to run the Reddit cog"""
+
+    def __init__(self, pool, subscription_index, channels):
+        self.loop = asyncio.get_event_loop()
+        self.pool = pool
+        self.channels = channels
+        self.session = aiohttp.ClientSession()
+        self.delivery = delivery.Dispatcher(self)
+        self.write_behind = writebehind.WriteBehind(self)
+        self.closed = False
+
+        self.subscriptions = subscription_index
+
+    async def wait_until_ready(self):
+        pass
+
+    def is_closed(self):
+        return self.closed
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_guild(self, guild_id):
+        return self.channels.get(guild_id)
+
+
+async def run(count, args):
+    fake_reddit = FakeReddit(count, args.busy_fraction, args.busy_rate, args.quiet_rate,
+                             args.latency, args.error_rate, args.slow_fraction, args.slow_latency)
+    runner = web.AppRunner(fake_reddit.app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    config.reddit_api_url = f"http://127.0.0.1:{port}"
+
+    pool = await seed_database(fake_reddit, args.guilds_per_subreddit)
+    subscription_index = subscriptions.SubscriptionIndex()
+    await subscription_index.load(pool)
+    # every fake channel is the guild of its own subscription, so both share the id
+    channels = {guild_id: FakeChannel(guild_id) for guild_id in subscription_index.channels}
+    bot = FakeBot(pool, subscription_index, channels)
+    reddit.reddit_poll_seconds.values.clear()
+    reddit.reddit_poll_delay_seconds.values.clear()
+
+    cog = reddit.Reddit(bot)
+    await asyncio.sleep(args.duration)
+    bot.closed = True
+    cog.reddit_poller.cancel()
+    await bot.delivery.close(timeout=60.0)
+    await bot.write_behind.close()
+    end = time.time()
+
+    # posts older than the grace period should have been announced by now
+    deadline = end - args.grace
+    announced = {url for channel in channels.values() for url in channel.sent}
+    expected = [post for post in fake_reddit.all_posts() if post["created_utc"] <= deadline]
+    missed = sum(1 for post in expected if "https://www.reddit.com" + post["permalink"] not in announced)
+
+    polls = reddit.reddit_poll_seconds.values.get((), [0, 0])
+    poll_count = polls[-1]
+    delays = reddit.reddit_poll_delay_seconds.values.get((), [0, 0])
+
+    await bot.session.close()
+    await runner.cleanup()
+    await pool.close()
+
+    return {"subreddits": count,
+            "polls": poll_count,
+            "poll_time": polls[-2] / poll_count if poll_count > 0 else 0.0,
+            "delay": delays[-2] / delays[-1] if delays[-1] > 0 else 0.0,
+            "requests": fake_reddit.requests,
+            "errors": fake_reddit.errors,
+            "posts": len(expected),
+            "missed": missed,
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subreddits", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run the poller for")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the fake server takes per request")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="fraction of requests answered with a 503")
+    parser.add_argument("--slow-fraction", type=float, default=0.0,
+                        help="fraction of subreddits whose listings answer after --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=30.0, help="seconds the slow listings take")
+    parser.add_argument("--busy-fraction", type=float, default=0.1, help="fraction of busy subreddits")
+    parser.add_argument("--busy-rate", type=float, default=1 / 60, help="posts per second of busy subreddits")
+    parser.add_argument("--quiet-rate", type=float, default=1 / 86400, help="posts per second of quiet subreddits")
+    parser.add_argument("--guilds-per-subreddit", type=int, default=1)
+    parser.add_argument("--grace", type=float, default=30.0,
+                        help="posts created longer ago than this at the end of the run count as missed")
+    args = parser.parse_args()
+
+    print(f"{'subreddits':>10} {'polls':>7} {'poll s':>8} {'delay s':>8} {'requests':>9} "
+          f"{'errors':>7} {'posts':>6} {'missed':>7} {'rss MB':>7}")
+    for count in args.subreddits:
+        result = asyncio.run(run(count, args))
+        print(f"{result['subreddits']:>10} {result['polls']:>7} {result['poll_time']:>8.2f} "
+              f"{result['delay']:>8.2f} {result['requests']:>9} {result['errors']:>7} "
+              f"{result['posts']:>6} {result['missed']:>7} {result['max_rss_mb']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# tunables for the bot, secrets belong into auth_token.py
+
+# reddit poller
+# base url of the reddit api, can be pointed at a local server for benchmarks
+reddit_api_url = "https://www.reddit.com"
+# number of subreddit fetches that may run at the same time
+reddit_poll_workers = 16
+# maximum number of concurrent requests against a single host
+reddit_per_host_limit = 8
+# number of subreddits fetched together through one combined /r/a+b+c listing
+reddit_group_size = 25
+# subreddits due within this many seconds of each other are polled in the same group
+reddit_group_window = 1.0
+# page size of the combined listings, reddit allows at most 100
+reddit_listing_limit = 100
+# page size used when catching up on a single subreddit
+reddit_catchup_page_size = 25
+# maximum number of pages fetched when catching up after a burst of posts
+reddit_catchup_max_pages = 4
+# bounds of the per subreddit poll interval in seconds
+reddit_min_interval = 10.0
+reddit_max_interval = 600.0
+# poll interval as a fraction of the expected time between two posts
+reddit_interval_factor = 0.25
+# number of recent post times kept to estimate the post rate of a subreddit
+reddit_rate_history = 10
+# post times older than this many seconds are not used for the rate estimate
+reddit_rate_window = 24 * 60 * 60
+# fraction of the rate limit budget below which polling slows down
+reddit_budget_low = 0.25
+# maximum factor poll intervals get stretched by when the budget is low
+reddit_max_slowdown = 8.0
+# seconds a single request to reddit may take before it is given up and retried
+reddit_request_timeout = 10.0
+# retries and exponential backoff in seconds on 429 and 5xx responses
+reddit_max_retries = 3
+reddit_backoff_base = 1.0
+reddit_backoff_max = 60.0
+# seconds subreddit metadata is kept in memory
+reddit_cache_ttl = 60 * 60
+
+# discord delivery
+# number of messages that may be sent at the same time
+delivery_workers = 8
+# messages per second across all channels
+delivery_global_rate = 40
+# messages per channel within delivery_channel_per seconds
+delivery_channel_rate = 5
+delivery_channel_per = 5.0
+# seconds after which a single send is given up
+delivery_timeout = 15.0
+
+# guilds
+# seconds to collect guild removals for before deleting them in one go
+guild_removal_delay = 2.0
+
+# database
+# storage backend, "postgres" or "sqlite" for small deployments without a database server
+database = "postgres"
+postgres_database = "voiceoflightdb"
+sqlite_path = "voiceoflight.db"
+# seconds between writes of the buffered state updates
+write_behind_interval = 5.0
+# connections the pool keeps open and at most opens
+db_pool_min_size = 2
+db_pool_max_size = 10
+# seconds to wait for a free connection before giving up
+db_acquire_timeout = 30.0
+# seconds a single query may take
+db_command_timeout = 60
+# rows read at once when going through large tables
+db_page_size = 200
+
+# surrender@20
+# number of parsed post versions kept in memory
+post_cache_size = 32
+# seconds until a post is checked for edits again, as a fraction of the time since it was published or last edited
+surrenderat20_update_factor = 0.1
+surrenderat20_update_min_interval = 60.0
+surrenderat20_update_max_interval = 6 * 60 * 60
+# posts older than this many seconds are no longer checked for edits
+surrenderat20_update_cutoff = 14 * 24 * 60 * 60
@@ -0,0 +1,148 @@
+import asyncio
+import config
+import os
+import time
+
+from ext import metrics
+
+db_acquire_timeouts_total = metrics.Counter(
+    "vol_db_acquire_timeouts_total", "Connection acquires that gave up after config.db_acquire_timeout")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# subscriptions and keywords cascade from Guilds, channels and subreddits
+# that no other guild is subscribed to are removed in the same statement
+REMOVE_GUILDS = """
+WITH removed AS (
+    DELETE FROM Guilds WHERE ID=ANY($1::bigint[]) RETURNING ID
+), youtube AS (
+    DELETE FROM YoutubeChannels c
+    WHERE EXISTS (SELECT 1 FROM YoutubeSubscriptions s WHERE s.YoutubeChannel=c.ID AND s.Guild=ANY($1::bigint[]))
+    AND NOT EXISTS (SELECT 1 FROM YoutubeSubscriptions s WHERE s.YoutubeChannel=c.ID AND s.Guild<>ALL($1::bigint[]))
+    RETURNING ID
+), twitch AS (
+    DELETE FROM TwitchChannels c
+    WHERE EXISTS (SELECT 1 FROM TwitchSubscriptions s WHERE s.TwitchChannel=c.ID AND s.Guild=ANY($1::bigint[]))
+    AND NOT EXISTS (SELECT 1 FROM TwitchSubscriptions s WHERE s.TwitchChannel=c.ID AND s.Guild<>ALL($1::bigint[]))
+    RETURNING ID
+), reddit AS (
+    DELETE FROM Subreddits c
+    WHERE EXISTS (SELECT 1 FROM SubredditSubscriptions s WHERE s.Subreddit=c.ID AND s.Guild=ANY($1::bigint[]))
+    AND NOT EXISTS (SELECT 1 FROM SubredditSubscriptions s WHERE s.Subreddit=c.ID AND s.Guild<>ALL($1::bigint[]))
+    RETURNING ID
+)
+SELECT ARRAY(SELECT ID FROM removed), ARRAY(SELECT ID FROM reddit),
+       (SELECT count(*) FROM youtube), (SELECT count(*) FROM twitch)
+"""
+
+
+# connects to the storage backend selected in the config
+async def connect(loop):
+    if config.database == "sqlite":
+        from ext.sqlite import SqlitePool
+        return await SqlitePool.open(config.sqlite_path, loop)
+    import asyncpg
+    return Pool(await asyncpg.create_pool(
+        database=config.postgres_database, loop=loop, command_timeout=config.db_command_timeout,
+        min_size=config.db_pool_min_size, max_size=config.db_pool_max_size))
+
+
+# every storage backend offers acquire() handing out connections with the asyncpg query methods
+# and the few operations that can't be written in portable SQL, ext/sqlite.py has the other one
+class Pool:
+    """Postgres storage, wraps the asyncpg pool to record how it is used"""
+
+    migrations_dir = os.path.join(ROOT, "migrations")
+
+    def __init__(self, pool):
+        self.pool = pool
+        # connections handed out and acquires still waiting for one
+        self.in_use = 0
+        self.waiting = 0
+
+        metrics.Gauge("vol_db_connections_in_use", "Database connections currently handed out",
+                      lambda: self.in_use)
+        metrics.Gauge("vol_db_connections_idle", "Open database connections not handed out",
+                      lambda: self.pool.get_idle_size())
+        metrics.Gauge("vol_db_acquire_waiting", "Tasks waiting for a database connection",
+                      lambda: self.waiting)
+
+    # waits for a free connection at most config.db_acquire_timeout seconds
+    # requests are served in order by the asyncpg pool while they wait
+    def acquire(self):
+        return Acquire(self)
+
+    # query plan of a query as lines of text
+    async def explain(self, db, query, args):
+        rows = await db.fetch("EXPLAIN " + query, *args)
+        return [row[0] for row in rows]
+
+    # fills the temporary LiveGuilds (ID, Name) table, has to run inside a transaction
+    async def load_live_guilds(self, db, records):
+        await db.execute("CREATE TEMPORARY TABLE LiveGuilds (ID bigint PRIMARY KEY, Name text) ON COMMIT DROP")
+        await db.copy_records_to_table("liveguilds", records=records)
+
+    # delete the guilds and everything only they used
+    # returns the removed guild ids and the ids of the removed subreddits
+    async def remove_guilds(self, db, guild_ids):
+        row = await db.fetchrow(REMOVE_GUILDS, list(guild_ids))
+        return row[0], row[1]
+
+    async def close(self):
+        await self.pool.close()
+
+    def terminate(self):
+        self.pool.terminate()
+
+
+class Acquire:
+    """Context manager handing out a pool connection"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection = None
+
+    async def __aenter__(self):
+        start = time.monotonic()
+        self.pool.waiting += 1
+        try:
+            self.connection = await self.pool.pool.acquire(timeout=config.db_acquire_timeout)
+        except asyncio.TimeoutError:
+            db_acquire_timeouts_total.inc()
+            raise
+        finally:
+            self.pool.waiting -= 1
+            metrics.db_acquire_seconds.observe(time.monotonic() - start)
+        self.pool.in_use += 1
+        return self.connection
+
+    async def __aexit__(self, *exc):
+        self.pool.in_use -= 1
+        await self.pool.pool.release(self.connection)
+
+
+async def fetch_page(pool, query, after, size):
+    async with pool.acquire() as db:
+        return await query.fetch(db, after, size)
+
+
+# streams the rows of a large table page by page, the next page is read while the current one is processed
+# the named query has to select the key it is ordered by first and take the last key as $1 and the page size as $2
+# unlike a server side cursor no connection is held while the caller works through the rows
+async def stream(pool, query, first_key):
+    size = config.db_page_size
+    page = await fetch_page(pool, query, first_key, size)
+    next_page = None
+    try:
+        while len(page) > 0:
+            if len(page) == size:
+                next_page = asyncio.ensure_future(fetch_page(pool, query, page[-1][0], size))
+            for row in page:
+                yield row
+            if next_page is None:
+                break
+            page = await next_page
+            next_page = None
+    finally:
+        if next_page is not None:
+            next_page.cancel()
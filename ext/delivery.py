@@ -0,0 +1,164 @@
+import discord
+
+import asyncio
+import config
+import itertools
+import sys
+import time
+import traceback
+from ext import metrics
+
+# priority lanes, lower lanes are delivered first
+LIVE = 0
+VIDEO = 1
+SURRENDERAT20 = 2
+REDDIT = 3
+ANNOUNCEMENT = 4
+LANES = {LIVE: "live", VIDEO: "video", SURRENDERAT20: "surrenderat20", REDDIT: "reddit",
+         ANNOUNCEMENT: "announcement"}
+
+delivery_latency_seconds = metrics.Histogram(
+    "vol_delivery_latency_seconds", "Time from queueing a notification until it is sent", ("lane",))
+discord_send_seconds = metrics.Histogram(
+    "vol_discord_send_seconds", "Latency of sending a message to discord")
+discord_send_failures_total = metrics.Counter(
+    "vol_discord_send_failures_total", "Messages that could not be sent", ("reason",))
+
+
+class Bucket:
+    """Token bucket allowing rate sends every per seconds"""
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    # takes a token if one is available
+    # otherwise returns the seconds until the next token is available
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens +
+                          (now - self.updated) * self.rate / self.per)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) * self.per / self.rate
+
+
+class Dispatcher:
+    """Delivers the notifications of all sources to discord channels"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.queue = asyncio.PriorityQueue()
+        # keeps the order of messages within a lane
+        self.counter = itertools.count()
+        self.global_bucket = Bucket(config.delivery_global_rate, 1.0)
+        self.channel_buckets = {}
+        # number of messages that are delayed by their channel's bucket
+        self.delayed = 0
+        # futures of the messages not sent yet, resolved with None on close
+        self.outstanding = set()
+        self.closed = False
+
+        self.workers = [self.bot.loop.create_task(self.worker())
+                        for _ in range(config.delivery_workers)]
+
+    # queue a message, the returned future resolves to the sent message or None if sending failed
+    def send(self, channel, content=None, embed=None, priority=REDDIT):
+        future = self.bot.loop.create_future()
+        if self.closed:
+            future.set_result(None)
+            return future
+        self.outstanding.add(future)
+        future.add_done_callback(self.outstanding.discard)
+        self.queue.put_nowait(
+            (priority, next(self.counter), time.monotonic(), channel, content, embed, future))
+        return future
+
+    def requeue(self, item):
+        self.delayed -= 1
+        self.queue.put_nowait(item)
+
+    async def worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                await self.deliver(item)
+            except Exception as ex:
+                # the worker has to survive any item, the message counts as not sent
+                discord_send_failures_total.inc("error")
+                print('Ignoring exception in Dispatcher.worker()', file=sys.stderr)
+                traceback.print_exception(
+                    type(ex), ex, ex.__traceback__, file=sys.stderr)
+                future = item[-1]
+                if not future.done():
+                    future.set_result(None)
+            finally:
+                self.queue.task_done()
+
+    async def deliver(self, item):
+        priority, _, queued, channel, content, embed, future = item
+
+        # a channel that is over its limit must not hold up a worker
+        bucket = self.channel_buckets.get(channel.id)
+        if bucket is None:
+            bucket = Bucket(config.delivery_channel_rate, config.delivery_channel_per)
+            self.channel_buckets[channel.id] = bucket
+        delay = bucket.take()
+        if delay > 0:
+            self.delayed += 1
+            self.bot.loop.call_later(delay, self.requeue, item)
+            return
+
+        delay = self.global_bucket.take()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.global_bucket.take()
+
+        start = time.monotonic()
+        try:
+            message = await asyncio.wait_for(channel.send(content, embed=embed), config.delivery_timeout)
+        except discord.errors.Forbidden:
+            message = None
+            discord_send_failures_total.inc("forbidden")
+        except asyncio.TimeoutError:
+            message = None
+            discord_send_failures_total.inc("timeout")
+        except Exception as ex:
+            message = None
+            discord_send_failures_total.inc("error")
+            print(f'Ignoring exception in Dispatcher.deliver() for channel {channel.id} in guild {channel.guild.id}',
+                  file=sys.stderr)
+            traceback.print_exception(
+                type(ex), ex, ex.__traceback__, file=sys.stderr)
+
+        now = time.monotonic()
+        discord_send_seconds.observe(now - start)
+        delivery_latency_seconds.observe(now - queued, LANES[priority])
+
+        if not future.done():
+            future.set_result(message)
+
+    async def drain(self):
+        while True:
+            await self.queue.join()
+            if self.delayed == 0:
+                return
+            await asyncio.sleep(0.1)
+
+    # wait for the queued messages to be sent and stop the workers
+    # messages that did not make it in time resolve to None like failed sends
+    async def close(self, timeout=10.0):
+        self.closed = True
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for worker in self.workers:
+            worker.cancel()
+        for future in list(self.outstanding):
+            if not future.done():
+                future.set_result(None)
@@ -0,0 +1,62 @@
+import asyncio
+import config
+import sys
+import traceback
+
+
+# drop removed guilds and subreddits from the in-memory state
+def forget(bot, guild_ids, subreddit_ids):
+    for guild_id in guild_ids:
+        bot.subscriptions.remove_guild(guild_id)
+    reddit = bot.get_cog("Reddit")
+    if reddit is not None:
+        for subreddit_id in subreddit_ids:
+            reddit.untrack(subreddit_id)
+
+
+class GuildRemover:
+    """Collects the guilds the bot left and removes them in batches"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        # guild id -> name of the guilds waiting to be removed
+        self.pending = {}
+        self.flusher = None
+
+    def remove(self, guild):
+        self.pending[guild.id] = guild.name
+        if self.flusher is None:
+            self.flusher = self.bot.loop.create_task(self.flush_later())
+
+    # the guild was joined again before its removal ran
+    def cancel(self, guild_id):
+        self.pending.pop(guild_id, None)
+
+    async def flush_later(self):
+        await asyncio.sleep(config.guild_removal_delay)
+        self.flusher = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        if len(pending) == 0:
+            return
+        try:
+            async with self.bot.pool.acquire() as db:
+                guild_ids, subreddit_ids = await self.bot.pool.remove_guilds(db, pending.keys())
+        except Exception as ex:
+            print('Ignoring exception in GuildRemover.flush()', file=sys.stderr)
+            traceback.print_exception(
+                type(ex), ex, ex.__traceback__, file=sys.stderr)
+            return
+
+        forget(self.bot, guild_ids, subreddit_ids)
+        for name in pending.values():
+            print(f"<< Left {name}")
+
+    # remove what is still pending right away, used on shutdown
+    async def close(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        await self.flush()
@@ -0,0 +1,152 @@
+import bisect
+from collections import deque, namedtuple
+
+# a keyword mentioned in a post, the stripped paragraphs it appears in and how often it appears
+KeywordHit = namedtuple("KeywordHit", "keyword paragraphs count")
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton finding the keywords of all guilds in a single pass over a post"""
+
+    def __init__(self):
+        # keyword -> ids of the guilds that added it
+        self.guilds = {}
+        # the trie, node 0 is the root
+        # goto: char -> next node, keyword: the keyword ending in the node if it is still used
+        self.goto = [{}]
+        self.keyword = [None]
+        # failure link and nearest node on the failure chain that ends a keyword, built on demand
+        self.fail = [0]
+        self.output = [0]
+        self.dirty = False
+
+    # keywords only match as whole words, like " keyword " in the lowercase text
+    @staticmethod
+    def pattern(keyword):
+        return " " + keyword + " "
+
+    def add(self, keyword, guild_id):
+        guilds = self.guilds.setdefault(keyword, set())
+        guilds.add(guild_id)
+        if len(guilds) > 1:
+            return
+        node = 0
+        for char in self.pattern(keyword):
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.keyword.append(None)
+                self.fail.append(0)
+                self.output.append(0)
+            node = next_node
+        self.keyword[node] = keyword
+        self.dirty = True
+
+    # the nodes of removed keywords stay in the trie, they just stop matching
+    def remove(self, keyword, guild_id):
+        guilds = self.guilds.get(keyword)
+        if guilds is None:
+            return
+        guilds.discard(guild_id)
+        if len(guilds) > 0:
+            return
+        del self.guilds[keyword]
+        node = 0
+        for char in self.pattern(keyword):
+            node = self.goto[node][char]
+        self.keyword[node] = None
+        self.dirty = True
+
+    def remove_guild(self, guild_id):
+        for keyword in [keyword for keyword, guilds in self.guilds.items() if guild_id in guilds]:
+            self.remove(keyword, guild_id)
+
+    # failure and output links of all nodes, breadth first so the links of shorter prefixes are done first
+    def build(self):
+        queue = deque()
+        for node in self.goto[0].values():
+            self.fail[node] = 0
+            self.output[node] = 0
+            queue.append(node)
+        while len(queue) > 0:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                fail = self.fail[node]
+                while fail != 0 and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[child] = fail
+                self.output[child] = fail if self.keyword[fail] is not None else self.output[fail]
+                queue.append(child)
+        self.dirty = False
+
+    # keyword -> start positions of all its matches in the text
+    def find(self, text):
+        if self.dirty:
+            self.build()
+        goto = self.goto
+        fail = self.fail
+        keyword = self.keyword
+        output = self.output
+        matches = {}
+        node = 0
+        for end, char in enumerate(text):
+            while node != 0 and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if keyword[node] is not None else output[node]
+            while match != 0:
+                found = keyword[match]
+                matches.setdefault(found, []).append(end - len(found) - 1)
+                match = output[match]
+        return matches
+
+    # every keyword mentioned in a parsed post, in the order of their first mention
+    # the paragraphs of a hit are the lines it appears in, or with blocks the parts between blank lines
+    def search(self, document, blocks=False):
+        matches = self.find(document.lowered)
+        if len(matches) == 0:
+            return []
+        if blocks:
+            starts = document.block_starts
+            ends = document.block_ends
+            paragraphs = document.blocks
+        else:
+            starts = document.starts
+            ends = document.ends
+            paragraphs = document.paragraphs
+
+        hits = []
+        for found, positions in sorted(matches.items(), key=lambda item: item[1][0]):
+            length = len(self.pattern(found))
+            indices = []
+            count = 0
+            last_end = 0
+            for start in positions:
+                # matches are counted without overlaps like str.count
+                if start >= last_end:
+                    count += 1
+                    last_end = start + length
+                index = bisect.bisect_right(starts, start) - 1
+                if start + length <= ends[index] and (len(indices) == 0 or indices[-1] != index):
+                    indices.append(index)
+            hits.append(KeywordHit(found, [paragraphs[index].strip() for index in indices], count))
+        return hits
+
+    # guild id -> hits of the keywords the guild added
+    def by_guild(self, hits):
+        guild_hits = {}
+        for hit in hits:
+            for guild_id in self.guilds.get(hit.keyword, ()):
+                guild_hits.setdefault(guild_id, []).append(hit)
+        return guild_hits
+
+
+# name and value of the embed field announcing a keyword mention
+def mention_field(hit):
+    extracts = "\n\n".join(hit.paragraphs)
+    if len(extracts) > 950:
+        extracts = extracts[:950] + "... `" + str(hit.count) + "` mentions in total"
+    return f"'{hit.keyword}' was mentioned in this post!", extracts
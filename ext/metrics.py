@@ -0,0 +1,135 @@
+import bisect
+import functools
+import time
+
+# every metric registers itself here to be rendered on /metrics
+registry = []
+
+# default histogram buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                          for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonically increasing value"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """Value that is read from a function whenever the metrics are rendered"""
+
+    def __init__(self, name, documentation, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.function()
+        except Exception:
+            return lines
+        if value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Histogram:
+    """Distribution of observed values, mostly durations in seconds"""
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self.values = {}
+        registry.append(self)
+
+    def observe(self, value, *labels):
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 2)
+            self.values[labels] = counts
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            counts[index] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(self.labels, labels, [('le', '+Inf')])} {counts[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {counts[-2]}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {counts[-1]}")
+        return lines
+
+
+class Timer:
+    """Context manager observing the time spent inside it"""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.start, *self.labels)
+
+
+# decorator recording the runtime of a coroutine function
+def timed(histogram, *labels):
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(*labels):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# text exposition format of all metrics
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# metrics shared by multiple modules
+scheduler_job_seconds = Histogram("vol_scheduler_job_seconds", "Runtime of APScheduler jobs", ("job",))
+db_acquire_seconds = Histogram("vol_db_acquire_seconds", "Time spent waiting for a database connection")
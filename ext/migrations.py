@@ -0,0 +1,78 @@
+import os
+import re
+import time
+
+# queries on the notification hot paths, their plans get compared when migrations are applied
+HOT_QUERIES = [
+    ("youtube fan-out", "SELECT Guilds.YoutubeNotifChannel, YoutubeSubscriptions.OnlyStreams, Guilds.ID \
+                         FROM YoutubeSubscriptions INNER JOIN Guilds \
+                         ON YoutubeSubscriptions.Guild=Guilds.ID \
+                         WHERE YoutubeChannel=$1", ("",)),
+    ("twitch fan-out", "SELECT Guilds.TwitchNotifChannel \
+                        FROM TwitchSubscriptions INNER JOIN Guilds \
+                        ON TwitchSubscriptions.Guild=Guilds.ID \
+                        WHERE TwitchChannel=$1", ("",)),
+    ("reddit fan-out", "SELECT Guilds.RedditNotifChannel, Guilds.ID \
+                        FROM SubredditSubscriptions INNER JOIN Guilds \
+                        ON SubredditSubscriptions.Guild=Guilds.ID \
+                        WHERE Subreddit=$1", ("",)),
+    ("guild channels", "SELECT SurrenderAt20NotifChannel FROM Guilds WHERE ID=$1", (0,)),
+    ("guild keywords", "SELECT Keyword FROM Keywords WHERE Guild=$1", (0,)),
+    ("subreddit by name", "SELECT ID, Name, Over18, Icon, Description FROM Subreddits WHERE lower(Name)=$1", ("",)),
+]
+
+
+# numbered migration files of a storage backend, sorted by their number
+def load_migrations(directory):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = re.match(r"(\d+)_(.+)\.sql$", filename)
+        if match is None:
+            continue
+        with open(os.path.join(directory, filename)) as file:
+            migrations.append((int(match.group(1)), match.group(2), file.read()))
+    migrations.sort()
+    return migrations
+
+
+async def query_plans(pool, db):
+    plans = {}
+    for name, query, args in HOT_QUERIES:
+        try:
+            plans[name] = await pool.explain(db, query, args)
+        except Exception as ex:
+            plans[name] = [f"could not explain: {ex}"]
+    return plans
+
+
+# apply all migrations that are not yet recorded in the database
+async def migrate(pool):
+    async with pool.acquire() as db:
+        await db.execute("CREATE TABLE IF NOT EXISTS SchemaMigrations \
+                          (Version integer PRIMARY KEY, Name text, AppliedAt timestamp DEFAULT CURRENT_TIMESTAMP)")
+        applied = {row[0] for row in await db.fetch("SELECT Version FROM SchemaMigrations")}
+        pending = [migration for migration in load_migrations(pool.migrations_dir) if migration[0] not in applied]
+        if len(pending) == 0:
+            return
+
+        before = await query_plans(pool, db)
+
+        for version, name, sql in pending:
+            start = time.monotonic()
+            async with db.transaction():
+                await db.execute(sql)
+                await db.execute("INSERT INTO SchemaMigrations (Version, Name) VALUES ($1, $2)", version, name)
+            print(f"Applied migration {version:03d} {name} in {time.monotonic() - start:.2f}s")
+
+        after = await query_plans(pool, db)
+
+    # report how the plans of the hot queries changed
+    for name, _, _ in HOT_QUERIES:
+        if before[name] == after[name]:
+            print(f"Query plan of {name} unchanged: {before[name][0]}")
+            continue
+        print(f"Query plan of {name} changed:")
+        for line in before[name]:
+            print("  - " + line)
+        for line in after[name]:
+            print("  + " + line)
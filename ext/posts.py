@@ -0,0 +1,160 @@
+import datetime
+import html
+import re
+from collections import OrderedDict, namedtuple
+
+import config
+
+# tags that start a new line of text
+LINE_TAGS = {"br", "p", "div", "li", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "tr"}
+# tags whose content isn't text of the post
+SKIPPED_TAGS = {"script", "style"}
+
+# the attributes of a tag, quoted values may contain ">"
+ATTRIBUTES = r"[^>\"']*(?:(?:\"[^\"]*\"|'[^']*')[^>\"']*)*"
+# a comment, a declaration or a start or end tag
+TOKEN = re.compile(r"<!--.*?(?:-->|$)|<[!?][^>]*>|<(/?)([a-zA-Z][^\s/>]*)(" + ATTRIBUTES + ")>", re.S)
+# all tags that neither break lines, hold images or links nor skip content,
+# removed in one go before the remaining tags are walked
+IGNORED = re.compile(r"</?(?!(?:br|p|div|li|h[1-6]|blockquote|tr|img|a|script|style)[\s/>])[a-zA-Z][^\s/>]*"
+                     + ATTRIBUTES + ">", re.I)
+ATTRIBUTE = re.compile(r"([^\s/>\"'=]+)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+)))?")
+# the end of the content of a skipped tag
+SKIPPED_END = {tag: re.compile(rf"</{tag}\s*>", re.I) for tag in SKIPPED_TAGS}
+
+
+# a surrender@20 post turned into text once per version
+# paragraphs are the lines of the text, blocks the parts between blank lines
+# starts and ends are their offsets in the lowercase text
+class PostDocument(namedtuple("PostDocument", "text lowered paragraphs starts ends blocks block_starts block_ends "
+                                              "images links note")):
+    """Text, images and links of a parsed post"""
+
+    __slots__ = ()
+
+    @property
+    def image(self):
+        if len(self.images) == 0:
+            return None
+        return self.images[0]
+
+
+# decoded value of an attribute in the attribute text of a tag, None if the tag doesn't have it
+def attribute(attrs, name):
+    for match in ATTRIBUTE.finditer(attrs):
+        if match.group(1).lower() == name:
+            value = next((value for value in match.groups()[1:] if value is not None), "")
+            return html.unescape(value)
+    return None
+
+
+# the decoded text, images and links of blogger content in a single pass over its tags
+def extract(content):
+    chunks = []
+    images = []
+    links = []
+    # whether the text so far ends with a line break, so block tags don't add empty lines
+    line_start = True
+    position = 0
+    content = IGNORED.sub("", content)
+    search = TOKEN.search
+    while True:
+        match = search(content, position)
+        end = len(content) if match is None else match.start()
+        if end > position:
+            data = content[position:end]
+            chunks.append(data)
+            line_start = data.endswith("\n")
+        if match is None:
+            break
+        position = match.end()
+
+        name = match.group(2)
+        if name is None:
+            continue
+        tag = name.lower()
+        if match.group(1):
+            if tag in LINE_TAGS and tag != "br" and not line_start:
+                chunks.append("\n")
+                line_start = True
+        elif tag == "br":
+            chunks.append("\n")
+            line_start = True
+        elif tag in LINE_TAGS:
+            if not line_start:
+                chunks.append("\n")
+                line_start = True
+        elif tag == "img":
+            src = attribute(match.group(3), "src")
+            if src:
+                images.append(src)
+        elif tag == "a":
+            href = attribute(match.group(3), "href")
+            if href:
+                links.append(href)
+        elif tag in SKIPPED_TAGS and not match.group(3).endswith("/"):
+            skipped = SKIPPED_END[tag].search(content, position)
+            position = len(content) if skipped is None else skipped.end()
+    # entities are decoded once the tags are out of the way
+    # non-breaking spaces separate words like normal ones
+    text = html.unescape("".join(chunks)).replace("\xa0", " ")
+    return text, images, links
+
+
+# the parts of the text between separators with their offsets in the lowercase text
+# lower() keeps the separators in place, so the offsets line up with the parts of the text
+def split(text, lowered, separator):
+    starts = []
+    ends = []
+    position = 0
+    for part in lowered.split(separator):
+        starts.append(position)
+        position += len(part)
+        ends.append(position)
+        position += len(separator)
+    return tuple(text.split(separator)), tuple(starts), tuple(ends)
+
+
+def parse(content):
+    text, images, links = extract(content)
+    lowered = text.lower()
+    paragraphs, starts, ends = split(text, lowered, "\n")
+    blocks, block_starts, block_ends = split(text, lowered, "\n\n")
+
+    # the note in brackets at the top of the post
+    firstpart = " ".join(paragraphs[0:5])
+    note = firstpart[firstpart.find("["):firstpart.rfind("]") + 1]
+
+    return PostDocument(text, lowered, paragraphs, starts, ends, blocks, block_starts, block_ends,
+                        tuple(images), tuple(links), note)
+
+
+# update time of a post as epoch seconds
+# superfeedr sends it as a number, the blogger api as RFC 3339 text with the offset of the blog
+def timestamp(updated):
+    if isinstance(updated, str):
+        return int(datetime.datetime.fromisoformat(updated.replace("Z", "+00:00")).timestamp())
+    return int(updated)
+
+
+class PostCache:
+    """Parsed posts by post id and update time, the least recently used are dropped first"""
+
+    def __init__(self, size=None):
+        self.size = size or config.post_cache_size
+        self.documents = OrderedDict()
+
+    # the webhook and the blogger api give the update time in different forms, both are keyed by its timestamp
+    def get(self, post_id, updated, content=None):
+        key = (post_id, timestamp(updated))
+        document = self.documents.get(key)
+        if document is not None:
+            self.documents.move_to_end(key)
+            return document
+        if content is None:
+            return None
+        document = parse(content)
+        self.documents[key] = document
+        if len(self.documents) > self.size:
+            self.documents.popitem(last=False)
+        return document
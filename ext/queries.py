@@ -0,0 +1,204 @@
+import time
+from collections import namedtuple
+
+from ext import metrics
+from ext import subscriptions
+
+query_seconds = metrics.Histogram(
+    "vol_query_seconds", "Runtime of the named queries", ("query",))
+query_errors_total = metrics.Counter(
+    "vol_query_errors_total", "Named queries that raised", ("query",))
+
+# every named query, by name
+registry = {}
+
+# row types
+GuildChannels = namedtuple("GuildChannels", "surrenderat20 twitch youtube reddit")
+SurrenderAt20Categories = namedtuple("SurrenderAt20Categories", "redposts pbe rotations esports releases other")
+SubredditInfo = namedtuple("SubredditInfo", "id name over18 icon description")
+YoutubeVideoStats = namedtuple("YoutubeVideoStats", "last_video_id video_count")
+
+
+class Query:
+    """Named SQL statement that is timed on every call"""
+
+    def __init__(self, name, sql, row=None):
+        self.name = name
+        self.sql = sql
+        # named tuple the rows are returned as
+        self.row = row
+        registry[name] = self
+
+    async def run(self, db, method, args):
+        start = time.monotonic()
+        try:
+            # asyncpg prepares and caches the statements of each connection itself, sqlite does the same
+            return await getattr(db, method)(self.sql, *args)
+        except Exception:
+            query_errors_total.inc(self.name)
+            raise
+        finally:
+            query_seconds.observe(time.monotonic() - start, self.name)
+
+    async def fetch(self, db, *args):
+        rows = await self.run(db, "fetch", args)
+        if self.row is None:
+            return rows
+        return [self.row._make(row) for row in rows]
+
+    async def fetchrow(self, db, *args):
+        row = await self.run(db, "fetchrow", args)
+        if row is None or self.row is None:
+            return row
+        return self.row._make(row)
+
+    async def fetchval(self, db, *args):
+        return await self.run(db, "fetchval", args)
+
+    async def execute(self, db, *args):
+        await self.run(db, "execute", args)
+
+    # runs the statement once for every argument tuple, timed as a single call
+    async def executemany(self, db, args):
+        await self.run(db, "executemany", (args,))
+
+    # iterates over the rows through a cursor, only the time spent waiting for rows is recorded
+    async def cursor(self, db, *args, prefetch=50):
+        rows = db.cursor(self.sql, *args, prefetch=prefetch).__aiter__()
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.monotonic()
+                try:
+                    row = await rows.__anext__()
+                except StopAsyncIteration:
+                    break
+                except Exception:
+                    query_errors_total.inc(self.name)
+                    raise
+                finally:
+                    elapsed += time.monotonic() - start
+                yield row if self.row is None else self.row._make(row)
+        finally:
+            query_seconds.observe(elapsed, self.name)
+
+
+# calls, mean and total runtime of every named query that ran, slowest in total first
+def report():
+    stats = []
+    for labels, counts in query_seconds.values.items():
+        total, calls = counts[-2], counts[-1]
+        stats.append((total, calls, labels[0]))
+    stats.sort(reverse=True)
+    return [f"{name}: {calls} calls, {total / calls * 1000:.1f}ms mean, {total:.2f}s total"
+            for total, calls, name in stats]
+
+
+# guilds
+ALL_GUILD_CHANNELS = Query("all guild channels", "SELECT ID, SurrenderAt20NotifChannel, TwitchNotifChannel, YoutubeNotifChannel, RedditNotifChannel \
+                                                  FROM Guilds")
+GUILD_CHANNELS = Query("guild channels", "SELECT SurrenderAt20NotifChannel, TwitchNotifChannel, YoutubeNotifChannel, RedditNotifChannel \
+                                          FROM Guilds WHERE ID=$1", GuildChannels)
+SET_CHANNEL = {
+    subscriptions.SURRENDERAT20: Query("set surrenderat20 channel", "UPDATE Guilds SET SurrenderAt20NotifChannel=$1 WHERE ID=$2"),
+    subscriptions.TWITCH: Query("set twitch channel", "UPDATE Guilds SET TwitchNotifChannel=$1 WHERE ID=$2"),
+    subscriptions.YOUTUBE: Query("set youtube channel", "UPDATE Guilds SET YoutubeNotifChannel=$1 WHERE ID=$2"),
+    subscriptions.REDDIT: Query("set reddit channel", "UPDATE Guilds SET RedditNotifChannel=$1 WHERE ID=$2"),
+}
+SET_ALL_CHANNELS = Query("set all channels", "UPDATE Guilds SET SurrenderAt20NotifChannel=$1, TwitchNotifChannel=$1, \
+                                              YoutubeNotifChannel=$1, RedditNotifChannel=$1 WHERE ID=$2")
+ADD_GUILD = Query("add guild", "INSERT INTO Guilds (ID, Name) VALUES ($1, $2) ON CONFLICT (ID) DO UPDATE SET Name=$2")
+# reconciling with the guilds the bot is on, both need the LiveGuilds table of load_live_guilds
+ADD_LIVE_GUILDS = Query("add live guilds", "INSERT INTO Guilds (ID, Name) SELECT ID, Name FROM LiveGuilds WHERE true \
+                                            ON CONFLICT (ID) DO NOTHING RETURNING ID, Name")
+LEFT_GUILDS = Query("left guilds", "SELECT ID, Name FROM Guilds WHERE ID NOT IN (SELECT ID FROM LiveGuilds)")
+
+# youtube
+ADD_YOUTUBE_CHANNEL = Query("add youtube channel", "INSERT INTO YoutubeChannels (ID, Name, LastLive, LastVideoID, VideoCount) \
+                                                    VALUES ($1, $2, $3, $4, $5) ON CONFLICT (ID) DO NOTHING")
+YOUTUBE_SUBSCRIBE = Query("youtube subscribe", "INSERT INTO YoutubeSubscriptions (YoutubeChannel, Guild, OnlyStreams) VALUES ($1, $2, $3) \
+                                                ON CONFLICT DO NOTHING RETURNING 1")
+YOUTUBE_UNSUBSCRIBE = Query("youtube unsubscribe", "DELETE FROM YoutubeSubscriptions WHERE YoutubeChannel=$1 AND Guild=$2 RETURNING 1")
+# the channel is only removed once no guild is subscribed to it anymore
+REMOVE_YOUTUBE_CHANNEL = Query("remove youtube channel", "DELETE FROM YoutubeChannels WHERE ID=$1 \
+                                                          AND NOT EXISTS (SELECT 1 FROM YoutubeSubscriptions WHERE YoutubeChannel=$1)")
+YOUTUBE_SUBSCRIPTIONS = Query("youtube subscriptions", "SELECT YoutubeChannels.Name, YoutubeSubscriptions.OnlyStreams \
+                                                        FROM YoutubeSubscriptions INNER JOIN YoutubeChannels \
+                                                        ON YoutubeSubscriptions.YoutubeChannel=YoutubeChannels.ID \
+                                                        WHERE Guild=$1")
+ALL_YOUTUBE_SUBSCRIPTIONS = Query("all youtube subscriptions", "SELECT YoutubeChannel, Guild, OnlyStreams FROM YoutubeSubscriptions")
+YOUTUBE_CHANNEL_IDS = Query("youtube channel ids", "SELECT DISTINCT YoutubeChannel FROM YoutubeSubscriptions")
+YOUTUBE_LAST_LIVE = Query("youtube last live", "SELECT LastLive FROM YoutubeChannels WHERE ID=$1")
+YOUTUBE_VIDEO_STATS = Query("youtube video stats", "SELECT LastVideoID, VideoCount FROM YoutubeChannels WHERE ID=$1",
+                            YoutubeVideoStats)
+# state updates written in batches through the write-behind buffer, see ext/writebehind.py
+SET_YOUTUBE_LAST_LIVE = Query("set youtube last live", "UPDATE YoutubeChannels SET LastLive=$1 WHERE ID=$2")
+SET_YOUTUBE_LAST_VIDEO = Query("set youtube last video", "UPDATE YoutubeChannels SET LastVideoID=$1, VideoCount=$2 WHERE ID=$3")
+SET_YOUTUBE_VIDEO_COUNT = Query("set youtube video count", "UPDATE YoutubeChannels SET VideoCount=$1 WHERE ID=$2")
+
+# twitch
+ADD_TWITCH_CHANNEL = Query("add twitch channel", "INSERT INTO TwitchChannels (ID, Name, LastLive) VALUES ($1, $2, $3) \
+                                                  ON CONFLICT (ID) DO NOTHING")
+TWITCH_SUBSCRIBE = Query("twitch subscribe", "INSERT INTO TwitchSubscriptions (TwitchChannel, Guild) VALUES ($1, $2) \
+                                              ON CONFLICT DO NOTHING RETURNING 1")
+TWITCH_UNSUBSCRIBE = Query("twitch unsubscribe", "DELETE FROM TwitchSubscriptions WHERE TwitchChannel=$1 AND Guild=$2 RETURNING 1")
+REMOVE_TWITCH_CHANNEL = Query("remove twitch channel", "DELETE FROM TwitchChannels WHERE ID=$1 \
+                                                        AND NOT EXISTS (SELECT 1 FROM TwitchSubscriptions WHERE TwitchChannel=$1)")
+TWITCH_SUBSCRIPTIONS = Query("twitch subscriptions", "SELECT TwitchChannels.Name \
+                                                      FROM TwitchSubscriptions INNER JOIN TwitchChannels \
+                                                      ON TwitchSubscriptions.TwitchChannel=TwitchChannels.ID \
+                                                      WHERE Guild=$1")
+ALL_TWITCH_SUBSCRIPTIONS = Query("all twitch subscriptions", "SELECT TwitchChannel, Guild FROM TwitchSubscriptions")
+TWITCH_CHANNEL_IDS = Query("twitch channel ids", "SELECT DISTINCT TwitchChannel FROM TwitchSubscriptions")
+TWITCH_LAST_LIVE = Query("twitch last live", "SELECT LastLive FROM TwitchChannels WHERE ID=$1")
+SET_TWITCH_LAST_LIVE = Query("set twitch last live", "UPDATE TwitchChannels SET LastLive=$1 WHERE ID=$2")
+
+# reddit
+SUBREDDIT_POLL_STATES = Query("subreddit poll states", "SELECT ID, Name, LastPostID, LastPostTime FROM Subreddits")
+ALL_REDDIT_SUBSCRIPTIONS = Query("all reddit subscriptions", "SELECT Subreddit, Guild FROM SubredditSubscriptions")
+SUBREDDIT_BY_NAME = Query("subreddit by name", "SELECT ID, Name, Over18, Icon, Description FROM Subreddits WHERE lower(Name)=$1",
+                          SubredditInfo)
+SUBREDDIT_KNOWN = Query("subreddit known", "SELECT 1 FROM Subreddits WHERE ID=$1")
+SET_SUBREDDIT_LAST_POST = Query("set subreddit last post", "UPDATE Subreddits SET LastPostID=$1, LastPostTime=$2 WHERE ID=$3")
+UPDATE_SUBREDDIT = Query("update subreddit", "UPDATE Subreddits SET Over18=$1, Icon=$2, Description=$3 WHERE ID=$4")
+ADD_SUBREDDIT = Query("add subreddit", "INSERT INTO Subreddits (ID, Name, LastPostID, LastPostTime, Over18, Icon, Description) \
+                                        VALUES ($1, $2, $3, $4, $5, $6, $7) ON CONFLICT (ID) DO NOTHING")
+REDDIT_SUBSCRIBE = Query("reddit subscribe", "INSERT INTO SubredditSubscriptions (Subreddit, Guild) VALUES ($1, $2) \
+                                              ON CONFLICT DO NOTHING RETURNING 1")
+REDDIT_UNSUBSCRIBE = Query("reddit unsubscribe", "DELETE FROM SubredditSubscriptions WHERE Subreddit=$1 AND Guild=$2 RETURNING 1")
+REMOVE_SUBREDDIT = Query("remove subreddit", "DELETE FROM Subreddits WHERE ID=$1 \
+                                              AND NOT EXISTS (SELECT 1 FROM SubredditSubscriptions WHERE Subreddit=$1) \
+                                              RETURNING 1")
+REDDIT_SUBSCRIPTIONS = Query("reddit subscriptions", "SELECT Subreddits.Name \
+                                                      FROM SubredditSubscriptions INNER JOIN Subreddits \
+                                                      ON SubredditSubscriptions.Subreddit=Subreddits.ID \
+                                                      WHERE Guild=$1")
+
+# surrender@20
+ALL_SURRENDERAT20_SUBSCRIPTIONS = Query("all surrenderat20 subscriptions", "SELECT Guild, RedPosts, PBE, Rotations, Esports, Releases, Other \
+                                                                            FROM SurrenderAt20Subscriptions")
+# the posts update_posts tracks, read in pages with database.stream
+SURRENDERAT20_TRACKED_POSTS = Query("surrenderat20 tracked posts", "SELECT Guild, LastPostID, LastUpdated, Updates, LastPostMessage \
+                                                                    FROM SurrenderAt20Subscriptions \
+                                                                    WHERE LastPostID IS NOT NULL AND Guild > $1 \
+                                                                    ORDER BY Guild LIMIT $2")
+SET_SURRENDERAT20_LAST_POST = Query("set surrenderat20 last post", "UPDATE SurrenderAt20Subscriptions \
+                                                                    SET LastPostID=$1, LastUpdated=$2, Updates=$3, LastPostMessage=$4 \
+                                                                    WHERE Guild=$5")
+SET_SURRENDERAT20_POST_UPDATE = Query("set surrenderat20 post update", "UPDATE SurrenderAt20Subscriptions SET LastUpdated=$1, Updates=$2 \
+                                                                        WHERE Guild=$3")
+SURRENDERAT20_CATEGORIES = Query("surrenderat20 categories", "SELECT RedPosts, PBE, Rotations, Esports, Releases, Other \
+                                                              FROM SurrenderAt20Subscriptions WHERE Guild=$1",
+                                 SurrenderAt20Categories)
+SURRENDERAT20_SUBSCRIBE = Query("surrenderat20 subscribe", "INSERT INTO SurrenderAt20Subscriptions (Guild, RedPosts, PBE, Rotations, Esports, Releases, Other) \
+                                                            VALUES ($1, $2, $3, $4, $5, $6, $7)")
+SET_SURRENDERAT20_CATEGORIES = Query("set surrenderat20 categories", "UPDATE SurrenderAt20Subscriptions \
+                                                                      SET RedPosts=$1, PBE=$2, Rotations=$3, Esports=$4, Releases=$5, Other=$6 \
+                                                                      WHERE Guild=$7")
+# guilds whose notification channel is gone stop getting posts of the other category
+SURRENDERAT20_DROP_OTHER = Query("surrenderat20 drop other", "UPDATE SurrenderAt20Subscriptions SET Other=false WHERE Guild=$1")
+SURRENDERAT20_UNSUBSCRIBE = Query("surrenderat20 unsubscribe", "DELETE FROM SurrenderAt20Subscriptions WHERE Guild=$1")
+ADD_KEYWORD = Query("add keyword", "INSERT INTO Keywords (Keyword, Guild) VALUES ($1, $2) ON CONFLICT DO NOTHING RETURNING 1")
+REMOVE_KEYWORD = Query("remove keyword", "DELETE FROM Keywords WHERE Keyword=$1 AND Guild=$2 RETURNING 1")
+GUILD_KEYWORDS = Query("guild keywords", "SELECT Keyword FROM Keywords WHERE Guild=$1")
+ALL_KEYWORDS = Query("all keywords", "SELECT Guild, Keyword FROM Keywords")
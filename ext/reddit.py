@@ -1,11 +1,107 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 import datetime
 import asyncio
-import auth_token
+import config
 import traceback
 import sys
+import time
+import heapq
+from collections import deque
+from ext.redditapi import RedditClient
+from ext import delivery
+from ext import metrics
+from ext import queries
+from ext import subscriptions
+from ext.queries import SubredditInfo
+
+reddit_poll_seconds = metrics.Histogram(
+    "vol_reddit_poll_seconds", "Time to poll a subreddit or a group of subreddits")
+reddit_poll_delay_seconds = metrics.Histogram(
+    "vol_reddit_poll_delay_seconds", "How long subreddits waited past their due time to be polled")
+reddit_poll_errors_total = metrics.Counter(
+    "vol_reddit_poll_errors_total", "Subreddit polls that raised")
+reddit_catchup_gaps_total = metrics.Counter(
+    "vol_reddit_catchup_gaps_total", "Catch-ups that did not reach the newest posts and resume on the next poll")
+
+
+def callback(result):
+    if result.cancelled():
+        return
+    ex = result.exception()
+    if ex is not None:
+        traceback.print_exception(
+            type(ex), ex, ex.__traceback__, file=sys.stderr)
+
+
+class SubredditState:
+    """Polling state of a subreddit"""
+
+    def __init__(self, subreddit_id, name, last_post_id, last_post_time):
+        self.id = subreddit_id
+        self.name = name
+        self.last_post_id = last_post_id
+        self.last_post_time = float(last_post_time or 0)
+        # creation times of the recently seen posts, used to estimate the post rate
+        self.post_times = deque([self.last_post_time], maxlen=config.reddit_rate_history)
+        self.due = time.monotonic()
+
+    def observe(self, post_id, created_utc):
+        self.last_post_id = post_id
+        self.last_post_time = created_utc
+        self.post_times.append(created_utc)
+
+    # seconds until the next poll, derived from the observed post rate
+    def interval(self, now):
+        since_last = now - self.last_post_time
+        expected_gap = since_last
+        recent = [t for t in self.post_times if now - t < config.reddit_rate_window]
+        if len(recent) > 1:
+            mean_gap = (recent[-1] - recent[0]) / (len(recent) - 1)
+            expected_gap = min(mean_gap, since_last)
+
+        # a quiet subreddit that just got a new post is polled at the minimum interval again
+        interval = expected_gap * config.reddit_interval_factor
+        return min(max(interval, config.reddit_min_interval), config.reddit_max_interval)
+
+
+class SubredditCache:
+    """Subreddit metadata by name, backed by the Subreddits table"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        # lowercase name -> (expiry time, SubredditInfo)
+        self.entries = {}
+
+    def put(self, subreddit_info):
+        self.entries[subreddit_info.name.lower()] = (
+            time.monotonic() + config.reddit_cache_ttl, subreddit_info)
+
+    # look up a subreddit in memory or in the database, without touching the network
+    async def get(self, name):
+        key = name.lower()
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        async with self.bot.pool.acquire() as db:
+            subreddit_info = await queries.SUBREDDIT_BY_NAME.fetchrow(db, key)
+        if subreddit_info is None:
+            self.entries.pop(key, None)
+            return None
+        self.put(subreddit_info)
+        return subreddit_info
+
+    # store the metadata of a subreddit search result
+    async def update(self, subreddit_data):
+        subreddit_info = SubredditInfo(subreddit_data["name"], subreddit_data["display_name"], subreddit_data["over18"],
+                                       subreddit_data["icon_img"], subreddit_data["public_description"])
+        async with self.bot.pool.acquire() as db:
+            await queries.UPDATE_SUBREDDIT.execute(db, subreddit_info.over18, subreddit_info.icon,
+                                                   subreddit_info.description, subreddit_info.id)
+        self.put(subreddit_info)
+        return subreddit_info
 
 
 class Reddit(commands.Cog):
@@ -13,120 +109,293 @@ class Reddit(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.client = RedditClient(bot)
+        self.subreddit_cache = SubredditCache(bot)
+        # polling state of every subreddit and a heap of (due time, subreddit id)
+        self.subreddits = {}
+        self.schedule = []
 
-        self.poll.start()
+        self.reddit_poller = self.bot.loop.create_task(self.poll())
+        self.reddit_poller.add_done_callback(callback)
 
     def cog_unload(self):
-        self.poll.cancel()
-
-    @tasks.loop(seconds=10.0)
-    async def poll(self):
-        async with self.bot.pool.acquire() as db:
-            # loop through all subreddits and check if a new post is up
-            subreddits = await db.fetch("SELECT * FROM Subreddits")
+        self.reddit_poller.cancel()
+
+    # add a subreddit to the polling schedule, it will be polled right away
+    def track(self, subreddit_id, name, last_post_id, last_post_time):
+        state = SubredditState(subreddit_id, name, last_post_id, last_post_time)
+        self.subreddits[subreddit_id] = state
+        heapq.heappush(self.schedule, (state.due, subreddit_id))
+
+    # remove a subreddit from the polling schedule
+    def untrack(self, subreddit_id):
+        self.subreddits.pop(subreddit_id, None)
+
+    # read the polling state of every subreddit, retried until the database answers
+    async def load_states(self):
+        while not self.bot.is_closed():
+            try:
+                async with self.bot.pool.acquire() as db:
+                    subreddits = await queries.SUBREDDIT_POLL_STATES.fetch(db)
+            except Exception as ex:
+                print('Ignoring exception in Reddit.load_states()', file=sys.stderr)
+                traceback.print_exception(
+                    type(ex), ex, ex.__traceback__, file=sys.stderr)
+                await asyncio.sleep(config.reddit_min_interval)
+                continue
             for row in subreddits:
-                parsingChannelUrl = f"https://www.reddit.com/r/{row[1]}/new.json"
-                parsingChannelHeader = {
-                    'cache-control': "no-cache", "User-Agent": auth_token.user_agent}
-                parsingChannelQueryString = {"sort": "new", "limit": "1"}
-                async with self.bot.session.get(parsingChannelUrl, headers=parsingChannelHeader,
-                                                params=parsingChannelQueryString) as resp:
-                    if resp.status > 400:
-                        await asyncio.sleep(10)
-                        continue
-
-                    try:
-                        submissions_obj = await resp.json()
-                    except Exception as ex:
-                        print(await resp.text())
-                        print('Ignoring exception in Reddit.poll()',
-                              file=sys.stderr)
-                        traceback.print_exception(
-                            type(ex), ex, ex.__traceback__, file=sys.stderr)
-                        await asyncio.sleep(1)
-                        continue
+                self.track(*row)
+            return
 
-                try:
-                    submission_data = submissions_obj["data"]["children"][0]["data"]
-                except Exception:
-                    await asyncio.sleep(1)
-                    continue
+    # schedule the next poll depending on how active the subreddit is
+    def reschedule(self, states):
+        now = time.monotonic()
+        wall_now = time.time()
+        # stretch the intervals when the rate limit budget runs low
+        slowdown = self.client.slowdown()
+        for state in states:
+            if self.subreddits.get(state.id) is not state:
+                continue
+            state.due = now + state.interval(wall_now) * slowdown
+            heapq.heappush(self.schedule, (state.due, state.id))
+
+    # take up to a group of subreddits off the schedule that are due by now
+    def take_due(self):
+        # subreddits due within the group window are polled a little early to fill the group
+        horizon = time.monotonic() + config.reddit_group_window
+        due = []
+        while len(self.schedule) > 0 and self.schedule[0][0] <= horizon and len(due) < config.reddit_group_size:
+            due_time, subreddit_id = heapq.heappop(self.schedule)
+            state = self.subreddits.get(subreddit_id)
+            # skip subreddits that got removed or rescheduled in the meantime
+            if state is None or state.due != due_time:
+                continue
+            due.append(state)
+        return due
 
-                # new post found
-                if submission_data["id"] != row[2] and submission_data["created_utc"] > row[3]:
+    async def poll(self):
+        await self.bot.wait_until_ready()
+        await self.load_states()
+
+        # every worker keeps taking due subreddits off the schedule on its own,
+        # so a slow subreddit only holds up its own worker and never the others
+        workers = [self.bot.loop.create_task(self.poll_worker()) for _ in range(config.reddit_poll_workers)]
+        for worker in workers:
+            worker.add_done_callback(callback)
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def poll_worker(self):
+        while not self.bot.is_closed():
+            states = self.take_due()
+            if len(states) == 0:
+                # wake up at least every second to pick up newly subscribed subreddits
+                if len(self.schedule) > 0:
+                    delay = min(max(self.schedule[0][0] - time.monotonic(), 0), 1.0)
+                else:
+                    delay = 1.0
+                await asyncio.sleep(delay)
+                continue
+
+            now = time.monotonic()
+            for state in states:
+                reddit_poll_delay_seconds.observe(max(now - state.due, 0.0))
+
+            # an error is logged and the worker goes on, the subreddits are scheduled again either way
+            try:
+                with reddit_poll_seconds.time():
+                    # reddit serves a combined listing for multiple subreddits, so they get polled in groups
+                    if len(states) == 1:
+                        await self.poll_subreddit(states[0])
+                    else:
+                        await self.poll_group(states)
+            except Exception as ex:
+                reddit_poll_errors_total.inc()
+                names = ", ".join("/r/" + state.name for state in states)
+                print(f'Ignoring exception in Reddit.poll() for {names}',
+                      file=sys.stderr)
+                traceback.print_exception(
+                    type(ex), ex, ex.__traceback__, file=sys.stderr)
+            self.reschedule(states)
+
+    # check multiple subreddits at once through a combined listing
+    async def poll_group(self, states):
+        names = "+".join(state.name for state in states)
+        parsingChannelUrl = config.reddit_api_url + f"/r/{names}/new.json"
+        parsingChannelQueryString = {"sort": "new", "limit": str(config.reddit_listing_limit)}
+        submissions_obj = await self.client.get_json(parsingChannelUrl, params=parsingChannelQueryString)
+        try:
+            children = submissions_obj["data"]["children"]
+        except Exception:
+            children = None
+
+        # a broken subreddit can fail the whole listing, so fall back to single fetches to isolate it
+        if children is None:
+            for state in states:
+                await self.poll_subreddit(state)
+            return
 
-                    # update last post data in database
-                    await db.execute("UPDATE Subreddits SET LastPostID=$1, LastPostTime=$2 WHERE ID=$3",
-                                     submission_data["id"], submission_data["created_utc"], row[0])
+        # split the listing back up by subreddit, it is sorted newest first
+        by_subreddit = {}
+        for child in children:
+            by_subreddit.setdefault(child["data"]["subreddit_id"], []).append(child["data"])
+
+        # when the page is full, posts older than the last one on the page were cut off
+        page_full = len(children) >= config.reddit_listing_limit
+        if page_full:
+            oldest_time = children[-1]["data"]["created_utc"]
+
+        for state in states:
+            if page_full and state.last_post_time < oldest_time:
+                await self.poll_subreddit(state)
+                continue
+
+            await self.announce_new(state, by_subreddit.get(state.id, []))
+
+    # check a single subreddit for new posts, catching up on everything since the last seen post
+    async def poll_subreddit(self, state):
+        parsingChannelUrl = config.reddit_api_url + f"/r/{state.name}/new.json"
+        page_size = config.reddit_catchup_page_size
+        parsingChannelQueryString = {"sort": "new", "limit": str(page_size)}
+        submissions_obj = await self.client.get_json(parsingChannelUrl, params=parsingChannelQueryString)
+        try:
+            submissions = [child["data"] for child in submissions_obj["data"]["children"]]
+        except Exception:
+            return
 
-                    # create message embed
-                    if len(submission_data["title"]) > 256:
-                        title = submission_data["title"][:256]
-                    else:
-                        title = submission_data["title"]
-                    emb = discord.Embed(title=title,
-                                        color=discord.Colour.dark_blue(),
-                                        url="https://www.reddit.com" + submission_data["permalink"])
-                    emb.timestamp = datetime.datetime.utcnow()
-                    emb.set_author(name=submission_data["author"])
-
-                    post_content = submission_data["selftext"].replace("amp;", "").replace(
-                        "&#x200B;", "").replace("&lt;", "<").replace("&gt;", ">")
-                    # if post content is very big, trim it
-                    if len(submission_data["selftext"]) > 1900:
-                        emb.description = post_content[:1900] + \
-                            "... `click title to continue`"
+        # the whole page is new, so page forward from the last seen post
+        # until the newest page is reached to not drop any posts of a burst
+        if len(submissions) >= page_size and submissions[-1]["created_utc"] > state.last_post_time and state.last_post_id is not None:
+            seen = {submission["id"] for submission in submissions}
+            before = "t3_" + state.last_post_id
+            caught_up = []
+            reached_newest = False
+            for _ in range(config.reddit_catchup_max_pages):
+                parsingChannelQueryString = {"sort": "new", "limit": str(page_size), "before": before}
+                submissions_obj = await self.client.get_json(parsingChannelUrl, params=parsingChannelQueryString)
+                try:
+                    page = [child["data"] for child in submissions_obj["data"]["children"]]
+                except Exception:
+                    break
+
+                new = [submission for submission in page if submission["id"] not in seen]
+                caught_up.extend(new)
+                seen.update(submission["id"] for submission in new)
+                # reached the posts of the first page or the newest post
+                if len(new) < len(page) or len(page) < page_size:
+                    reached_newest = True
+                    break
+                before = page[0]["name"]
+
+            if reached_newest:
+                submissions.extend(caught_up)
+            else:
+                # the posts between the caught up pages and the first page were not fetched,
+                # so only the caught up posts are announced and the next poll goes on after the newest of them
+                reddit_catchup_gaps_total.inc()
+                print(f'Catch-up of /r/{state.name} stopped after {len(caught_up)} posts, '
+                      f'resuming on the next poll', file=sys.stderr)
+                submissions = caught_up
+
+        await self.announce_new(state, submissions)
+
+    # announce all submissions newer than the last one seen, oldest first
+    async def announce_new(self, state, submissions):
+        submissions = [submission for submission in submissions
+                       if submission["id"] != state.last_post_id and submission["created_utc"] > state.last_post_time]
+        if len(submissions) == 0:
+            return
+        submissions.sort(key=lambda submission: submission["created_utc"])
+        newest = submissions[-1]
+        for submission in submissions:
+            state.observe(submission["id"], submission["created_utc"])
+
+        # update last post data in database
+        self.bot.write_behind.update(queries.SET_SUBREDDIT_LAST_POST, state.id,
+                                     newest["id"], newest["created_utc"], state.id)
+
+        channels = self.bot.subscriptions.recipients(subscriptions.REDDIT, state.id)
+
+        for submission_data in submissions:
+            await self.announce(state, channels, submission_data)
+
+    # send the submission to every subscribed server
+    async def announce(self, state, channels, submission_data):
+        # the embed is rendered once, each channel only picks a variant
+        content = "A new post in /r/" + state.name + " !"
+        uncensored, censored = self.render(submission_data)
+
+        # send notification to every subscribed server
+        for guild_id, channel_id, _ in channels:
+            announceChannel = self.bot.get_channel(channel_id)
+            if announceChannel is None:
+                guild = self.bot.get_guild(guild_id)
+                if guild is None:
+                    async with self.bot.pool.acquire() as db:
+                        await queries.REDDIT_UNSUBSCRIBE.execute(db, state.id, guild_id)
+                    self.bot.subscriptions.remove(subscriptions.REDDIT, state.id, guild_id)
+                continue
+            if announceChannel.is_nsfw():
+                emb = uncensored
+            else:
+                emb = censored
+            self.bot.delivery.send(announceChannel, content, embed=emb, priority=delivery.REDDIT)
+
+    # create the message embed of a submission
+    # returns the uncensored variant and the variant for channels not marked as NSFW
+    def render(self, submission_data):
+        if len(submission_data["title"]) > 256:
+            title = submission_data["title"][:256]
+        else:
+            title = submission_data["title"]
+        emb = discord.Embed(title=title,
+                            color=discord.Colour.dark_blue(),
+                            url="https://www.reddit.com" + submission_data["permalink"])
+        emb.timestamp = datetime.datetime.utcnow()
+        emb.set_author(name=submission_data["author"])
+
+        post_content = submission_data["selftext"].replace("amp;", "").replace(
+            "&#x200B;", "").replace("&lt;", "<").replace("&gt;", ">")
+        # if post content is very big, trim it
+        if len(submission_data["selftext"]) > 1900:
+            emb.description = post_content[:1900] + \
+                "... `click title to continue`"
+        else:
+            emb.description = post_content
+
+        try:
+            emb.set_image(
+                url=submission_data["preview"]["images"][0]["variants"]["gif"]["source"]["url"])
+        except KeyError:
+            try:
+                if submission_data["thumbnail"] not in ["self", "default", "spoiler", "nsfw"]:
+                    if submission_data["over_18"]:
+                        emb.set_image(
+                            url=submission_data["preview"]["images"][0]["source"]["url"])
                     else:
-                        emb.description = post_content
-
-                    try:
                         emb.set_image(
-                            url=submission_data["preview"]["images"][0]["variants"]["gif"]["source"]["url"])
-                    except KeyError:
-                        try:
-                            if submission_data["thumbnail"] not in ["self", "default", "spoiler", "nsfw"]:
-                                if submission_data["over_18"]:
-                                    emb.set_image(
-                                        url=submission_data["preview"]["images"][0]["source"]["url"])
-                                else:
-                                    emb.set_image(
-                                        url=submission_data["thumbnail"])
-                            elif submission_data["over_18"] and submission_data["domain"] in ["i.imgur.com", "imgur.com", "i.redd.it", "gfycat.com"]:
-                                emb.set_image(url=submission_data["url"])
-                        except KeyError:
-                            pass
-
-                    # send notification to every subscribed server
-                    channels = await db.fetch("SELECT Guilds.RedditNotifChannel, Guilds.ID \
-                                                 FROM SubredditSubscriptions INNER JOIN Guilds \
-                                                 ON SubredditSubscriptions.Guild=Guilds.ID \
-                                                 WHERE Subreddit=$1", row[0])
-
-                    for ch in channels:
-                        announceChannel = self.bot.get_channel(ch[0])
-                        if announceChannel is None:
-                            continue
-                        if submission_data["over_18"] and not announceChannel.is_nsfw():
-                            try:
-                                emb.set_image(
-                                    url=submission_data["preview"]["images"][0]["variants"]["nsfw"]["source"]["url"].replace("amp;", ""))
-                            except KeyError:
-                                emb.set_image(
-                                    url="https://www.digitaltrends.com/wp-content/uploads/2012/11/reddit.jpeg")
-                            emb.set_footer(
-                                text="This is an NSFW post, to uncensor posts, please mark the notification channel as NSFW")
-                        try:
-                            await announceChannel.send("A new post in /r/" + row[1] + " !", embed=emb)
-                        except AttributeError:
-                            guild = self.bot.get_guild(ch[1])
-                            if guild is None:
-                                await db.execute("DELETE FROM SubredditSubscriptions WHERE Subreddit=$1 AND Guild=$2", ch[0], ch[1])
-                        except discord.errors.Forbidden:
-                            pass
-
-    @poll.before_loop
-    async def before_printer(self):
-        await self.bot.wait_until_ready()
+                            url=submission_data["thumbnail"])
+                elif submission_data["over_18"] and submission_data["domain"] in ["i.imgur.com", "imgur.com", "i.redd.it", "gfycat.com"]:
+                    emb.set_image(url=submission_data["url"])
+            except KeyError:
+                pass
+
+        if not submission_data["over_18"]:
+            return emb, emb
+
+        censored = emb.copy()
+        try:
+            censored.set_image(
+                url=submission_data["preview"]["images"][0]["variants"]["nsfw"]["source"]["url"].replace("amp;", ""))
+        except KeyError:
+            censored.set_image(
+                url="https://www.digitaltrends.com/wp-content/uploads/2012/11/reddit.jpeg")
+        censored.set_footer(
+            text="This is an NSFW post, to uncensor posts, please mark the notification channel as NSFW")
+        return emb, censored
 
     # who and where the commands are permitted to use
     @commands.has_permissions(manage_messages=True)
@@ -161,8 +430,8 @@ class Reddit(commands.Cog):
 
         async with self.bot.pool.acquire() as db:
             # add channel id for the guild to the database
-            await db.execute("UPDATE Guilds SET RedditNotifChannel=$1 WHERE ID=$2",
-                             channel_obj.id, ctx.guild.id)
+            await queries.SET_CHANNEL[subscriptions.REDDIT].execute(db, channel_obj.id, ctx.guild.id)
+        self.bot.subscriptions.set_channel(ctx.guild.id, subscriptions.REDDIT, channel_obj.id)
 
         await ctx.send("Successfully set Reddit notifications to " + channel_obj.mention)
 
@@ -173,8 +442,8 @@ class Reddit(commands.Cog):
         Its new posts will be announced in the specified channel"""
         async with self.bot.pool.acquire() as db:
             # check if announcement channel is set up
-            rows = await db.fetch("SELECT RedditNotifChannel FROM Guilds WHERE ID=$1", ctx.guild.id)
-            if len(rows) == 0 or rows[0][0] is None:
+            channels = await queries.GUILD_CHANNELS.fetchrow(db, ctx.guild.id)
+            if channels is None or channels.reddit is None:
                 await ctx.send("You need to set up a notifications channel before subscribing! \nUse either ;setchannel or ;surrenderat20 setchannel")
                 return
 
@@ -184,63 +453,73 @@ class Reddit(commands.Cog):
 
         sr = subreddit.replace("/r/", "").replace("r/", "")
 
-        # search for specified subreddit
-        parsingChannelUrl = f"https://www.reddit.com/subreddits/search.json?q={sr}&include_over_18=on"
-        parsingChannelHeader = {'cache-control': "no-cache"}
-        parsingChannelQueryString = {"limit": "1"}
-        async with self.bot.session.get(parsingChannelUrl, headers=parsingChannelHeader,
-                                        params=parsingChannelQueryString) as resp:
-            subreddits_obj = await resp.json()
+        # known subreddits don't need to be looked up on reddit
+        subreddit_info = await self.subreddit_cache.get(sr)
+        if subreddit_info is None or subreddit_info.over18 is None:
+            # search for specified subreddit
+            parsingChannelUrl = config.reddit_api_url + f"/subreddits/search.json?q={sr}&include_over_18=on"
+            parsingChannelQueryString = {"limit": "1"}
+            subreddits_obj = await self.client.get_json(parsingChannelUrl, params=parsingChannelQueryString)
+            if subreddits_obj is None:
+                await ctx.send("Could not reach Reddit, please try again later")
+                return
+
+            if len(subreddits_obj["data"]["children"]) == 0:
+                await ctx.send(f"Could not find a subreddit called {sr}")
+                return
 
-        if len(subreddits_obj["data"]["children"]) == 0:
-            await ctx.send(f"Could not find a subreddit called {sr}")
-            return
+            subreddit_data = subreddits_obj["data"]["children"][0]["data"]
 
-        subreddit_data = subreddits_obj["data"]["children"][0]["data"]
+            if subreddit_data["display_name"].lower() != sr.lower():
+                name = subreddit_data["display_name"]
+                await ctx.send(f"Could not find subreddit called '{sr}'. \nDo you maybe mean '{name}'?")
+                return
 
-        if subreddit_data["display_name"].lower() != sr.lower():
-            name = subreddit_data["display_name"]
-            await ctx.send(f"Could not find subreddit called '{sr}'. \nDo you maybe mean '{name}'?")
-            return
+            subreddit_info = await self.subreddit_cache.update(subreddit_data)
 
-        announceChannel = self.bot.get_channel(rows[0][0])
-        if subreddit_data["over18"] and not announceChannel.is_nsfw():
+        announceChannel = self.bot.get_channel(channels.reddit)
+        if subreddit_info.over18 and not announceChannel.is_nsfw():
             await ctx.send("This subreddit is NSFW, to subscribe you need to set the announcement channel to NSFW")
             return
 
-        # get last post data
-        parsingChannelUrl = f"https://www.reddit.com/r/{sr}/new.json"
-        parsingChannelHeader = {'cache-control': "no-cache"}
-        parsingChannelQueryString = {"sort": "new", "limit": "1"}
-        async with self.bot.session.get(parsingChannelUrl, headers=parsingChannelHeader,
-                                        params=parsingChannelQueryString) as resp:
-            submissions_obj = await resp.json()
+        async with self.bot.pool.acquire() as db:
+            known = await queries.SUBREDDIT_KNOWN.fetchval(db, subreddit_info.id)
+
+        # if subreddit is not yet in database, get last post data and add it
+        if known is None:
+            parsingChannelUrl = config.reddit_api_url + f"/r/{subreddit_info.name}/new.json"
+            parsingChannelQueryString = {"sort": "new", "limit": "1"}
+            submissions_obj = await self.client.get_json(parsingChannelUrl, params=parsingChannelQueryString)
+            if submissions_obj is None:
+                await ctx.send("Could not reach Reddit, please try again later")
+                return
+
+            if len(submissions_obj["data"]["children"]) > 0:
+                submission_data = submissions_obj["data"]["children"][0]["data"]
+                last_post_id = submission_data["id"]
+                last_post_time = submission_data["created_utc"]
+            else:
+                last_post_id = None
+                last_post_time = 0
 
-        submission_data = submissions_obj["data"]["children"][0]["data"]
+            async with self.bot.pool.acquire() as db:
+                await queries.ADD_SUBREDDIT.execute(db, subreddit_info.id, subreddit_info.name, last_post_id, last_post_time,
+                                                    subreddit_info.over18, subreddit_info.icon, subreddit_info.description)
+            self.track(subreddit_info.id, subreddit_info.name, last_post_id, last_post_time)
 
         async with self.bot.pool.acquire() as db:
-            # if subreddit is not yet in database, add it
-            results = await db.fetch("SELECT 1 FROM Subreddits WHERE ID=$1", submission_data["subreddit_id"])
-            if len(results) == 0:
-                await db.execute("INSERT INTO Subreddits (ID, Name, LastPostID, LastPostTime) VALUES ($1, $2, $3, $4)",
-                                 submission_data["subreddit_id"], submission_data["subreddit"],
-                                 submission_data["id"], submission_data["created_utc"])
-
             # add subscription to database
-            results = await db.fetch("SELECT 1 FROM SubredditSubscriptions WHERE Subreddit=$1 AND Guild=$2",
-                                     submission_data["subreddit_id"], ctx.guild.id)
-            if len(results) == 0:
-                await db.execute("INSERT INTO SubredditSubscriptions (Subreddit, Guild) VALUES ($1, $2)",
-                                 submission_data["subreddit_id"], ctx.guild.id)
-            else:
+            inserted = await queries.REDDIT_SUBSCRIBE.fetchval(db, subreddit_info.id, ctx.guild.id)
+            if inserted is None:
                 await ctx.send("You are already subscribed to this Subreddit")
                 return
+        self.bot.subscriptions.add(subscriptions.REDDIT, subreddit_info.id, ctx.guild.id)
 
         # create message embed and send it
-        emb = discord.Embed(title="Successfully subscribed to " + submission_data["subreddit_name_prefixed"],
-                            description=subreddit_data["public_description"], color=discord.Colour.green())
-        emb.set_thumbnail(url=subreddit_data["icon_img"])
-        emb.url = "https://www.reddit.com" + subreddit_data["url"]
+        emb = discord.Embed(title="Successfully subscribed to r/" + subreddit_info.name,
+                            description=subreddit_info.description, color=discord.Colour.green())
+        emb.set_thumbnail(url=subreddit_info.icon)
+        emb.url = "https://www.reddit.com/r/" + subreddit_info.name
 
         await ctx.send(embed=emb)
 
@@ -255,56 +534,29 @@ class Reddit(commands.Cog):
 
         sr = subreddit.replace("/r/", "").replace("r/", "")
 
-        # search subreddit
-        parsingChannelUrl = f"https://www.reddit.com/subreddits/search.json?q={sr}&include_over_18=on"
-        parsingChannelHeader = {'cache-control': "no-cache"}
-        parsingChannelQueryString = {"limit": "1"}
-        async with self.bot.session.get(parsingChannelUrl, headers=parsingChannelHeader,
-                                        params=parsingChannelQueryString) as resp:
-            subreddits_obj = await resp.json()
-
-        if len(subreddits_obj["data"]["children"]) == 0:
-            await ctx.send(f"Could not find a subreddit called {sr}")
+        # a guild can only be subscribed to subreddits that are in the database
+        subreddit_info = await self.subreddit_cache.get(sr)
+        if subreddit_info is None:
+            await ctx.send("You are not subscribed to this Subreddit")
             return
 
-        subreddit_data = subreddits_obj["data"]["children"][0]["data"]
-
-        if subreddit_data["display_name"].lower() != sr.lower():
-            name = subreddit_data["display_name"]
-            await ctx.send(f"Could not find subreddit called '{sr}'. \nDo you maybe mean '{name}'?")
-            return
-
-        # get latest post data
-        parsingChannelUrl = f"https://www.reddit.com/r/{sr}/new.json"
-        parsingChannelHeader = {'cache-control': "no-cache"}
-        parsingChannelQueryString = {"sort": "new", "limit": "1"}
-        async with self.bot.session.get(parsingChannelUrl, headers=parsingChannelHeader,
-                                        params=parsingChannelQueryString) as resp:
-            submissions_obj = await resp.json()
-
-        submission_data = submissions_obj["data"]["children"][0]["data"]
-
         async with self.bot.pool.acquire() as db:
             # remove subscription from database
-            results = await db.fetch("SELECT 1 FROM SubredditSubscriptions WHERE Subreddit=$1 AND Guild=$2",
-                                     submission_data["subreddit_id"], ctx.guild.id)
-            if len(results) == 1:
-                await db.execute("DELETE FROM SubredditSubscriptions WHERE Subreddit=$1 AND Guild=$2",
-                                 submission_data["subreddit_id"], ctx.guild.id)
-            else:
+            removed = await queries.REDDIT_UNSUBSCRIBE.fetchval(db, subreddit_info.id, ctx.guild.id)
+            if removed is None:
                 await ctx.send("You are not subscribed to this Subreddit")
                 return
+            self.bot.subscriptions.remove(subscriptions.REDDIT, subreddit_info.id, ctx.guild.id)
 
             # remove subreddit from database if no server is subscribed to it anymore
-            results = await db.fetch("SELECT 1 FROM SubredditSubscriptions WHERE Subreddit=$1", submission_data["subreddit_id"])
-            if len(results) == 0:
-                await db.execute("DELETE FROM Subreddits WHERE ID=$1", submission_data["subreddit_id"])
+            if await queries.REMOVE_SUBREDDIT.fetchval(db, subreddit_info.id) is not None:
+                self.untrack(subreddit_info.id)
 
         # create message embed and send it
-        emb = discord.Embed(title="Successfully unsubscribed from " + submission_data["subreddit_name_prefixed"],
-                            description=subreddit_data["public_description"], color=discord.Colour.dark_red())
-        emb.set_thumbnail(url=subreddit_data["icon_img"])
-        emb.url = "https://www.reddit.com" + subreddit_data["url"]
+        emb = discord.Embed(title="Successfully unsubscribed from r/" + subreddit_info.name,
+                            description=subreddit_info.description, color=discord.Colour.dark_red())
+        emb.set_thumbnail(url=subreddit_info.icon)
+        emb.url = "https://www.reddit.com/r/" + subreddit_info.name
 
         await ctx.send(embed=emb)
 
@@ -314,10 +566,7 @@ class Reddit(commands.Cog):
         names = ""
         async with self.bot.pool.acquire() as db:
             # get all subreddits the server is subscribed to
-            cursor = await db.fetch("SELECT Subreddits.Name \
-                                       FROM SubredditSubscriptions INNER JOIN Subreddits \
-                                       ON SubredditSubscriptions.Subreddit=Subreddits.ID \
-                                       WHERE Guild=$1", ctx.guild.id)
+            cursor = await queries.REDDIT_SUBSCRIPTIONS.fetch(db, ctx.guild.id)
 
             for row in cursor:
                 names = names + row[0] + "\n"
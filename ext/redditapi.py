@@ -0,0 +1,126 @@
+import aiohttp
+import asyncio
+import auth_token
+import config
+import random
+import sys
+import time
+import traceback
+from collections import defaultdict
+from urllib.parse import urlsplit
+from ext import metrics
+
+reddit_fetch_seconds = metrics.Histogram(
+    "vol_reddit_fetch_seconds", "Latency of requests to reddit")
+reddit_requests_total = metrics.Counter(
+    "vol_reddit_requests_total", "Requests to reddit by response status", ("status",))
+
+
+class RedditClient:
+    """HTTP client for Reddit that keeps to its rate limit"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.host_limits = defaultdict(
+            lambda: asyncio.Semaphore(config.reddit_per_host_limit))
+        self.headers = {'cache-control': "no-cache",
+                        "User-Agent": auth_token.user_agent}
+
+        # rate limit state as last reported by reddit
+        self.remaining = None
+        self.used = None
+        self.reset_at = None
+        # monotonic time the next request may be started at
+        self.next_request = 0.0
+        self.pace_lock = asyncio.Lock()
+
+    # fraction of the rate limit budget left in the current window
+    def budget(self):
+        if self.remaining is None or self.reset_at is None or time.monotonic() >= self.reset_at:
+            return 1.0
+        total = self.remaining + self.used
+        if total <= 0:
+            return 1.0
+        return self.remaining / total
+
+    # factor to stretch poll intervals by when the budget runs low
+    def slowdown(self):
+        budget = self.budget()
+        if budget >= config.reddit_budget_low:
+            return 1.0
+        return min(config.reddit_budget_low / max(budget, 0.01), config.reddit_max_slowdown)
+
+    def update_limits(self, headers):
+        try:
+            remaining = float(headers["X-Ratelimit-Remaining"])
+            used = float(headers["X-Ratelimit-Used"])
+            reset = float(headers["X-Ratelimit-Reset"])
+        except (KeyError, ValueError):
+            return
+        self.remaining = remaining
+        self.used = used
+        self.reset_at = time.monotonic() + reset
+
+    # spread the remaining requests evenly over the rest of the window
+    async def wait_turn(self):
+        async with self.pace_lock:
+            now = time.monotonic()
+            if self.remaining is not None and self.reset_at is not None and now < self.reset_at:
+                spacing = (self.reset_at - now) / max(self.remaining, 1)
+            else:
+                spacing = 0.0
+            start = max(now, self.next_request)
+            self.next_request = start + spacing
+            # reserve a request of the budget until reddit reports the new state
+            if self.remaining is not None:
+                self.remaining = max(self.remaining - 1, 0)
+        delay = start - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    # pause all requests, used when reddit throttles or fails
+    def back_off(self, attempt, retry_after=None):
+        delay = random.uniform(config.reddit_backoff_base,
+                               min(config.reddit_backoff_max, config.reddit_backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        self.next_request = max(self.next_request, time.monotonic() + delay)
+
+    # get request returning the decoded json or None on failure
+    async def get_json(self, url, params=None):
+        timeout = aiohttp.ClientTimeout(total=config.reddit_request_timeout)
+        for attempt in range(config.reddit_max_retries + 1):
+            await self.wait_turn()
+            async with self.host_limits[urlsplit(url).hostname]:
+                start = time.monotonic()
+                try:
+                    async with self.bot.session.get(url, headers=self.headers, params=params,
+                                                    timeout=timeout) as resp:
+                        reddit_fetch_seconds.observe(time.monotonic() - start)
+                        reddit_requests_total.inc(resp.status)
+                        self.update_limits(resp.headers)
+
+                        if resp.status == 429 or resp.status >= 500:
+                            try:
+                                retry_after = float(resp.headers["Retry-After"])
+                            except (KeyError, ValueError):
+                                retry_after = None
+                            self.back_off(attempt, retry_after)
+                            continue
+                        if resp.status >= 400:
+                            return None
+
+                        try:
+                            return await resp.json()
+                        except Exception as ex:
+                            print(await resp.text())
+                            print('Ignoring exception in RedditClient.get_json()',
+                                  file=sys.stderr)
+                            traceback.print_exception(
+                                type(ex), ex, ex.__traceback__, file=sys.stderr)
+                            return None
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    # a slow or broken connection only costs this request a retry, other requests go on
+                    reddit_fetch_seconds.observe(time.monotonic() - start)
+                    reddit_requests_total.inc("error")
+        return None
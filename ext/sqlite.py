@@ -0,0 +1,222 @@
+import asyncio
+import concurrent.futures
+import datetime
+import functools
+import json
+import os
+import re
+import sqlite3
+
+from ext.database import ROOT
+
+
+# timestamps are stored as ISO 8601 text and read back timezone aware
+def adapt_datetime(value):
+    return value.isoformat()
+
+
+def convert_timestamp(value):
+    return datetime.datetime.fromisoformat(value.decode())
+
+
+sqlite3.register_adapter(datetime.datetime, adapt_datetime)
+sqlite3.register_converter("timestamptz", convert_timestamp)
+sqlite3.register_converter("boolean", lambda value: value not in (b"0", b""))
+
+
+# postgres style $1 parameters become sqlite's numbered ?1 parameters
+@functools.lru_cache(maxsize=512)
+def translate(query):
+    return re.sub(r"\$(\d+)", r"?\1", query)
+
+
+# splits a script into single statements so it can run inside a transaction
+def split_statements(script):
+    statements = []
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement.strip())
+            statement = ""
+    if statement.strip() != "":
+        statements.append(statement.strip())
+    return statements
+
+
+# all statements run on one connection in one thread, so there is a single writer
+# and statements of other tasks wait while a transaction is open
+class SqlitePool:
+    """Embedded SQLite storage for single node deployments and benchmarks"""
+
+    migrations_dir = os.path.join(ROOT, "migrations", "sqlite")
+
+    def __init__(self, connection, executor, loop):
+        self.connection = connection
+        self.executor = executor
+        self.loop = loop
+        # held by open transactions and by single statements outside of them
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, path, loop=None):
+        loop = loop or asyncio.get_event_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        def connect():
+            connection = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+                                         check_same_thread=False, cached_statements=512)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            return connection
+
+        connection = await loop.run_in_executor(executor, connect)
+        return cls(connection, executor, loop)
+
+    def acquire(self):
+        return Acquire(self)
+
+    # runs a function with the sqlite connection in the database thread
+    def run(self, function, *args):
+        return self.loop.run_in_executor(self.executor, function, self.connection, *args)
+
+    async def explain(self, db, query, args):
+        rows = await db.fetch("EXPLAIN QUERY PLAN " + query, *args)
+        return [row[3] for row in rows]
+
+    async def load_live_guilds(self, db, records):
+        await db.execute("CREATE TEMPORARY TABLE IF NOT EXISTS LiveGuilds (ID INTEGER PRIMARY KEY, Name TEXT)")
+        await db.execute("DELETE FROM LiveGuilds")
+        await db.executemany("INSERT INTO LiveGuilds (ID, Name) VALUES ($1, $2)", records)
+
+    # without data modifying CTEs the channels are removed first, guild rows last
+    # so the subscriptions they cascade to can still be checked
+    async def remove_guilds(self, db, guild_ids):
+        ids = json.dumps(list(guild_ids))
+        orphaned = "WHERE EXISTS (SELECT 1 FROM {subs} s WHERE s.{column}=c.ID AND s.Guild IN (SELECT value FROM json_each($1))) \
+                    AND NOT EXISTS (SELECT 1 FROM {subs} s WHERE s.{column}=c.ID AND s.Guild NOT IN (SELECT value FROM json_each($1)))"
+        async with db.transaction():
+            await db.execute("DELETE FROM YoutubeChannels AS c " +
+                             orphaned.format(subs="YoutubeSubscriptions", column="YoutubeChannel"), ids)
+            await db.execute("DELETE FROM TwitchChannels AS c " +
+                             orphaned.format(subs="TwitchSubscriptions", column="TwitchChannel"), ids)
+            subreddits = await db.fetch("DELETE FROM Subreddits AS c " +
+                                        orphaned.format(subs="SubredditSubscriptions", column="Subreddit") +
+                                        " RETURNING ID", ids)
+            guilds = await db.fetch("DELETE FROM Guilds WHERE ID IN (SELECT value FROM json_each($1)) RETURNING ID", ids)
+        return [row[0] for row in guilds], [row[0] for row in subreddits]
+
+    async def close(self):
+        async with self.lock:
+            await self.run(lambda connection: connection.close())
+        self.executor.shutdown(wait=False)
+
+    def terminate(self):
+        self.executor.shutdown(wait=False)
+
+
+class Acquire:
+    """Context manager handing out a connection of the sqlite pool"""
+
+    def __init__(self, pool):
+        self.connection = Connection(pool)
+
+    async def __aenter__(self):
+        return self.connection
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class Connection:
+    """Offers the asyncpg query methods on top of the shared sqlite connection"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.transactions = 0
+
+    async def run(self, function, *args):
+        # inside a transaction the lock is already held by this connection
+        if self.transactions > 0:
+            return await self.pool.run(function, *args)
+        async with self.pool.lock:
+            return await self.pool.run(function, *args)
+
+    async def fetch(self, query, *args):
+        return await self.run(lambda connection: connection.execute(translate(query), args).fetchall())
+
+    async def fetchrow(self, query, *args):
+        return await self.run(lambda connection: connection.execute(translate(query), args).fetchone())
+
+    async def fetchval(self, query, *args):
+        row = await self.fetchrow(query, *args)
+        if row is None:
+            return None
+        return row[0]
+
+    async def execute(self, query, *args):
+        if len(args) == 0:
+            # scripts like migrations hold several statements
+            def execute_all(connection):
+                for statement in split_statements(query):
+                    connection.execute(statement)
+            return await self.run(execute_all)
+        return await self.run(lambda connection: connection.execute(translate(query), args).rowcount)
+
+    async def executemany(self, query, args):
+        args = [tuple(row) for row in args]
+        return await self.run(lambda connection: connection.executemany(translate(query), args).rowcount)
+
+    def transaction(self):
+        return Transaction(self)
+
+    # iterates over the rows, reading prefetch rows at once
+    async def cursor(self, query, *args, prefetch=50):
+        cursor = await self.run(lambda connection: connection.execute(translate(query), args))
+        while True:
+            rows = await self.run(lambda connection: cursor.fetchmany(prefetch))
+            if len(rows) == 0:
+                break
+            for row in rows:
+                yield row
+
+
+class Transaction:
+    """Takes the pool for the connection and wraps the statements in BEGIN and COMMIT"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def __aenter__(self):
+        connection = self.connection
+        if connection.transactions == 0:
+            await connection.pool.lock.acquire()
+            try:
+                await connection.pool.run(lambda db: db.execute("BEGIN IMMEDIATE"))
+            except BaseException:
+                connection.pool.lock.release()
+                raise
+        else:
+            # nested transactions become savepoints like in asyncpg
+            await connection.pool.run(lambda db: db.execute(f"SAVEPOINT sp{connection.transactions}"))
+        connection.transactions += 1
+
+    async def __aexit__(self, exc_type, exc, tb):
+        connection = self.connection
+        connection.transactions -= 1
+        if connection.transactions > 0:
+            if exc_type is None:
+                await connection.pool.run(lambda db: db.execute(f"RELEASE sp{connection.transactions}"))
+            else:
+                await connection.pool.run(lambda db: db.execute(f"ROLLBACK TO sp{connection.transactions}"))
+                await connection.pool.run(lambda db: db.execute(f"RELEASE sp{connection.transactions}"))
+            return
+        try:
+            if exc_type is None:
+                await connection.pool.run(lambda db: db.execute("COMMIT"))
+            else:
+                await connection.pool.run(lambda db: db.execute("ROLLBACK"))
+        finally:
+            connection.pool.lock.release()
@@ -0,0 +1,139 @@
+from collections import defaultdict
+from ext.keywords import KeywordMatcher
+
+# the kinds of notifications a guild can set a channel for
+SURRENDERAT20 = "surrenderat20"
+TWITCH = "twitch"
+YOUTUBE = "youtube"
+REDDIT = "reddit"
+KINDS = (SURRENDERAT20, TWITCH, YOUTUBE, REDDIT)
+
+
+class SubscriptionIndex:
+    """In-memory copy of who gets notified about what"""
+
+    def __init__(self):
+        # guild id -> {kind: notification channel id}
+        self.channels = {}
+        # kind -> upstream id -> {guild id: flags}
+        # flags are OnlyStreams for youtube and the category booleans for surrender@20,
+        # surrender@20 only has a single feed so its subscriptions are stored under None
+        self.subscriptions = {kind: defaultdict(dict) for kind in KINDS}
+        # guild id -> surrender@20 keywords, None until loaded and after keywords changed
+        self.keywords = None
+        # the same keywords as an automaton for matching them against posts
+        self.keyword_matcher = None
+        # bumped on every invalidation, so a load that raced with a change is not kept
+        self.keywords_version = 0
+
+    # read everything from the database, replacing what was there before
+    async def load(self, pool):
+        # ext.queries imports this module for the notification kinds
+        from ext import queries
+        async with pool.acquire() as db:
+            guilds = await queries.ALL_GUILD_CHANNELS.fetch(db)
+            youtube = await queries.ALL_YOUTUBE_SUBSCRIPTIONS.fetch(db)
+            twitch = await queries.ALL_TWITCH_SUBSCRIPTIONS.fetch(db)
+            reddit = await queries.ALL_REDDIT_SUBSCRIPTIONS.fetch(db)
+            surrenderat20 = await queries.ALL_SURRENDERAT20_SUBSCRIPTIONS.fetch(db)
+
+        self.channels = {row[0]: dict(zip(KINDS, row[1:])) for row in guilds}
+        self.subscriptions = {kind: defaultdict(dict) for kind in KINDS}
+        for row in youtube:
+            self.add(YOUTUBE, row[0], row[1], row[2])
+        for row in twitch:
+            self.add(TWITCH, row[0], row[1])
+        for row in reddit:
+            self.add(REDDIT, row[0], row[1])
+        for row in surrenderat20:
+            self.add(SURRENDERAT20, None, row[0], tuple(row[1:7]))
+        self.invalidate_keywords()
+
+    # keywords of all guilds, loaded with a single query when they are needed
+    async def guild_keywords(self, pool):
+        await self.load_keywords(pool)
+        return self.keywords
+
+    # matcher over the keywords of all guilds
+    async def matcher(self, pool):
+        await self.load_keywords(pool)
+        return self.keyword_matcher
+
+    async def load_keywords(self, pool):
+        from ext import queries
+        while self.keywords is None:
+            version = self.keywords_version
+            async with pool.acquire() as db:
+                rows = await queries.ALL_KEYWORDS.fetch(db)
+            keywords = {}
+            matcher = KeywordMatcher()
+            for row in rows:
+                keywords.setdefault(row[0], []).append(row[1])
+                matcher.add(row[1], row[0])
+            # a load that raced with a change is read again
+            if version == self.keywords_version:
+                self.keywords = keywords
+                self.keyword_matcher = matcher
+
+    def invalidate_keywords(self):
+        self.keywords = None
+        self.keyword_matcher = None
+        self.keywords_version += 1
+
+    # keywords that changed are updated in place once they are loaded
+    def add_keyword(self, guild_id, keyword):
+        self.keywords_version += 1
+        if self.keywords is not None:
+            self.keywords.setdefault(guild_id, []).append(keyword)
+            self.keyword_matcher.add(keyword, guild_id)
+
+    def remove_keyword(self, guild_id, keyword):
+        self.keywords_version += 1
+        if self.keywords is not None:
+            guild_keywords = self.keywords.get(guild_id, [])
+            if keyword in guild_keywords:
+                guild_keywords.remove(keyword)
+            self.keyword_matcher.remove(keyword, guild_id)
+
+    def add_guild(self, guild_id):
+        self.channels.setdefault(guild_id, dict.fromkeys(KINDS))
+
+    # forget a guild and all of its subscriptions
+    def remove_guild(self, guild_id):
+        self.channels.pop(guild_id, None)
+        if self.keywords is not None:
+            self.keywords.pop(guild_id, None)
+            self.keyword_matcher.remove_guild(guild_id)
+        for kind, upstreams in self.subscriptions.items():
+            for upstream_id in [upstream_id for upstream_id, guilds in upstreams.items() if guild_id in guilds]:
+                self.remove(kind, upstream_id, guild_id)
+
+    def set_channel(self, guild_id, kind, channel_id):
+        self.add_guild(guild_id)
+        self.channels[guild_id][kind] = channel_id
+
+    def channel(self, guild_id, kind):
+        return self.channels.get(guild_id, {}).get(kind)
+
+    def add(self, kind, upstream_id, guild_id, flags=None):
+        self.subscriptions[kind][upstream_id][guild_id] = flags
+
+    def remove(self, kind, upstream_id, guild_id):
+        upstreams = self.subscriptions[kind]
+        guilds = upstreams.get(upstream_id)
+        if guilds is None:
+            return
+        guilds.pop(guild_id, None)
+        if len(guilds) == 0:
+            del upstreams[upstream_id]
+
+    # (guild id, notification channel id, flags) of every guild subscribed to the upstream
+    def recipients(self, kind, upstream_id=None):
+        recipients = []
+        for guild_id, flags in self.subscriptions[kind].get(upstream_id, {}).items():
+            channels = self.channels.get(guild_id)
+            # same as the inner join on Guilds, subscriptions of unknown guilds are ignored
+            if channels is None:
+                continue
+            recipients.append((guild_id, channels[kind], flags))
+        return recipients
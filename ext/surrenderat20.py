@@ -3,7 +3,9 @@ from discord.ext import commands
 
 import auth_token
 import datetime
-import re
+from ext import keywords
+from ext import queries
+from ext import subscriptions
 
 
 class SurrenderAt20(commands.Cog):
@@ -11,7 +13,6 @@ class SurrenderAt20(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.cleanr = re.compile('<.*?>')
 
     # who and where the commands are permitted to use
     @commands.has_permissions(manage_messages=True)
@@ -46,8 +47,8 @@ class SurrenderAt20(commands.Cog):
 
         async with self.bot.pool.acquire() as db:
             # add channel id for the guild to the database
-            await db.execute("UPDATE Guilds SET SurrenderAt20NotifChannel=$1 WHERE ID=$2",
-                             channel_obj.id, ctx.guild.id)
+            await queries.SET_CHANNEL[subscriptions.SURRENDERAT20].execute(db, channel_obj.id, ctx.guild.id)
+        self.bot.subscriptions.set_channel(ctx.guild.id, subscriptions.SURRENDERAT20, channel_obj.id)
 
         await ctx.send("Successfully set Surrender@20 notifications to " + channel_obj.mention)
 
@@ -66,14 +67,14 @@ class SurrenderAt20(commands.Cog):
         - Other"""
         async with self.bot.pool.acquire() as db:
             # check if announcement channel is set up
-            rows = await db.fetch("SELECT SurrenderAt20NotifChannel FROM Guilds WHERE ID=$1", ctx.guild.id)
-            if len(rows) == 0 or rows[0][0] is None:
+            channels = await queries.GUILD_CHANNELS.fetchrow(db, ctx.guild.id)
+            if channels is None or channels.surrenderat20 is None:
                 await ctx.send("You need to set up a notifications channel before subscribing! \nUse either ;setchannel or ;surrenderat20 setchannel")
                 return
 
-            results = await db.fetch("SELECT * FROM SurrenderAt20Subscriptions WHERE Guild=$1", ctx.guild.id)
+            current = await queries.SURRENDERAT20_CATEGORIES.fetchrow(db, ctx.guild.id)
 
-            if len(results) == 1:
+            if current is not None:
                 if categories is None:
                     categories = "all categories"
                     redposts = True
@@ -89,8 +90,7 @@ class SurrenderAt20(commands.Cog):
                         await ctx.send("No categories found, potentially check for typos")
                         return
 
-                    result = results[0]
-                    redposts, pbe, rotations, esports, releases, other = result[1:7]
+                    redposts, pbe, rotations, esports, releases, other = current
                     # looks for each category and update boolean variable for it
                     categories = categories.lower()
                     redposts = "red posts" in categories
@@ -101,10 +101,10 @@ class SurrenderAt20(commands.Cog):
                     other = "other" in categories
 
                 # enter information into database
-                await db.execute("UPDATE SurrenderAt20Subscriptions \
-                                  SET RedPosts=$1, PBE=$2, Rotations=$3, Esports=$4, Releases=$5, Other=$6 \
-                                  WHERE Guild=$7",
-                                 redposts, pbe, rotations, esports, releases, other, ctx.guild.id)
+                await queries.SET_SURRENDERAT20_CATEGORIES.execute(db, redposts, pbe, rotations, esports, releases, other,
+                                                                   ctx.guild.id)
+                self.bot.subscriptions.add(subscriptions.SURRENDERAT20, None, ctx.guild.id,
+                                           (redposts, pbe, rotations, esports, releases, other))
 
             else:
                 # if nothing is specified, subscribe to everything
@@ -132,9 +132,9 @@ class SurrenderAt20(commands.Cog):
                         return
 
                 # enter information into database
-                await db.execute("INSERT INTO SurrenderAt20Subscriptions (Guild, RedPosts, PBE, Rotations, Esports, Releases, Other) \
-                                 VALUES ($1, $2, $3, $4, $5, $6, $7)",
-                                 ctx.guild.id, redposts, pbe, rotations, esports, other, releases)
+                await queries.SURRENDERAT20_SUBSCRIBE.execute(db, ctx.guild.id, redposts, pbe, rotations, esports, releases, other)
+                self.bot.subscriptions.add(subscriptions.SURRENDERAT20, None, ctx.guild.id,
+                                           (redposts, pbe, rotations, esports, releases, other))
 
         # create message embed and send response
         emb = discord.Embed(title="Successfully subscribed to " + categories.title(),
@@ -157,15 +157,16 @@ class SurrenderAt20(commands.Cog):
         - Esports
         - Releases"""
         async with self.bot.pool.acquire() as db:
-            results = await db.fetch("SELECT * FROM SurrenderAt20Subscriptions WHERE Guild=$1", ctx.guild.id)
-            if len(results) == 0:
+            current = await queries.SURRENDERAT20_CATEGORIES.fetchrow(db, ctx.guild.id)
+            if current is None:
                 await ctx.send("You are not subscribed to any categories")
                 return
 
             # if nothing is specified, unsubscribe from everything
             if categories is None:
                 categories = "all categories"
-                await db.execute("DELETE FROM SurrenderAt20Subscriptions WHERE Guild=$1", ctx.guild.id)
+                await queries.SURRENDERAT20_UNSUBSCRIBE.execute(db, ctx.guild.id)
+                self.bot.subscriptions.remove(subscriptions.SURRENDERAT20, None, ctx.guild.id)
             else:
                 categories = categories.lower()
                 # return error if no categories are no found but they are also not None
@@ -173,8 +174,7 @@ class SurrenderAt20(commands.Cog):
                     await ctx.send("No categories found, potentially check for typos")
                     return
 
-                result = results[0]
-                redposts, pbe, rotations, esports, releases, other = result[1:7]
+                redposts, pbe, rotations, esports, releases, other = current
                 # looks for each category and update boolean variable for it
                 redposts = "red posts" not in categories
                 pbe = "pbe" not in categories
@@ -184,10 +184,10 @@ class SurrenderAt20(commands.Cog):
                 other = "other" not in categories
 
                 # enter information into database
-                await db.execute("UPDATE SurrenderAt20Subscriptions \
-                                  SET RedPosts=$1, PBE=$2, Rotations=$3, Esports=$4, Releases=$5, Other=$6 \
-                                  WHERE Guild=$7",
-                                 redposts, pbe, rotations, esports, releases, other, ctx.guild.id)
+                await queries.SET_SURRENDERAT20_CATEGORIES.execute(db, redposts, pbe, rotations, esports, releases, other,
+                                                                   ctx.guild.id)
+                self.bot.subscriptions.add(subscriptions.SURRENDERAT20, None, ctx.guild.id,
+                                           (redposts, pbe, rotations, esports, releases, other))
 
         # create message embed and send response
         emb = discord.Embed(title="Successfully unsubscribed from " + categories.title(),
@@ -202,8 +202,8 @@ class SurrenderAt20(commands.Cog):
         """Adds a keyword to search for"""
         async with self.bot.pool.acquire() as db:
             # check if announcement channel is set up
-            rows = await db.fetch("SELECT SurrenderAt20NotifChannel FROM Guilds WHERE ID=$1", ctx.guild.id)
-            if len(rows) == 0 or rows[0][0] is None:
+            channels = await queries.GUILD_CHANNELS.fetchrow(db, ctx.guild.id)
+            if channels is None or channels.surrenderat20 is None:
                 await ctx.send("You need to set up a notifications channel before subscribing to any channels")
                 return
 
@@ -215,13 +215,12 @@ class SurrenderAt20(commands.Cog):
 
         async with self.bot.pool.acquire() as db:
             # add keyword for the guild to database if it doesn't already exist
-            results = await db.fetch("SELECT * FROM Keywords WHERE Keyword=$1 AND Guild=$2", kw, ctx.guild.id)
+            inserted = await queries.ADD_KEYWORD.fetchval(db, kw, ctx.guild.id)
 
-            if len(results) > 0:
+            if inserted is None:
                 await ctx.send("This keyword already exists!")
                 return
-
-            await db.execute("INSERT INTO Keywords (Keyword, Guild) VALUES ($1, $2)", kw, ctx.guild.id)
+        self.bot.subscriptions.add_keyword(ctx.guild.id, kw)
 
         await ctx.send("Successfully added keyword '" + kw + "'")
 
@@ -236,13 +235,12 @@ class SurrenderAt20(commands.Cog):
 
         async with self.bot.pool.acquire() as db:
             # remove keyword for guild from database
-            results = await db.fetch("SELECT * FROM Keywords WHERE Keyword=$1 AND Guild=$2", kw, ctx.guild.id)
+            removed = await queries.REMOVE_KEYWORD.fetchval(db, kw, ctx.guild.id)
 
-            if len(results) == 0:
+            if removed is None:
                 await ctx.send("This keyword does not exist!")
                 return
-
-            await db.execute("DELETE FROM Keywords WHERE Keyword=$1 AND Guild=$2", kw, ctx.guild.id)
+        self.bot.subscriptions.remove_keyword(ctx.guild.id, kw)
 
         await ctx.send("Successfully removed keyword '" + kw + "'")
 
@@ -253,29 +251,29 @@ class SurrenderAt20(commands.Cog):
         categories = ""
         async with self.bot.pool.acquire() as db:
             # get all subscribed categories of the guild
-            subscriptions = await db.fetchrow("SELECT * FROM SurrenderAt20Subscriptions WHERE Guild=$1", ctx.guild.id)
+            subscribed = await queries.SURRENDERAT20_CATEGORIES.fetchrow(db, ctx.guild.id)
 
-            if subscriptions is None:
+            if subscribed is None:
                 categories = "-"
             else:
-                if subscriptions[1]:
+                if subscribed.redposts:
                     categories = categories + "Red Posts\n"
-                if subscriptions[2]:
+                if subscribed.pbe:
                     categories = categories + "PBE\n"
-                if subscriptions[3]:
+                if subscribed.rotations:
                     categories = categories + "Rotations\n"
-                if subscriptions[4]:
+                if subscribed.esports:
                     categories = categories + "Esports\n"
-                if subscriptions[5]:
+                if subscribed.releases:
                     categories = categories + "Releases\n"
-                if subscriptions[6]:
+                if subscribed.other:
                     categories = categories + "Other"
 
                 if categories == "":
                     categories = "-"
 
             # get all keywords of the guild
-            cursor = await db.fetch("SELECT Keyword FROM Keywords WHERE Guild=$1", ctx.guild.id)
+            cursor = await queries.GUILD_KEYWORDS.fetch(db, ctx.guild.id)
 
             for row in cursor:
                 keywords = keywords + row[0] + "\n"
@@ -295,8 +293,8 @@ class SurrenderAt20(commands.Cog):
         """Sends the lastest Post"""
         async with self.bot.pool.acquire() as db:
             # check if announcement channel is set up
-            rows = await db.fetch("SELECT SurrenderAt20NotifChannel FROM Guilds WHERE ID=$1", ctx.guild.id)
-            if len(rows) == 0 or rows[0][0] is None:
+            channels = await queries.GUILD_CHANNELS.fetchrow(db, ctx.guild.id)
+            if channels is None or channels.surrenderat20 is None:
                 await ctx.send("You need to set up a notifications channel before fetching the latest post")
                 return
 
@@ -306,7 +304,7 @@ class SurrenderAt20(commands.Cog):
         async with self.bot.session.get(parsingChannelUrl, params=parsingChannelQueryString) as resp:
             posts = await resp.json()
         item = posts["items"][0]
-        content = item["content"]
+        document = self.bot.posts.get(item["id"], item["updated"], item["content"])
 
         # create message Embed
         emb = discord.Embed(title=item["title"],
@@ -325,44 +323,21 @@ class SurrenderAt20(commands.Cog):
             author_img = "https://images-ext-2.discordapp.net/external/t0bRQzNtKHoIDcFcj2X8R0O0UPqeeyKdvawNbVMoHXE/https/disqus.com/api/users/avatars/Moobeat.jpg"
         emb.set_author(name=item["author"]["displayName"], icon_url=author_img)
 
-        # get first image in post
-        startImgPos = content.find('<img', 0, len(content)) + 4
-        if(startImgPos > -1):
-            endImgPos = content.find('>', startImgPos, len(content))
-            imageTag = content[startImgPos:endImgPos]
-            startSrcPos = imageTag.find('src="', 0, len(content)) + 5
-            endSrcPos = imageTag.find('"', startSrcPos, len(content))
-            linkTag = imageTag[startSrcPos:endSrcPos]
+        if document.image is not None:
+            emb.set_image(url=document.image)
 
-            emb.set_image(url=linkTag)
+        # find the keywords of the guild that appear in the post
+        # this command quotes the parts between blank lines, not single lines like the notifications
+        matcher = await self.bot.subscriptions.matcher(self.bot.pool)
+        hits = matcher.by_guild(matcher.search(document, blocks=True))
+        for hit in hits.get(ctx.guild.id, []):
+            name, value = keywords.mention_field(hit)
+            emb.add_field(name=name, value=value, inline=False)
 
         async with self.bot.pool.acquire() as db:
-            keywords = await db.fetch("SELECT Keyword FROM Keywords WHERE Guild=$1", ctx.guild.id)
-            for keyword in keywords:
-                kw = " " + keyword[0] + " "
-                # check if keyword appears in post
-                brokentext = content.replace("<br />", "\n")
-                cleantext = re.sub(
-                    self.cleanr, '', brokentext).replace("&nbsp;", " ")
-                if kw in cleantext.lower():
-                    extracts = []
-                    # find paragraphs with keyword
-                    for part in cleantext.split("\n\n"):
-                        if kw in part.lower():
-                            extracts.append(part.strip())
-
-                    # create message embed and send it to the server
-                    exctrats_string = "\n\n".join(extracts)
-                    if len(exctrats_string) > 950:
-                        exctrats_string = exctrats_string[:950] + "... `" + str(
-                            cleantext.lower().count(kw)) + "` mentions in total"
-
-                    emb.add_field(
-                        name=f"'{keyword[0]}' was mentioned in this post!", value=exctrats_string, inline=False)
-
             # send post
-            channels = await db.fetchrow("SELECT SurrenderAt20NotifChannel FROM Guilds WHERE ID=$1", ctx.guild.id)
-            channel = self.bot.get_channel(channels[0])
+            channels = await queries.GUILD_CHANNELS.fetchrow(db, ctx.guild.id)
+            channel = self.bot.get_channel(channels.surrenderat20)
             await channel.send("New Surrender@20 post!", embed=emb)
         await ctx.send("Sent latest post into " + channel.mention)
 
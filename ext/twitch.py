@@ -3,6 +3,8 @@ from discord.ext import commands
 
 import auth_token
 import datetime
+from ext import queries
+from ext import subscriptions
 
 
 class Twitch(commands.Cog):
@@ -44,8 +46,8 @@ class Twitch(commands.Cog):
 
         async with self.bot.pool.acquire() as db:
             # add channel id for the guild to the database
-            await db.execute("UPDATE Guilds SET TwitchNotifChannel=$1 WHERE ID=$2",
-                             channel_obj.id, ctx.guild.id)
+            await queries.SET_CHANNEL[subscriptions.TWITCH].execute(db, channel_obj.id, ctx.guild.id)
+        self.bot.subscriptions.set_channel(ctx.guild.id, subscriptions.TWITCH, channel_obj.id)
 
         await ctx.send("Successfully set Twitch notifications to " + channel_obj.mention)
 
@@ -56,8 +58,8 @@ class Twitch(commands.Cog):
         Its livestreams will be announced in the specified channel"""
         async with self.bot.pool.acquire() as db:
             # check if announcement channel is set up
-            rows = await db.fetch("SELECT TwitchNotifChannel FROM Guilds WHERE ID=$1", ctx.guild.id)
-            if len(rows) == 0 or rows[0][0] is None:
+            channels = await queries.GUILD_CHANNELS.fetchrow(db, ctx.guild.id)
+            if channels is None or channels.twitch is None:
                 await ctx.send("You need to set up a notifications channel before subscribing! \nUse either ;setchannel or ;surrenderat20 setchannel")
                 return
 
@@ -82,22 +84,17 @@ class Twitch(commands.Cog):
         channel_name = ch["display_name"]
 
         async with self.bot.pool.acquire() as db:
-            # check if twitch channel is already in database
-            # otherwise add it
-            results = await db.fetch("SELECT 1 FROM TwitchChannels WHERE ID=$1", channel_id)
-            if len(results) == 0:
-                dt = datetime.datetime(
-                    2018, 9, 12, 13, 33, 7, 593639, tzinfo=datetime.timezone.utc)
-                await db.execute("INSERT INTO TwitchChannels (ID, Name, LastLive) VALUES ($1, $2, $3)",
-                                 channel_id, channel_name, dt)
+            # add twitch channel to the database if it isn't in there yet
+            dt = datetime.datetime(
+                2018, 9, 12, 13, 33, 7, 593639, tzinfo=datetime.timezone.utc)
+            await queries.ADD_TWITCH_CHANNEL.execute(db, channel_id, channel_name, dt)
 
             # insert subscription into database
-            results = await db.fetch("SELECT 1 FROM TwitchSubscriptions WHERE TwitchChannel=$1 AND Guild=$2", channel_id, ctx.guild.id)
-            if len(results) == 0:
-                await db.execute("INSERT INTO TwitchSubscriptions (TwitchChannel, Guild) VALUES ($1, $2)", channel_id, ctx.guild.id)
-            else:
+            inserted = await queries.TWITCH_SUBSCRIBE.fetchval(db, channel_id, ctx.guild.id)
+            if inserted is None:
                 await ctx.send("You are already subscribed to this channel")
                 return
+        self.bot.subscriptions.add(subscriptions.TWITCH, channel_id, ctx.guild.id)
 
         # send twitch subscription request
         parsingChannelUrl = "https://api.twitch.tv/helix/webhooks/hub"
@@ -143,19 +140,15 @@ class Twitch(commands.Cog):
         channel_name = ch["display_name"]
 
         async with self.bot.pool.acquire() as db:
-            # check if server is subscribed to channel
-            # remove subscription
-            results = await db.fetch("SELECT 1 FROM TwitchSubscriptions WHERE TwitchChannel=$1 AND Guild=$2", channel_id, ctx.guild.id)
-            if len(results) == 1:
-                await db.execute("DELETE FROM TwitchSubscriptions WHERE TwitchChannel=$1 AND Guild=$2", channel_id, ctx.guild.id)
-            else:
+            # remove subscription, if the server is subscribed to the channel
+            removed = await queries.TWITCH_UNSUBSCRIBE.fetchval(db, channel_id, ctx.guild.id)
+            if removed is None:
                 await ctx.send("You are not subscribed to this channel")
                 return
+            self.bot.subscriptions.remove(subscriptions.TWITCH, channel_id, ctx.guild.id)
 
             # remove channel from database if no server is subscribed to it anymore
-            results = await db.fetch("SELECT 1 FROM TwitchSubscriptions WHERE TwitchChannel=$1", channel_id)
-            if len(results) == 0:
-                await db.execute("DELETE FROM TwitchChannels WHERE ID=$1", channel_id)
+            await queries.REMOVE_TWITCH_CHANNEL.execute(db, channel_id)
 
         # send unsubscribe request
         parsingChannelUrl = "https://api.twitch.tv/helix/webhooks/hub"
@@ -180,10 +173,7 @@ class Twitch(commands.Cog):
         """Displays a list of all subscribed channels"""
         names = ""
         async with self.bot.pool.acquire() as db:
-            cursor = await db.fetch("SELECT TwitchChannels.Name \
-                                       FROM TwitchSubscriptions INNER JOIN TwitchChannels \
-                                       ON TwitchSubscriptions.TwitchChannel=TwitchChannels.ID \
-                                       WHERE Guild=$1", ctx.guild.id)
+            cursor = await queries.TWITCH_SUBSCRIPTIONS.fetch(db, ctx.guild.id)
 
             for row in cursor:
                 names = names + row[0] + "\n"
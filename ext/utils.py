@@ -3,6 +3,8 @@ from discord.ext import commands
 
 from datetime import datetime
 import asyncio
+from ext import queries
+from ext import subscriptions
 
 
 class Utils(commands.Cog):
@@ -44,8 +46,9 @@ class Utils(commands.Cog):
 
         async with self.bot.pool.acquire() as db:
             # add channel id for the guild to the database
-            await db.execute("UPDATE Guilds SET SurrenderAt20NotifChannel=$1, TwitchNotifChannel=$2, YoutubeNotifChannel=$3, RedditNotifChannel=$4 WHERE ID=$5",
-                             channel_obj.id, channel_obj.id, channel_obj.id, channel_obj.id, ctx.guild.id)
+            await queries.SET_ALL_CHANNELS.execute(db, channel_obj.id, ctx.guild.id)
+        for kind in subscriptions.KINDS:
+            self.bot.subscriptions.set_channel(ctx.guild.id, kind, channel_obj.id)
 
         await ctx.send("Successfully set all notifications to " + channel_obj.mention)
 
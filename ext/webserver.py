@@ -1,15 +1,34 @@
 import discord
 from discord.ext import commands
 
+import aiohttp
 from aiohttp import web
 import asyncio
 import auth_token
+import config
 import xmltodict
 import datetime
-import re
+import functools
 import sys
+import time
 import traceback
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from ext import database
+from ext import delivery
+from ext import keywords
+from ext import metrics
+from ext import posts
+from ext import queries
+from ext import subscriptions
+
+webhook_queue_seconds = metrics.Histogram(
+    "vol_webhook_queue_seconds", "Time from receiving a webhook until its handler starts", ("source",))
+webhook_handler_seconds = metrics.Histogram(
+    "vol_webhook_handler_seconds", "Runtime of webhook notification handlers", ("source",))
+webhook_errors_total = metrics.Counter(
+    "vol_webhook_errors_total", "Webhook notification handlers that raised", ("source",))
+post_requests_total = metrics.Counter(
+    "vol_surrenderat20_post_requests_total", "Requests for tracked surrender@20 posts by what they returned", ("result",))
 
 
 def callback(result):
@@ -24,7 +43,14 @@ class Webserver(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.cleanr = re.compile('<.*?>')
+        # post id -> (ETag, updated time, published time) of the surrender@20 posts update_posts tracks
+        self.post_versions = {}
+        # post id -> monotonic time the post is checked for edits next, None once it is too old or deleted
+        self.post_schedule = {}
+        # post id -> failed checks in a row of the posts blogger answered with an error
+        self.post_failures = {}
+        # wakes update_posts when a new post is tracked
+        self.new_post = asyncio.Event()
 
         # create the application and add routes
         self.app = web.Application()
@@ -37,13 +63,14 @@ class Webserver(commands.Cog):
         self.app.add_routes([web.post("/surrenderat20", self.surrenderat20)])
         self.app.add_routes(
             [web.get("/surrenderat20", self.surrenderat20verification)])
+        self.app.add_routes([web.get("/metrics", self.metrics)])
 
         # push notification run out after a specified time so I need to refresh them regularly
         self.scheduler = AsyncIOScheduler(event_loop=self.bot.loop)
-        self.scheduler.add_job(self.refresh_subscriptions, "interval", days=3, id="refresher",
+        self.scheduler.add_job(metrics.timed(metrics.scheduler_job_seconds, "refresher")(self.refresh_subscriptions), "interval", days=3, id="refresher",
                                replace_existing=True, next_run_time=datetime.datetime.utcnow() + datetime.timedelta(seconds=+10, hours=+2))
         self.scheduler.add_job(
-            self.ping_feedburner, "interval", minutes=3, id="pinger", replace_existing=True)
+            metrics.timed(metrics.scheduler_job_seconds, "pinger")(self.ping_feedburner), "interval", minutes=3, id="pinger", replace_existing=True)
         self.scheduler.start()
 
         # create the run task
@@ -66,7 +93,7 @@ class Webserver(commands.Cog):
     async def refresh_subscriptions(self):
         await self.bot.wait_until_ready()
         async with self.bot.pool.acquire() as db:
-            cursor = await db.fetch("SELECT DISTINCT TwitchChannel FROM TwitchSubscriptions")
+            cursor = await queries.TWITCH_CHANNEL_IDS.fetch(db)
             for row in cursor:
                 ID = row[0]
                 parsingChannelUrl = "https://api.twitch.tv/helix/webhooks/hub"
@@ -79,7 +106,7 @@ class Webserver(commands.Cog):
                         print(resp.text)
                 await asyncio.sleep(2)
 
-            cursor = await db.fetch("SELECT DISTINCT YoutubeChannel FROM YoutubeSubscriptions")
+            cursor = await queries.YOUTUBE_CHANNEL_IDS.fetch(db)
             for row in cursor:
                 ID = row[0]
                 parsingChannelUrl = "https://pubsubhubbub.appspot.com/subscribe"
@@ -122,119 +149,241 @@ class Webserver(commands.Cog):
             if resp.status != 200:
                 print(resp.text)
 
+    # whether a tracked post is due for a check, posts that were not checked yet always are
+    def post_due(self, post_id):
+        due = self.post_schedule.get(post_id, 0.0)
+        return due is not None and due <= time.monotonic()
+
+    # schedules the next check of a post
+    # the longer a post went without an edit the less likely it gets another one, so the interval grows
+    # with the time since it was published or last edited, posts past the cutoff are not checked anymore
+    def schedule_post(self, post_id, published, updated):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            published_dt = datetime.datetime.fromisoformat(published)
+            updated_dt = datetime.datetime.fromisoformat(updated)
+        except (TypeError, ValueError):
+            # without usable times the post is checked again at the shortest interval
+            self.post_schedule[post_id] = time.monotonic() + config.surrenderat20_update_min_interval
+            return
+        if (now - published_dt).total_seconds() > config.surrenderat20_update_cutoff:
+            self.post_schedule[post_id] = None
+            return
+        quiet = (now - max(published_dt, updated_dt)).total_seconds()
+        interval = min(max(quiet * config.surrenderat20_update_factor, config.surrenderat20_update_min_interval),
+                       config.surrenderat20_update_max_interval)
+        self.post_schedule[post_id] = time.monotonic() + interval
+
+    # a post that could not be checked
+    # deleted posts are not checked anymore, on other errors the checks back off exponentially
+    # and are never more frequent than the schedule of the last known version
+    def post_failed(self, post_id, status):
+        if status in (404, 410):
+            self.post_schedule[post_id] = None
+            return
+        failures = self.post_failures.get(post_id, 0) + 1
+        self.post_failures[post_id] = failures
+        known = self.post_versions.get(post_id)
+        if known is not None:
+            self.schedule_post(post_id, known[2], known[1])
+            if self.post_schedule[post_id] is None:
+                return
+        backoff = min(config.surrenderat20_update_min_interval * 2 ** failures, config.surrenderat20_update_max_interval)
+        self.post_schedule[post_id] = max(self.post_schedule.get(post_id) or 0.0, time.monotonic() + backoff)
+
+    # a post that was just announced, its first check is an interval away
+    def track_post(self, post_id):
+        self.post_schedule[post_id] = time.monotonic() + config.surrenderat20_update_min_interval
+        self.new_post.set()
+
+    # the updated and published time of a post, only those fields are requested
+    # with the ETag of the last answer blogger answers an unchanged post with an empty 304
+    # returns the response status and the updated time, which is None if the post has none
+    async def post_version(self, post_id):
+        parsingChannelUrl = "https://www.googleapis.com/blogger/v3/blogs/8141971962311514602/posts/" + post_id
+        parsingChannelQueryString = {
+            "key": auth_token.google, "fields": "updated,published"}
+        headers = {}
+        known = self.post_versions.get(post_id)
+        if known is not None and known[0] is not None:
+            headers["If-None-Match"] = known[0]
+        # a request that failed on the way counts as an error of the post, the pass ends with it
+        try:
+            async with self.bot.session.get(parsingChannelUrl, params=parsingChannelQueryString, headers=headers) as resp:
+                if resp.status == 304:
+                    post_requests_total.inc("not modified")
+                    self.post_failures.pop(post_id, None)
+                    self.schedule_post(post_id, known[2], known[1])
+                    return resp.status, known[1]
+                if resp.status != 200:
+                    post_requests_total.inc("error")
+                    self.post_failed(post_id, resp.status)
+                    return resp.status, None
+                post_obj = await resp.json()
+                etag = resp.headers.get("ETag")
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            post_requests_total.inc("error")
+            self.post_failed(post_id, None)
+            raise
+        post_requests_total.inc("version")
+        self.post_failures.pop(post_id, None)
+        updated = post_obj.get("updated")
+        published = post_obj.get("published", updated)
+        self.post_versions[post_id] = (etag, updated, published)
+        self.schedule_post(post_id, published, updated)
+        return resp.status, updated
+
+    # the content of a post that changed, None if it could not be fetched
+    async def post_content(self, post_id):
+        parsingChannelUrl = "https://www.googleapis.com/blogger/v3/blogs/8141971962311514602/posts/" + post_id
+        parsingChannelQueryString = {
+            "key": auth_token.google, "fields": "content,updated"}
+        async with self.bot.session.get(parsingChannelUrl, params=parsingChannelQueryString) as resp:
+            if resp.status != 200:
+                post_requests_total.inc("error")
+                return None
+            post_obj = await resp.json()
+        post_requests_total.inc("content")
+        if "content" not in post_obj or "updated" not in post_obj:
+            return None
+        return post_obj
+
     # update latest ff20 message on post update
+    # the versions of the posts are checked first, content is only fetched for posts that changed
+    # every post is checked on its own schedule, see schedule_post
     async def update_posts(self):
         await self.bot.wait_until_ready()
 
-        async with self.bot.pool.acquire() as db:
-            while not self.bot.is_closed():
-                cached_posts = {}
-                subscriptions = await db.fetch("SELECT * FROM SurrenderAt20Subscriptions")
-                for guild_subscriptions in subscriptions:
-                    if guild_subscriptions[7] is None:
+        while not self.bot.is_closed():
+            # post id -> (status, updated time) of the posts checked in this pass, None for posts that were not due
+            versions = {}
+            # whether the pass got through all tracked posts, blogger errors end it early
+            complete = True
+            rows = None
+            # a failed pass is logged and the loop goes on to the sleep, one error doesn't end the updater
+            try:
+                # the post state is read back from the database, so buffered updates go first
+                await self.bot.write_behind.flush()
+                matcher = await self.bot.subscriptions.matcher(self.bot.pool)
+                # the keyword hits of every post, found in one pass over its text
+                post_hits = {}
+                # connections are only held for the queries, not across the requests and the sleep
+                # the subscriptions are read in pages while the posts are updated
+                rows = database.stream(self.bot.pool, queries.SURRENDERAT20_TRACKED_POSTS, -1)
+                async for guild_subscriptions in rows:
+                    post_id = guild_subscriptions[1]
+                    if post_id not in versions:
+                        versions[post_id] = await self.post_version(post_id) if self.post_due(post_id) else None
+                    version = versions[post_id]
+                    if version is None:
                         continue
-
-                    try:
-                        post_obj = cached_posts[guild_subscriptions[7]]
-                    except KeyError:
-                        parsingChannelUrl = "https://www.googleapis.com/blogger/v3/blogs/8141971962311514602/posts/" + \
-                            guild_subscriptions[7]
-                        parsingChannelQueryString = {
-                            "key": auth_token.google, "fields": "content,updated"}
-                        async with self.bot.session.get(parsingChannelUrl, params=parsingChannelQueryString) as resp:
-                            post_obj = await resp.json()
-                            if resp.status == 500:
-                                break
-                            cached_posts[guild_subscriptions[7]] = post_obj
-
-                    try:
-                        updated_dt = datetime.datetime.strptime(
-                            post_obj["updated"][:18] + "-0700", "%Y-%m-%dT%H:%M:%S%z")
-                    except KeyError:
+                    status, updated = version
+                    if status >= 500:
+                        complete = False
+                        break
+                    if updated is None:
                         continue
-                    updated_timestamp = int(updated_dt.timestamp())
-                    if updated_timestamp <= guild_subscriptions[8]:
+
+                    # compared with the timestamps of the webhook, so parsed the same way the post cache keys are
+                    updated_timestamp = posts.timestamp(updated)
+                    if updated_timestamp <= guild_subscriptions[2]:
                         continue
 
-                    content = post_obj["content"]
-                    channels = await db.fetchrow("SELECT SurrenderAt20NotifChannel FROM Guilds WHERE ID=$1", guild_subscriptions[0])
-                    channel = self.bot.get_channel(channels[0])
+                    channel = self.bot.get_channel(
+                        self.bot.subscriptions.channel(guild_subscriptions[0], subscriptions.SURRENDERAT20))
                     if channel is None:
                         continue
 
                     try:
-                        message = await channel.get_message(guild_subscriptions[10])
+                        message = await channel.get_message(guild_subscriptions[4])
                     except Exception:   # frick you
                         continue
                     emb = message.embeds[0]
 
                     emb.clear_fields()
 
-                    # get first image in post
-                    startImgPos = content.find('<img', 0, len(content)) + 4
-                    if(startImgPos > -1):
-                        endImgPos = content.find(
-                            '>', startImgPos, len(content))
-                        imageTag = content[startImgPos:endImgPos]
-                        if "'" in imageTag:
-                            apostrophe = "'"
-                        else:
-                            apostrophe = '"'
-                        startSrcPos = imageTag.find(
-                            'src=' + apostrophe, 0, len(content)) + 5
-                        endSrcPos = imageTag.find(
-                            apostrophe, startSrcPos, len(content))
-                        linkTag = imageTag[startSrcPos:endSrcPos]
-
-                        emb.set_image(url=linkTag)
-
-                    brokentext = content.replace("<br />", "\n")
-                    cleantext = re.sub(self.cleanr, '', brokentext).replace(
-                        "&nbsp;", " ").replace("amp;", "")
-
-                    firstpart = " ".join(cleantext.split("\n")[0:5])
-                    start = firstpart.find("[")
-                    end = firstpart.rfind("]")
-                    note = firstpart[start:end + 1]
-                    if note != "":
-                        emb.add_field(name=note, value="-")
-
-                    keywords = await db.fetch("SELECT Keyword FROM Keywords WHERE Guild=$1", guild_subscriptions[0])
-                    for keyword in keywords:
-                        kw = " " + keyword[0] + " "
-                        # check if keyword appears in post
-                        if kw in cleantext.lower():
-                            extracts = []
-                            # find paragraphs with keyword
-                            for part in cleantext.split("\n"):
-                                if kw in part.lower():
-                                    extracts.append(part.strip())
-
-                            # create message embed and send it to the server
-                            exctracts_string = "\n\n".join(extracts)
-                            if len(exctracts_string) > 950:
-                                exctracts_string = exctracts_string[:950] + "... `" + str(
-                                    cleantext.lower().count(kw)) + "` mentions in total"
-
-                            emb.add_field(
-                                name=f"'{keyword[0]}' was mentioned in this post!", value=exctracts_string, inline=False)
+                    document = self.bot.posts.get(post_id, updated)
+                    if document is None:
+                        post_obj = await self.post_content(post_id)
+                        if post_obj is None:
+                            continue
+                        document = self.bot.posts.get(post_id, post_obj["updated"], post_obj["content"])
+                    if document.image is not None:
+                        emb.set_image(url=document.image)
+                    if document.note != "":
+                        emb.add_field(name=document.note, value="-")
+
+                    hits = post_hits.get(post_id)
+                    if hits is None:
+                        hits = matcher.by_guild(matcher.search(document))
+                        post_hits[post_id] = hits
+                    for hit in hits.get(guild_subscriptions[0], []):
+                        name, value = keywords.mention_field(hit)
+                        emb.add_field(name=name, value=value, inline=False)
 
                     emb.set_footer(text="Updates: " +
-                                   str(guild_subscriptions[9] + 1))
+                                   str(guild_subscriptions[3] + 1))
                     try:
                         await message.edit(embed=emb)
                     except Exception:
                         pass
-                    await db.execute("UPDATE SurrenderAt20Subscriptions SET LastUpdated=$1, Updates=$2 WHERE Guild=$3",
-                                     updated_timestamp, guild_subscriptions[9] + 1, guild_subscriptions[0])
+                    self.bot.write_behind.update(queries.SET_SURRENDERAT20_POST_UPDATE, guild_subscriptions[0],
+                                                 updated_timestamp, guild_subscriptions[3] + 1, guild_subscriptions[0])
                     await asyncio.sleep(0.5)
+            except Exception as ex:
+                complete = False
+                print('Ignoring exception in Webserver.update_posts()', file=sys.stderr)
+                traceback.print_exception(
+                    type(ex), ex, ex.__traceback__, file=sys.stderr)
+            finally:
+                if rows is not None:
+                    await rows.aclose()
+            # posts no guild tracks anymore are forgotten
+            # after an incomplete pass the posts it did not reach keep their state
+            if complete:
+                self.post_versions = {post_id: version for post_id, version in self.post_versions.items()
+                                      if post_id in versions}
+                self.post_failures = {post_id: failures for post_id, failures in self.post_failures.items()
+                                      if post_id in versions}
+                # posts announced during the pass are kept until they are due
+                now = time.monotonic()
+                self.post_schedule = {post_id: due for post_id, due in self.post_schedule.items()
+                                      if post_id in versions or due is not None and due > now}
+
+            # sleep until the next post is due or a new post is announced
+            due_times = [due for due in self.post_schedule.values() if due is not None]
+            timeout = config.surrenderat20_update_max_interval
+            if len(due_times) > 0:
+                timeout = min(max(min(due_times) - time.monotonic(), 1.0), timeout)
+            # blogger is not asked again right away after it failed
+            if not complete:
+                timeout = max(timeout, config.surrenderat20_update_min_interval)
+            try:
+                await asyncio.wait_for(self.new_post.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.new_post.clear()
+
+    # runs a notification handler, recording how long it waited and ran
+    async def handle(self, source, received, notifs):
+        webhook_queue_seconds.observe(time.monotonic() - received, source)
+        try:
+            with webhook_handler_seconds.time(source):
+                await notifs
+        except Exception:
+            webhook_errors_total.inc(source)
+            raise
 
-                await asyncio.sleep(60 * 2.5)
+    # exposes the metrics of all subsystems
+    async def metrics(self, request):
+        return web.Response(text=metrics.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
 
     # handler for post requests to the /youtube route
     async def youtube(self, request):
+        received = time.monotonic()
         obj = xmltodict.parse(await request.text())
-        youtube_notifs = self.bot.loop.create_task(self.youtube_notifs(obj))
+        youtube_notifs = self.bot.loop.create_task(
+            self.handle("youtube", received, self.youtube_notifs(obj)))
         youtube_notifs.add_done_callback(callback)
 
         return web.Response()
@@ -251,8 +400,10 @@ class Webserver(commands.Cog):
                                          "key": auth_token.google}
             async with self.bot.session.get(parsingChannelUrl, params=parsingChannelQueryString) as resp:
                 ch = await resp.json()
+            # buffered video counts must not overwrite this one later
+            await self.bot.write_behind.flush()
             async with self.bot.pool.acquire() as db:
-                await db.execute("UPDATE YoutubeChannels SET VideoCount=$1 WHERE ID=$2", int(ch["items"][0]["statistics"]["videoCount"]), ch["items"][0]["id"])
+                await queries.SET_YOUTUBE_VIDEO_COUNT.execute(db, int(ch["items"][0]["statistics"]["videoCount"]), ch["items"][0]["id"])
             return
         except KeyError:
             pass
@@ -300,64 +451,66 @@ class Webserver(commands.Cog):
         else:
             return web
 
-        async with self.bot.pool.acquire() as db:
-            # if it is a livestream the bot shouldn't announce a livestream more than once in an hour
-            # to keep channels from getting spammed from stream restarts
-            if video["liveBroadcastContent"] == "live":
-                dt = await db.fetchval("SELECT LastLive FROM YoutubeChannels WHERE ID=$1", obj["feed"]["entry"]["yt:channelId"])
-                now = datetime.datetime.now(datetime.timezone.utc)
-                if ((now - dt).total_seconds() > 60 * 60):
-                    await db.execute("UPDATE YoutubeChannels SET LastLive=$1 WHERE ID=$2",
-                                     now, obj["feed"]["entry"]["yt:channelId"])
-                else:
-                    # stream was restarted
-                    return
+        channel_id = obj["feed"]["entry"]["yt:channelId"]
+        # the state is read from the write-behind buffer first, it might not be written yet
+        # if it is a livestream the bot shouldn't announce a livestream more than once in an hour
+        # to keep channels from getting spammed from stream restarts
+        if video["liveBroadcastContent"] == "live":
+            pending = self.bot.write_behind.get(queries.SET_YOUTUBE_LAST_LIVE, channel_id)
+            if pending is not None:
+                dt = pending[0]
             else:
-                # youtube does not tell if the notification is about a new video
-                # or edits to an old one
-                # so this checks if it's a new video or just an edit
-                r = await db.fetch("SELECT LastVideoID, VideoCount FROM YoutubeChannels WHERE ID=$1", obj["feed"]["entry"]["yt:channelId"])
-                stats = r[0]
-                if obj["feed"]["entry"]["yt:videoId"] != stats[0] and int(channel_obj["statistics"]["videoCount"]) > stats[1]:
-                    await db.execute("UPDATE YoutubeChannels SET LastVideoID=$1, VideoCount=$2 WHERE ID=$3",
-                                     obj["feed"]["entry"]["yt:videoId"], int(channel_obj["statistics"]["videoCount"]), obj["feed"]["entry"]["yt:channelId"])
-                else:
-                    # A video has been edited
-                    return
-
-            # send messages in all subscribed servers
-            cursor = await db.fetch("SELECT Guilds.YoutubeNotifChannel, YoutubeSubscriptions.OnlyStreams, Guilds.ID \
-                                       FROM YoutubeSubscriptions INNER JOIN Guilds \
-                                       ON YoutubeSubscriptions.Guild=Guilds.ID \
-                                       WHERE YoutubeChannel=$1", obj["feed"]["entry"]["yt:channelId"])
-
-            for row in cursor:
-                # if the server set the subscription to "Only streams"
-                # videos will not be announced
-                if row[1] == 1 and video["liveBroadcastContent"] == "none":
-                    continue
-                announceChannel = self.bot.get_channel(row[0])
-                if announceChannel is None:
-                    guild = self.bot.get_guild(row[2])
-                    if guild is None:
-                        await db.execute("DELETE FROM YoutubeSubscriptions WHERE YoutubeChannel=$1 AND Guild=$2", obj["feed"]["entry"]["yt:channelId"], row[2])
-                    continue
-                try:
-                    await announceChannel.send(announcement, embed=emb)
-                except:
-                    print("----------------------------------------")
-                    print("A server fucked up")
-                    print("Couldn't send youtube notification")
-                    print("Guild object", guild)
-                    print("Guild ID: ", guild.id)
-                    print("Announcement Channel: ", announceChannel.id)
-                    print("----------------------------------------")
+                async with self.bot.pool.acquire() as db:
+                    dt = await queries.YOUTUBE_LAST_LIVE.fetchval(db, channel_id)
+            now = datetime.datetime.now(datetime.timezone.utc)
+            if ((now - dt).total_seconds() > 60 * 60):
+                self.bot.write_behind.update(queries.SET_YOUTUBE_LAST_LIVE, channel_id, now, channel_id)
+            else:
+                # stream was restarted
+                return
+        else:
+            # youtube does not tell if the notification is about a new video
+            # or edits to an old one
+            # so this checks if it's a new video or just an edit
+            stats = self.bot.write_behind.get(queries.SET_YOUTUBE_LAST_VIDEO, channel_id)
+            if stats is None:
+                async with self.bot.pool.acquire() as db:
+                    stats = await queries.YOUTUBE_VIDEO_STATS.fetchrow(db, channel_id)
+            if obj["feed"]["entry"]["yt:videoId"] != stats[0] and int(channel_obj["statistics"]["videoCount"]) > stats[1]:
+                self.bot.write_behind.update(queries.SET_YOUTUBE_LAST_VIDEO, channel_id,
+                                             obj["feed"]["entry"]["yt:videoId"], int(channel_obj["statistics"]["videoCount"]), channel_id)
+            else:
+                # A video has been edited
+                return
 
+        # livestreams overtake other notifications
+        if video["liveBroadcastContent"] == "live":
+            priority = delivery.LIVE
+        else:
+            priority = delivery.VIDEO
+
+        # send messages in all subscribed servers
+        for guild_id, notif_channel, onlystreams in self.bot.subscriptions.recipients(subscriptions.YOUTUBE, channel_id):
+            # if the server set the subscription to "Only streams"
+            # videos will not be announced
+            if onlystreams and video["liveBroadcastContent"] == "none":
+                continue
+            announceChannel = self.bot.get_channel(notif_channel)
+            if announceChannel is None:
+                guild = self.bot.get_guild(guild_id)
+                if guild is None:
+                    async with self.bot.pool.acquire() as db:
+                        await queries.YOUTUBE_UNSUBSCRIBE.execute(db, channel_id, guild_id)
+                    self.bot.subscriptions.remove(subscriptions.YOUTUBE, channel_id, guild_id)
+                continue
+            self.bot.delivery.send(announceChannel, announcement, embed=emb, priority=priority)
 
     # handler for post requests to the /twitch route
     async def twitch(self, request):
+        received = time.monotonic()
         obj = await request.json()
-        twitch_notifs = self.bot.loop.create_task(self.twitch_notifs(obj))
+        twitch_notifs = self.bot.loop.create_task(
+            self.handle("twitch", received, self.twitch_notifs(obj)))
         twitch_notifs.add_done_callback(callback)
 
         return web.Response()
@@ -415,31 +568,35 @@ class Webserver(commands.Cog):
         emb.set_footer(icon_url=ch["profile_image_url"], text="Twitch")
         emb.set_thumbnail(url=game_url)
 
-        async with self.bot.pool.acquire() as db:
-            # streams should only be announced every hour
-            # to keep channels from getting spammed with stream restarts
-            dt = await db.fetchval("SELECT LastLive FROM TwitchChannels WHERE ID=$1", ch["id"])
-            now = datetime.datetime.now(datetime.timezone.utc)
-            if (now - dt).total_seconds() > 60 * 60:
-                await db.execute("UPDATE TwitchChannels SET LastLive=$1 WHERE ID=$2", now, ch["id"])
-            else:
-                # stream was restarted
-                return
-
-            # sending messages to all subscribed servers
-            cursor = await db.fetch("SELECT Guilds.TwitchNotifChannel \
-                                       FROM TwitchSubscriptions INNER JOIN Guilds \
-                                       ON TwitchSubscriptions.Guild=Guilds.ID \
-                                       WHERE TwitchChannel=$1", data["user_id"])
+        # streams should only be announced every hour
+        # to keep channels from getting spammed with stream restarts
+        pending = self.bot.write_behind.get(queries.SET_TWITCH_LAST_LIVE, ch["id"])
+        if pending is not None:
+            dt = pending[0]
+        else:
+            async with self.bot.pool.acquire() as db:
+                dt = await queries.TWITCH_LAST_LIVE.fetchval(db, ch["id"])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if (now - dt).total_seconds() > 60 * 60:
+            self.bot.write_behind.update(queries.SET_TWITCH_LAST_LIVE, ch["id"], now, ch["id"])
+        else:
+            # stream was restarted
+            return
 
-            for row in cursor:
-                announceChannel = self.bot.get_channel(row[0])
-                await announceChannel.send(ch["display_name"] + " is now live with " + game_name + " !", embed=emb)
+        # sending messages to all subscribed servers
+        announcement = ch["display_name"] + " is now live with " + game_name + " !"
+        for _, notif_channel, _ in self.bot.subscriptions.recipients(subscriptions.TWITCH, data["user_id"]):
+            announceChannel = self.bot.get_channel(notif_channel)
+            if announceChannel is None:
+                continue
+            self.bot.delivery.send(announceChannel, announcement, embed=emb, priority=delivery.LIVE)
 
     # handler for post requests to the /surrenderat20 route
     async def surrenderat20(self, request):
+        received = time.monotonic()
         obj = await request.json()
-        ff20_notifs = self.bot.loop.create_task(self.surrenderat20_notifs(obj))
+        ff20_notifs = self.bot.loop.create_task(
+            self.handle("surrenderat20", received, self.surrenderat20_notifs(obj)))
         ff20_notifs.add_done_callback(callback)
 
         return web.Response()
@@ -464,113 +621,83 @@ class Webserver(commands.Cog):
             author_img = "https://images-ext-2.discordapp.net/external/t0bRQzNtKHoIDcFcj2X8R0O0UPqeeyKdvawNbVMoHXE/https/disqus.com/api/users/avatars/Moobeat.jpg"
         emb.set_author(name=item["actor"]["displayName"], icon_url=author_img)
 
-        try:
-            content = item["content"]
-        except KeyError:
-            parsingChannelUrl = "https://www.googleapis.com/blogger/v3/blogs/8141971962311514602/posts/" + \
-                item["id"][-19:]
+        # the post is parsed once per version, the content is only fetched if it isn't in the notification
+        post_id = item["id"][-19:]
+        document = self.bot.posts.get(post_id, item["updated"], item.get("content"))
+        if document is None:
+            parsingChannelUrl = "https://www.googleapis.com/blogger/v3/blogs/8141971962311514602/posts/" + post_id
             parsingChannelQueryString = {
                 "key": auth_token.google, "fields": "content"}
             async with self.bot.session.get(parsingChannelUrl, params=parsingChannelQueryString) as resp:
                 post_obj = await resp.json()
-            content = post_obj["content"]
-
-        # get first image in post
-        startImgPos = content.find('<img', 0, len(content)) + 4
-        if(startImgPos > -1):
-            endImgPos = content.find('>', startImgPos, len(content))
-            imageTag = content[startImgPos:endImgPos]
-            if "'" in imageTag:
-                apostrophe = "'"
-            else:
-                apostrophe = '"'
-            startSrcPos = imageTag.find(
-                'src=' + apostrophe, 0, len(content)) + 5
-            endSrcPos = imageTag.find(apostrophe, startSrcPos, len(content))
-            linkTag = imageTag[startSrcPos:endSrcPos]
-
-            emb.set_image(url=linkTag)
-
-        async with self.bot.pool.acquire() as db:
-            subscriptions = await db.fetch("SELECT * FROM SurrenderAt20Subscriptions")
-            for guild_subscriptions in subscriptions:
-                try:
-                    for category in item["categories"]:
-                        if category == "Red Posts":
-                            if guild_subscriptions[1]:
-                                break
-                        elif category == "PBE":
-                            if guild_subscriptions[2]:
-                                break
-                        elif category == "Rotations":
-                            if guild_subscriptions[3]:
-                                break
-                        elif category == "Esports":
-                            if guild_subscriptions[4]:
-                                break
-                        elif category == "Releases":
-                            if guild_subscriptions[5]:
-                                break
-                        else:
-                            if guild_subscriptions[6]:
-                                break
+            document = self.bot.posts.get(post_id, item["updated"], post_obj["content"])
+
+        if document.image is not None:
+            emb.set_image(url=document.image)
+
+        # the post is searched for the keywords of all guilds once
+        matcher = await self.bot.subscriptions.matcher(self.bot.pool)
+        hits = matcher.by_guild(matcher.search(document))
+
+        pending = []
+        for guild_id, notif_channel, categories in self.bot.subscriptions.recipients(subscriptions.SURRENDERAT20):
+            try:
+                for category in item["categories"]:
+                    if category == "Red Posts":
+                        if categories[0]:
+                            break
+                    elif category == "PBE":
+                        if categories[1]:
+                            break
+                    elif category == "Rotations":
+                        if categories[2]:
+                            break
+                    elif category == "Esports":
+                        if categories[3]:
+                            break
+                    elif category == "Releases":
+                        if categories[4]:
+                            break
                     else:
-                        continue
-                except KeyError:
-                    pass
-
-                brokentext = content.replace("<br />", "\n")
-                cleantext = re.sub(
-                    self.cleanr, '', brokentext).replace("&nbsp;", " ")
-
-                firstpart = " ".join(cleantext.split("\n")[0:5])
-                start = firstpart.find("[")
-                end = firstpart.rfind("]")
-                note = firstpart[start:end + 1]
-                if note != "":
-                    emb.add_field(name=note, value="-")
-
-                keywords = await db.fetch("SELECT Keyword FROM Keywords WHERE Guild=$1", guild_subscriptions[0])
-                for keyword in keywords:
-                    kw = " " + keyword[0] + " "
-                    # check if keyword appears in post
-                    if kw in cleantext.lower():
-                        extracts = []
-                        # find paragraphs with keyword
-                        for part in cleantext.split("\n"):
-                            if kw in part.lower():
-                                extracts.append(part.strip())
-
-                        # create message embed and send it to the server
-                        exctracts_string = "\n\n".join(extracts)
-                        if len(exctracts_string) > 950:
-                            exctracts_string = exctracts_string[:950] + "... `" + str(
-                                cleantext.lower().count(kw)) + "` mentions in total"
-
-                        emb.add_field(
-                            name=f"'{keyword[0]}' was mentioned in this post!", value=exctracts_string, inline=False)
-
-                # send post to discord channel
-                channels = await db.fetchrow("SELECT SurrenderAt20NotifChannel FROM Guilds WHERE ID=$1", guild_subscriptions[0])
-                channel = self.bot.get_channel(channels[0])
-                if channel is None:
-                    await db.execute("UPDATE SurrenderAt20Subscriptions SET Other=$1 WHERE Guild=$2", False, guild_subscriptions[0])
-                    continue
-                try:
-                    msg = await channel.send("New Surrender@20 post!", embed=emb)
-                except discord.errors.Forbidden:
+                        if categories[5]:
+                            break
+                else:
                     continue
-                finally:
-                    emb.clear_fields()
-
-                # set information for post updates
-                lastpostid = item["id"][-19:]
-                lastpostmessage = msg.id
-                lastupdated = item["updated"]
-                await db.execute("UPDATE SurrenderAt20Subscriptions \
-                                  SET LastPostID=$1, LastUpdated=$2, Updates=$3, LastPostMessage=$4 \
-                                  WHERE Guild=$5",
-                                 lastpostid, lastupdated, 0, lastpostmessage, guild_subscriptions[0])
+            except KeyError:
+                pass
+
+            # every guild gets its own copy with its keyword fields
+            guild_emb = emb.copy()
+            if document.note != "":
+                guild_emb.add_field(name=document.note, value="-")
+            for hit in hits.get(guild_id, []):
+                name, value = keywords.mention_field(hit)
+                guild_emb.add_field(name=name, value=value, inline=False)
+
+            # send post to discord channel
+            channel = self.bot.get_channel(notif_channel)
+            if channel is None:
+                async with self.bot.pool.acquire() as db:
+                    await queries.SURRENDERAT20_DROP_OTHER.execute(db, guild_id)
+                self.bot.subscriptions.add(subscriptions.SURRENDERAT20, None, guild_id, categories[:5] + (False,))
+                continue
+            sent = self.bot.delivery.send(channel, "New Surrender@20 post!", embed=guild_emb,
+                                          priority=delivery.SURRENDERAT20)
+            # every guild's post state is set as soon as its own message is sent
+            sent.add_done_callback(functools.partial(self.record_post, guild_id, post_id, item["updated"]))
+            pending.append(sent)
+
+        # the post is checked for updates once all messages are sent or given up on
+        await asyncio.gather(*pending)
+        if len(pending) > 0:
+            self.track_post(post_id)
+
+    # set information for post updates of a guild whose message was sent
+    def record_post(self, guild_id, post_id, updated, sent):
+        if sent.cancelled() or sent.result() is None:
+            return
+        self.bot.write_behind.update(queries.SET_SURRENDERAT20_LAST_POST, guild_id,
+                                     post_id, updated, 0, sent.result().id, guild_id)
 
     # various verification endpoints
 
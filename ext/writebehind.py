@@ -0,0 +1,82 @@
+import asyncio
+import config
+import sys
+import traceback
+from ext import metrics
+
+write_behind_flush_seconds = metrics.Histogram(
+    "vol_write_behind_flush_seconds", "Time to write the buffered state updates")
+write_behind_rows_total = metrics.Counter(
+    "vol_write_behind_rows_total", "Buffered state updates written to the database")
+
+
+class WriteBehind:
+    """Holds state updates in memory and writes them to the database in batches"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        # (named query, key) -> query arguments, a newer update of a row replaces the buffered one
+        # kept in order of the last update, so updates of the same row through different queries keep their order
+        self.pending = {}
+        # updates currently being written
+        self.flushing = {}
+        self.flush_lock = asyncio.Lock()
+        self.flusher = bot.loop.create_task(self.run())
+
+    def update(self, query, key, *args):
+        self.pending.pop((query, key), None)
+        self.pending[(query, key)] = args
+
+    # arguments of the newest update not yet in the database, if any
+    def get(self, query, key):
+        args = self.pending.get((query, key))
+        if args is None:
+            args = self.flushing.get((query, key))
+        return args
+
+    def __len__(self):
+        return len(self.pending) + len(self.flushing)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(config.write_behind_interval)
+            try:
+                await self.flush()
+            except Exception as ex:
+                print('Ignoring exception in WriteBehind.run()', file=sys.stderr)
+                traceback.print_exception(
+                    type(ex), ex, ex.__traceback__, file=sys.stderr)
+
+    async def flush(self):
+        async with self.flush_lock:
+            if len(self.pending) == 0:
+                return
+            self.flushing, self.pending = self.pending, {}
+            try:
+                with write_behind_flush_seconds.time():
+                    async with self.bot.pool.acquire() as db:
+                        async with db.transaction():
+                            # consecutive updates through the same query go out together
+                            batch_query = None
+                            batch = []
+                            for (query, _), args in self.flushing.items():
+                                if query != batch_query and len(batch) > 0:
+                                    await batch_query.executemany(db, batch)
+                                    batch = []
+                                batch_query = query
+                                batch.append(args)
+                            await batch_query.executemany(db, batch)
+                write_behind_rows_total.inc(amount=len(self.flushing))
+            except Exception:
+                # keep the updates for the next flush unless they were replaced meanwhile
+                failed = {item: args for item, args in self.flushing.items() if item not in self.pending}
+                failed.update(self.pending)
+                self.pending = failed
+                raise
+            finally:
+                self.flushing = {}
+
+    # write everything that is still buffered, used on shutdown
+    async def close(self):
+        self.flusher.cancel()
+        await self.flush()
@@ -4,6 +4,8 @@ from discord.ext import commands
 import auth_token
 import datetime
 import re
+from ext import queries
+from ext import subscriptions
 
 
 class Youtube(commands.Cog):
@@ -45,8 +47,8 @@ class Youtube(commands.Cog):
 
         async with self.bot.pool.acquire() as db:
             # add channel id for the guild to the database
-            await db.execute("UPDATE Guilds SET YoutubeNotifChannel=$1 WHERE ID=$2",
-                             channel_obj.id, ctx.guild.id)
+            await queries.SET_CHANNEL[subscriptions.YOUTUBE].execute(db, channel_obj.id, ctx.guild.id)
+        self.bot.subscriptions.set_channel(ctx.guild.id, subscriptions.YOUTUBE, channel_obj.id)
 
         await ctx.send("Successfully set Youtube notifications to " + channel_obj.mention)
 
@@ -59,8 +61,8 @@ class Youtube(commands.Cog):
         Use "~onlystreams" in order to ignore videos of this channel"""
         async with self.bot.pool.acquire() as db:
             # check if announcement channel is set up
-            rows = await db.fetch("SELECT YoutubeNotifChannel FROM Guilds WHERE ID=$1", ctx.guild.id)
-            if len(rows) == 0 or rows[0][0] is None:
+            channels = await queries.GUILD_CHANNELS.fetchrow(db, ctx.guild.id)
+            if channels is None or channels.youtube is None:
                 await ctx.send("You need to set up a notifications channel before subscribing! \nUse either ;setchannel or ;surrenderat20 setchannel")
                 return
 
@@ -109,22 +111,17 @@ class Youtube(commands.Cog):
         videoID = playlist_obj["items"][0]["id"]
 
         async with self.bot.pool.acquire() as db:
-            # check if youtube channel is already in database, otherwise add it
-            results = await db.fetch("SELECT 1 FROM YoutubeChannels WHERE ID=$1", channel_id)
-            if len(results) == 0:
-                dt = datetime.datetime(
-                    2018, 9, 12, 13, 33, 7, 593639, tzinfo=datetime.timezone.utc)
-                await db.execute("INSERT INTO YoutubeChannels (ID, Name, LastLive, LastVideoID, VideoCount) VALUES ($1, $2, $3, $4, $5)",
-                                 channel_id, channel_name, dt, videoID, videoCount)
+            # add youtube channel to the database if it isn't in there yet
+            dt = datetime.datetime(
+                2018, 9, 12, 13, 33, 7, 593639, tzinfo=datetime.timezone.utc)
+            await queries.ADD_YOUTUBE_CHANNEL.execute(db, channel_id, channel_name, dt, videoID, videoCount)
 
             # insert subscription into the database
-            results = await db.fetch("SELECT 1 FROM YoutubeSubscriptions WHERE YoutubeChannel=$1 AND Guild=$2", channel_id, ctx.guild.id)
-            if len(results) == 0:
-                await db.execute("INSERT INTO YoutubeSubscriptions (YoutubeChannel, Guild, OnlyStreams) VALUES ($1, $2, $3)",
-                                 channel_id, ctx.guild.id, onlystreams)
-            else:
+            inserted = await queries.YOUTUBE_SUBSCRIBE.fetchval(db, channel_id, ctx.guild.id, onlystreams)
+            if inserted is None:
                 await ctx.send("You are already subscribed to this channel")
                 return
+        self.bot.subscriptions.add(subscriptions.YOUTUBE, channel_id, ctx.guild.id, onlystreams)
 
         # send subscription request to youtube
         parsingChannelUrl = "https://pubsubhubbub.appspot.com/subscribe"
@@ -167,19 +164,15 @@ class Youtube(commands.Cog):
         channel_name = ch["snippet"]["channelTitle"]
 
         async with self.bot.pool.acquire() as db:
-            # check if server is already subscribed to the channel
-            # remove subscrption from database
-            results = await db.fetch("SELECT 1 FROM YoutubeSubscriptions WHERE YoutubeChannel=$1 AND Guild=$2", channel_id, ctx.guild.id)
-            if len(results) == 1:
-                await db.execute("DELETE FROM YoutubeSubscriptions WHERE YoutubeChannel=$1 AND Guild=$2", channel_id, ctx.guild.id)
-            else:
+            # remove subscrption from database, if the server is subscribed to the channel
+            removed = await queries.YOUTUBE_UNSUBSCRIBE.fetchval(db, channel_id, ctx.guild.id)
+            if removed is None:
                 await ctx.send("You are not subscribed to this channel")
                 return
+            self.bot.subscriptions.remove(subscriptions.YOUTUBE, channel_id, ctx.guild.id)
 
             # remove channel from database if no server is subscribed to it anymore
-            results = await db.fetch("SELECT 1 FROM YoutubeSubscriptions WHERE YoutubeChannel=$1", channel_id)
-            if len(results) == 0:
-                await db.execute("DELETE FROM YoutubeChannels WHERE ID=$1", channel_id)
+            await queries.REMOVE_YOUTUBE_CHANNEL.execute(db, channel_id)
 
         # send unsubscribe request
         parsingChannelUrl = "https://pubsubhubbub.appspot.com/subscribe"
@@ -203,10 +196,7 @@ class Youtube(commands.Cog):
         names = ""
         async with self.bot.pool.acquire() as db:
             # get all subscribed to channels of the guild
-            cursor = await db.fetch("SELECT YoutubeChannels.Name, YoutubeSubscriptions.OnlyStreams \
-                                       FROM YoutubeSubscriptions INNER JOIN YoutubeChannels \
-                                       ON YoutubeSubscriptions.YoutubeChannel=YoutubeChannels.ID \
-                                       WHERE Guild=$1", ctx.guild.id)
+            cursor = await queries.YOUTUBE_SUBSCRIPTIONS.fetch(db, ctx.guild.id)
             for row in cursor:
                 if row[1] == 1:
                     os = " (Only streams)"
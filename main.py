@@ -7,9 +7,21 @@ import traceback
 import sys
 import logging
 import asyncio
-import asyncpg
+import time
 import auth_token
+import config
 import aiohttp
+from ext.delivery import Dispatcher
+from ext import database
+from ext.subscriptions import SubscriptionIndex
+from ext.guilds import GuildRemover
+from ext.posts import PostCache
+from ext.writebehind import WriteBehind
+from ext import guilds
+from ext import delivery
+from ext import metrics
+from ext import migrations
+from ext import queries
 
 
 # set up logging
@@ -39,27 +51,48 @@ async def on_ready():
     print(bot.user.id)
     print('------')
     bot.session = aiohttp.ClientSession(loop=bot.loop)
+    await reconcile_guilds()
+
+
+# bring the Guilds table in line with the guilds the bot is actually on
+# returns the number of added and removed guilds
+async def reconcile_guilds():
+    start = time.monotonic()
+    async with bot.pool.acquire() as db:
+        async with db.transaction():
+            await bot.pool.load_live_guilds(db, [(guild.id, guild.name) for guild in bot.guilds])
+
+            joined = await queries.ADD_LIVE_GUILDS.fetch(db)
+            left = await queries.LEFT_GUILDS.fetch(db)
+            guild_ids, subreddit_ids = await bot.pool.remove_guilds(db, [row[0] for row in left])
+
+    for row in joined:
+        bot.subscriptions.add_guild(row[0])
+        print(f">> Joined {row[1]}")
+    guilds.forget(bot, guild_ids, subreddit_ids)
+    for row in left:
+        print(f"<< Left {row[1]}")
+    print(f"Reconciled {len(bot.guilds)} guilds in {time.monotonic() - start:.2f}s: "
+          f"{len(joined)} added, {len(left)} removed")
+    return len(joined), len(left)
 
 
 # add new guilds to database
 @bot.event
 async def on_guild_join(guild):
+    bot.guild_remover.cancel(guild.id)
     async with bot.pool.acquire() as db:
-        await db.execute("INSERT INTO Guilds (ID, Name) VALUES ($1, $2)", guild.id, guild.name)
+        # the guild might still be stored if the bot was removed while offline
+        await queries.ADD_GUILD.execute(db, guild.id, guild.name)
+    bot.subscriptions.add_guild(guild.id)
     print(f">> Joined {guild.name}")
 
 
 # remove guild data when leaving guilds
+# removals are batched since they tend to arrive all at once
 @bot.event
 async def on_guild_remove(guild):
-    async with bot.pool.acquire() as db:
-        await db.execute("DELETE FROM Guilds WHERE ID=$1", guild.id)
-        await db.execute("DELETE FROM YoutubeSubscriptions WHERE Guild=$1", guild.id)
-        await db.execute("DELETE FROM TwitchSubscriptions WHERE Guild=$1", guild.id)
-        await db.execute("DELETE FROM SubredditSubscriptions WHERE Guild=$1", guild.id)
-        await db.execute("DELETE FROM Keywords WHERE Guild=$1", guild.id)
-        await db.execute("DELETE FROM SurrenderAt20Subscriptions WHERE Guild=$1", guild.id)
-    print(f"<< Left {guild.name}")
+    bot.guild_remover.remove(guild)
 
 
 @bot.event
@@ -118,71 +151,70 @@ async def kill(ctx):
     await ws.runner.cleanup()
     rd = bot.get_cog("Reddit")
     rd.reddit_poller.cancel()
+    await bot.delivery.close()
+    await bot.guild_remover.close()
+    await bot.write_behind.close()
     try:
         await asyncio.wait_for(bot.pool.close(), 10.0)
     except asyncio.TimeoutError:
-        await bot.pool.expire_connections()
         bot.pool.terminate()
     await bot.session.close()
     await bot.close()
 
 
 # fetch guilds and add guilds, not yet in database
+# this also runs on its own whenever the bot is ready
 @commands.is_owner()
 @bot.command(hidden=True)
 async def fetchguilds(ctx):
-    async with bot.pool.acquire() as db:
-        guilds_db = await db.fetch("SELECT ID, Name FROM Guilds")
-        guilds_bot = bot.guilds
-        for g_bot in guilds_bot:
-            for g_db in guilds_db:
-                if g_db[0] == g_bot.id:
-                    break
-            else:
-                await db.execute("INSERT INTO Guilds (ID, Name) VALUES ($1, $2)", g_bot.id, g_bot.name)
-                print(f">> Joined {g_bot.name}")
-
-        for g_db in guilds_db:
-            guild_obj = bot.get_guild(g_db[0])
-            if guild_obj is None:
-                await db.execute("DELETE FROM Guilds WHERE ID=$1", g_db[0])
-                await db.execute("DELETE FROM YoutubeSubscriptions WHERE Guild=$1", g_db[0])
-                await db.execute("DELETE FROM TwitchSubscriptions WHERE Guild=$1", g_db[0])
-                await db.execute("DELETE FROM SubredditSubscriptions WHERE Guild=$1", g_db[0])
-                await db.execute("DELETE FROM Keywords WHERE Guild=$1", g_db[0])
-                await db.execute("DELETE FROM SurrenderAt20Subscriptions WHERE Guild=$1", g_db[0])
-                print(f"<< Left {g_db[1]}")
-
-    await ctx.send("Done fetching guilds!")
+    joined, left = await reconcile_guilds()
+    await ctx.send(f"Done fetching guilds! {joined} added, {left} removed")
+
+
+# calls and runtime of the named queries, slowest first
+@commands.is_owner()
+@bot.command(hidden=True)
+async def querystats(ctx):
+    lines = queries.report()[:15]
+    if len(lines) == 0:
+        await ctx.send("No queries ran yet")
+        return
+    await ctx.send("```" + "\n".join(lines) + "```")
 
 
 # send an announcement to all servers the bot is on
 @commands.is_owner()
 @bot.command(hidden=True)
 async def announce(ctx, *, message):
+    content = "```" + message + "```"
+    sent = []
     async with bot.pool.acquire() as db:
-        guilds_db = await db.fetch("SELECT * FROM Guilds")
-        for g in guilds_db:
-            if g[2] is not None:
-                channel = bot.get_channel(g[2])
-                await channel.send("```" + message + "```")
-            elif g[3] is not None:
-                channel = bot.get_channel(g[3])
-                await channel.send("```" + message + "```")
-            elif g[4] is not None:
-                channel = bot.get_channel(g[4])
-                await channel.send("```" + message + "```")
-            elif g[5] is not None:
-                channel = bot.get_channel(g[5])
-                await channel.send("```" + message + "```")
-            else:
-                guild = bot.get_guild(g[0])
-                for ch in guild.text_channels:
+        # the guilds are streamed through a cursor and the messages queued while later rows are read
+        async with db.transaction():
+            async for g in queries.ALL_GUILD_CHANNELS.cursor(db, prefetch=config.db_page_size):
+                if g[1] is not None:
+                    channel = bot.get_channel(g[1])
+                elif g[2] is not None:
+                    channel = bot.get_channel(g[2])
+                elif g[3] is not None:
+                    channel = bot.get_channel(g[3])
+                elif g[4] is not None:
+                    channel = bot.get_channel(g[4])
+                else:
+                    channel = None
+                    guild = bot.get_guild(g[0])
+                    if guild is None:
+                        continue
                     bot_member = guild.get_member(bot.user.id)
-                    permissions = ch.permissions_for(bot_member)
-                    if permissions.send_messages:
-                        await channel.send("```" + message + "```")
-                        break
+                    for ch in guild.text_channels:
+                        permissions = ch.permissions_for(bot_member)
+                        if permissions.send_messages:
+                            channel = ch
+                            break
+                if channel is not None:
+                    sent.append(bot.delivery.send(channel, content, priority=delivery.ANNOUNCEMENT))
+
+    await asyncio.gather(*sent)
 
     await ctx.send("Announcement sent!")
 
@@ -197,8 +229,20 @@ async def luv(ctx):
         pass
 
 if __name__ == "__main__":
-    bot.pool = bot.loop.run_until_complete(asyncpg.create_pool(
-        database="voiceoflightdb", loop=bot.loop, command_timeout=60))
+    bot.pool = bot.loop.run_until_complete(database.connect(bot.loop))
+    bot.loop.run_until_complete(migrations.migrate(bot.pool))
+    bot.subscriptions = SubscriptionIndex()
+    bot.loop.run_until_complete(bot.subscriptions.load(bot.pool))
+    bot.delivery = Dispatcher(bot)
+    bot.guild_remover = GuildRemover(bot)
+    bot.write_behind = WriteBehind(bot)
+    bot.posts = PostCache()
+    metrics.Gauge("vol_delivery_queue_depth", "Notifications waiting to be sent",
+                  lambda: bot.delivery.queue.qsize() + bot.delivery.delayed)
+    metrics.Gauge("vol_write_behind_pending", "State updates waiting to be written",
+                  lambda: len(bot.write_behind))
+    metrics.Gauge("vol_reddit_budget", "Fraction of the reddit rate limit budget left",
+                  lambda: bot.get_cog("Reddit").client.budget())
     for ext in extensions:
         bot.load_extension(ext)
     bot.run(auth_token.discord)
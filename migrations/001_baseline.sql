@@ -0,0 +1,69 @@
+-- tables as they were before migrations were introduced
+CREATE TABLE IF NOT EXISTS Guilds (
+    ID bigint,
+    Name text,
+    SurrenderAt20NotifChannel bigint,
+    TwitchNotifChannel bigint,
+    YoutubeNotifChannel bigint,
+    RedditNotifChannel bigint
+);
+
+CREATE TABLE IF NOT EXISTS Keywords (
+    Keyword text,
+    Guild bigint
+);
+
+CREATE TABLE IF NOT EXISTS Subreddits (
+    ID text,
+    Name text,
+    LastPostID text,
+    LastPostTime numeric
+);
+
+ALTER TABLE Subreddits ADD COLUMN IF NOT EXISTS Over18 boolean;
+ALTER TABLE Subreddits ADD COLUMN IF NOT EXISTS Icon text;
+ALTER TABLE Subreddits ADD COLUMN IF NOT EXISTS Description text;
+
+CREATE TABLE IF NOT EXISTS SubredditSubscriptions (
+    Subreddit text,
+    Guild bigint
+);
+
+CREATE TABLE IF NOT EXISTS SurrenderAt20Subscriptions (
+    Guild bigint,
+    RedPosts boolean,
+    PBE boolean,
+    Rotations boolean,
+    Esports boolean,
+    Releases boolean,
+    Other boolean DEFAULT true,
+    LastPostID character varying,
+    LastUpdated integer,
+    Updates integer,
+    LastPostMessage bigint
+);
+
+CREATE TABLE IF NOT EXISTS TwitchChannels (
+    ID text,
+    Name text,
+    LastLive timestamp with time zone
+);
+
+CREATE TABLE IF NOT EXISTS TwitchSubscriptions (
+    TwitchChannel text,
+    Guild bigint
+);
+
+CREATE TABLE IF NOT EXISTS YoutubeChannels (
+    ID text,
+    Name text,
+    LastLive timestamp with time zone,
+    LastVideoID text,
+    VideoCount bigint
+);
+
+CREATE TABLE IF NOT EXISTS YoutubeSubscriptions (
+    YoutubeChannel text,
+    Guild bigint,
+    OnlyStreams boolean
+);
@@ -0,0 +1,20 @@
+-- drop rows that can't satisfy a primary key, keeping the newest duplicate
+DELETE FROM Guilds WHERE ID IS NULL;
+DELETE FROM Guilds a USING Guilds b WHERE a.ctid < b.ctid AND a.ID = b.ID;
+ALTER TABLE Guilds ADD PRIMARY KEY (ID);
+
+DELETE FROM Subreddits WHERE ID IS NULL;
+DELETE FROM Subreddits a USING Subreddits b WHERE a.ctid < b.ctid AND a.ID = b.ID;
+ALTER TABLE Subreddits ADD PRIMARY KEY (ID);
+
+DELETE FROM TwitchChannels WHERE ID IS NULL;
+DELETE FROM TwitchChannels a USING TwitchChannels b WHERE a.ctid < b.ctid AND a.ID = b.ID;
+ALTER TABLE TwitchChannels ADD PRIMARY KEY (ID);
+
+DELETE FROM YoutubeChannels WHERE ID IS NULL;
+DELETE FROM YoutubeChannels a USING YoutubeChannels b WHERE a.ctid < b.ctid AND a.ID = b.ID;
+ALTER TABLE YoutubeChannels ADD PRIMARY KEY (ID);
+
+DELETE FROM SurrenderAt20Subscriptions WHERE Guild IS NULL;
+DELETE FROM SurrenderAt20Subscriptions a USING SurrenderAt20Subscriptions b WHERE a.ctid < b.ctid AND a.Guild = b.Guild;
+ALTER TABLE SurrenderAt20Subscriptions ADD PRIMARY KEY (Guild);
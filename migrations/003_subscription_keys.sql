@@ -0,0 +1,21 @@
+-- one row per subscription, the upstream id comes first to serve the fan-out lookups
+DELETE FROM YoutubeSubscriptions WHERE YoutubeChannel IS NULL OR Guild IS NULL;
+DELETE FROM YoutubeSubscriptions a USING YoutubeSubscriptions b
+    WHERE a.ctid < b.ctid AND a.YoutubeChannel = b.YoutubeChannel AND a.Guild = b.Guild;
+ALTER TABLE YoutubeSubscriptions ADD PRIMARY KEY (YoutubeChannel, Guild);
+
+DELETE FROM TwitchSubscriptions WHERE TwitchChannel IS NULL OR Guild IS NULL;
+DELETE FROM TwitchSubscriptions a USING TwitchSubscriptions b
+    WHERE a.ctid < b.ctid AND a.TwitchChannel = b.TwitchChannel AND a.Guild = b.Guild;
+ALTER TABLE TwitchSubscriptions ADD PRIMARY KEY (TwitchChannel, Guild);
+
+DELETE FROM SubredditSubscriptions WHERE Subreddit IS NULL OR Guild IS NULL;
+DELETE FROM SubredditSubscriptions a USING SubredditSubscriptions b
+    WHERE a.ctid < b.ctid AND a.Subreddit = b.Subreddit AND a.Guild = b.Guild;
+ALTER TABLE SubredditSubscriptions ADD PRIMARY KEY (Subreddit, Guild);
+
+-- keywords are always looked up by guild
+DELETE FROM Keywords WHERE Keyword IS NULL OR Guild IS NULL;
+DELETE FROM Keywords a USING Keywords b
+    WHERE a.ctid < b.ctid AND a.Guild = b.Guild AND a.Keyword = b.Keyword;
+ALTER TABLE Keywords ADD PRIMARY KEY (Guild, Keyword);
@@ -0,0 +1,7 @@
+-- list commands and guild removal look subscriptions up by guild
+CREATE INDEX IF NOT EXISTS YoutubeSubscriptions_Guild ON YoutubeSubscriptions (Guild);
+CREATE INDEX IF NOT EXISTS TwitchSubscriptions_Guild ON TwitchSubscriptions (Guild);
+CREATE INDEX IF NOT EXISTS SubredditSubscriptions_Guild ON SubredditSubscriptions (Guild);
+
+-- subreddits are resolved by name when (un)subscribing
+CREATE INDEX IF NOT EXISTS Subreddits_LowerName ON Subreddits (lower(Name));
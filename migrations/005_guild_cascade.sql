@@ -0,0 +1,18 @@
+-- drop rows of guilds that are already gone, they would violate the foreign keys
+DELETE FROM YoutubeSubscriptions WHERE Guild NOT IN (SELECT ID FROM Guilds);
+DELETE FROM TwitchSubscriptions WHERE Guild NOT IN (SELECT ID FROM Guilds);
+DELETE FROM SubredditSubscriptions WHERE Guild NOT IN (SELECT ID FROM Guilds);
+DELETE FROM Keywords WHERE Guild NOT IN (SELECT ID FROM Guilds);
+DELETE FROM SurrenderAt20Subscriptions WHERE Guild NOT IN (SELECT ID FROM Guilds);
+
+-- everything a guild owns is removed together with its Guilds row
+ALTER TABLE YoutubeSubscriptions ADD FOREIGN KEY (Guild) REFERENCES Guilds (ID) ON DELETE CASCADE;
+ALTER TABLE TwitchSubscriptions ADD FOREIGN KEY (Guild) REFERENCES Guilds (ID) ON DELETE CASCADE;
+ALTER TABLE SubredditSubscriptions ADD FOREIGN KEY (Guild) REFERENCES Guilds (ID) ON DELETE CASCADE;
+ALTER TABLE Keywords ADD FOREIGN KEY (Guild) REFERENCES Guilds (ID) ON DELETE CASCADE;
+ALTER TABLE SurrenderAt20Subscriptions ADD FOREIGN KEY (Guild) REFERENCES Guilds (ID) ON DELETE CASCADE;
+
+-- channels and subreddits without any subscription left
+DELETE FROM YoutubeChannels WHERE ID NOT IN (SELECT YoutubeChannel FROM YoutubeSubscriptions WHERE YoutubeChannel IS NOT NULL);
+DELETE FROM TwitchChannels WHERE ID NOT IN (SELECT TwitchChannel FROM TwitchSubscriptions WHERE TwitchChannel IS NOT NULL);
+DELETE FROM Subreddits WHERE ID NOT IN (SELECT Subreddit FROM SubredditSubscriptions WHERE Subreddit IS NOT NULL);
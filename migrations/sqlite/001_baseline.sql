@@ -0,0 +1,77 @@
+-- the complete schema, sqlite databases start out with all postgres migrations applied
+CREATE TABLE IF NOT EXISTS Guilds (
+    ID INTEGER PRIMARY KEY,
+    Name TEXT,
+    SurrenderAt20NotifChannel INTEGER,
+    TwitchNotifChannel INTEGER,
+    YoutubeNotifChannel INTEGER,
+    RedditNotifChannel INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS YoutubeChannels (
+    ID TEXT PRIMARY KEY,
+    Name TEXT,
+    LastLive TIMESTAMPTZ,
+    LastVideoID TEXT,
+    VideoCount INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS TwitchChannels (
+    ID TEXT PRIMARY KEY,
+    Name TEXT,
+    LastLive TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS Subreddits (
+    ID TEXT PRIMARY KEY,
+    Name TEXT,
+    LastPostID TEXT,
+    LastPostTime REAL,
+    Over18 BOOLEAN,
+    Icon TEXT,
+    Description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS YoutubeSubscriptions (
+    YoutubeChannel TEXT,
+    Guild INTEGER REFERENCES Guilds (ID) ON DELETE CASCADE,
+    OnlyStreams BOOLEAN,
+    PRIMARY KEY (YoutubeChannel, Guild)
+);
+
+CREATE TABLE IF NOT EXISTS TwitchSubscriptions (
+    TwitchChannel TEXT,
+    Guild INTEGER REFERENCES Guilds (ID) ON DELETE CASCADE,
+    PRIMARY KEY (TwitchChannel, Guild)
+);
+
+CREATE TABLE IF NOT EXISTS SubredditSubscriptions (
+    Subreddit TEXT,
+    Guild INTEGER REFERENCES Guilds (ID) ON DELETE CASCADE,
+    PRIMARY KEY (Subreddit, Guild)
+);
+
+CREATE TABLE IF NOT EXISTS Keywords (
+    Keyword TEXT,
+    Guild INTEGER REFERENCES Guilds (ID) ON DELETE CASCADE,
+    PRIMARY KEY (Guild, Keyword)
+);
+
+CREATE TABLE IF NOT EXISTS SurrenderAt20Subscriptions (
+    Guild INTEGER PRIMARY KEY REFERENCES Guilds (ID) ON DELETE CASCADE,
+    RedPosts BOOLEAN,
+    PBE BOOLEAN,
+    Rotations BOOLEAN,
+    Esports BOOLEAN,
+    Releases BOOLEAN,
+    Other BOOLEAN DEFAULT 1,
+    LastPostID TEXT,
+    LastUpdated INTEGER,
+    Updates INTEGER,
+    LastPostMessage INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS YoutubeSubscriptions_Guild ON YoutubeSubscriptions (Guild);
+CREATE INDEX IF NOT EXISTS TwitchSubscriptions_Guild ON TwitchSubscriptions (Guild);
+CREATE INDEX IF NOT EXISTS SubredditSubscriptions_Guild ON SubredditSubscriptions (Guild);
+CREATE INDEX IF NOT EXISTS Subreddits_LowerName ON Subreddits (lower(Name));
@@ -1,6 +1,9 @@
 --
 -- PostgreSQL database dump
 --
+-- Kept for reference, the bot creates and updates its tables
+-- at startup from the numbered files in migrations/
+--
 
 -- Dumped from database version 10.7 (Ubuntu 10.7-0ubuntu0.18.04.1)
 -- Dumped by pg_dump version 10.7 (Ubuntu 10.7-0ubuntu0.18.04.1)
@@ -65,7 +68,10 @@ CREATE TABLE public.subreddits (
     id text,
     name text,
     lastpostid text,
-    lastposttime numeric
+    lastposttime numeric,
+    over18 boolean,
+    icon text,
+    description text
 );
 
 
@@ -0,0 +1,450 @@
+import asyncio
+import datetime
+import os
+import types
+import uuid
+
+import pytest
+
+import config
+from ext import database
+from ext import migrations
+from ext import queries
+from ext import sqlite
+from ext import subscriptions
+from ext import writebehind
+
+# every test runs against both storage backends
+# postgres runs in a throwaway schema of the database named by the libpq connection string
+# in VOL_TEST_POSTGRES, or of config.postgres_database on the local server, and is skipped
+# when neither can be reached
+BACKENDS = ("sqlite", "postgres")
+
+# discord ids are too large for 32 bit integers
+G1 = 100000000000000001
+G2 = 100000000000000002
+G3 = 100000000000000003
+CHANNEL = 200000000000000001
+LIVE = datetime.datetime(2020, 1, 1, 12, 30, tzinfo=datetime.timezone.utc)
+
+
+def postgres_settings():
+    dsn = os.environ.get("VOL_TEST_POSTGRES")
+    if dsn:
+        return {"dsn": dsn}
+    return {"database": config.postgres_database}
+
+
+async def open_postgres(schema):
+    try:
+        import asyncpg
+    except ImportError:
+        pytest.skip("asyncpg is not installed")
+    settings = postgres_settings()
+    try:
+        connection = await asyncpg.connect(timeout=5, **settings)
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as ex:
+        pytest.skip(f"no postgres server: {ex}")
+    try:
+        await connection.execute(f"CREATE SCHEMA {schema}")
+    finally:
+        await connection.close()
+    # two connections, so queries run on connections that went back to the pool before
+    return database.Pool(await asyncpg.create_pool(
+        min_size=2, max_size=2, server_settings={"search_path": schema}, **settings))
+
+
+async def drop_postgres(schema):
+    import asyncpg
+    connection = await asyncpg.connect(timeout=5, **postgres_settings())
+    try:
+        await connection.execute(f"DROP SCHEMA {schema} CASCADE")
+    finally:
+        await connection.close()
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(params=BACKENDS)
+def pool(request, loop):
+    schema = "vol_test_" + uuid.uuid4().hex[:12]
+    if request.param == "sqlite":
+        pool = loop.run_until_complete(sqlite.SqlitePool.open(":memory:", loop))
+    else:
+        pool = loop.run_until_complete(open_postgres(schema))
+    try:
+        loop.run_until_complete(migrations.migrate(pool))
+        yield pool
+    finally:
+        loop.run_until_complete(pool.close())
+        if request.param == "postgres":
+            loop.run_until_complete(drop_postgres(schema))
+
+
+# sqlite rows only compare equal to other sqlite rows
+def tuples(rows):
+    return sorted(tuple(row) for row in rows)
+
+
+async def add_guilds(db, *guild_ids):
+    for guild_id in guild_ids:
+        await queries.ADD_GUILD.execute(db, guild_id, f"guild {guild_id}")
+
+
+async def guild_ids(db):
+    return sorted(row[0] for row in await queries.ALL_GUILD_CHANNELS.fetch(db))
+
+
+def test_migrate(pool, loop, capsys):
+    async def check():
+        async with pool.acquire() as db:
+            applied = await db.fetch("SELECT Version FROM SchemaMigrations ORDER BY Version")
+        assert [row[0] for row in applied] == [version for version, _, _ in migrations.load_migrations(pool.migrations_dir)]
+
+        # everything is applied already
+        capsys.readouterr()
+        await migrations.migrate(pool)
+        assert capsys.readouterr().out == ""
+        async with pool.acquire() as db:
+            assert await db.fetchval("SELECT count(*) FROM SchemaMigrations") == len(applied)
+
+    loop.run_until_complete(check())
+
+
+def test_guild_queries(pool, loop):
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, G1, G2)
+            await queries.ADD_GUILD.execute(db, G1, "renamed")
+            assert await db.fetchval("SELECT Name FROM Guilds WHERE ID=$1", G1) == "renamed"
+
+            assert await queries.GUILD_CHANNELS.fetchrow(db, G1) == queries.GuildChannels(None, None, None, None)
+            assert await queries.GUILD_CHANNELS.fetchrow(db, G3) is None
+            for offset, kind in enumerate(subscriptions.KINDS):
+                await queries.SET_CHANNEL[kind].execute(db, CHANNEL + offset, G1)
+            assert await queries.GUILD_CHANNELS.fetchrow(db, G1) == queries.GuildChannels(
+                CHANNEL, CHANNEL + 1, CHANNEL + 2, CHANNEL + 3)
+
+            await queries.SET_ALL_CHANNELS.execute(db, CHANNEL, G2)
+            assert tuples(await queries.ALL_GUILD_CHANNELS.fetch(db)) == [
+                (G1, CHANNEL, CHANNEL + 1, CHANNEL + 2, CHANNEL + 3), (G2, CHANNEL, CHANNEL, CHANNEL, CHANNEL)]
+
+    loop.run_until_complete(check())
+
+
+def test_youtube_queries(pool, loop):
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, G1, G2)
+            await queries.ADD_YOUTUBE_CHANNEL.execute(db, "UC1", "channel", LIVE, "video", 10)
+            # known channels keep their state
+            await queries.ADD_YOUTUBE_CHANNEL.execute(db, "UC1", "other", None, None, 0)
+            assert await queries.YOUTUBE_LAST_LIVE.fetchval(db, "UC1") == LIVE
+            assert await queries.YOUTUBE_VIDEO_STATS.fetchrow(db, "UC1") == queries.YoutubeVideoStats("video", 10)
+            await queries.SET_YOUTUBE_VIDEO_COUNT.execute(db, 11, "UC1")
+            assert (await queries.YOUTUBE_VIDEO_STATS.fetchrow(db, "UC1")).video_count == 11
+
+            assert await queries.YOUTUBE_SUBSCRIBE.fetchval(db, "UC1", G1, True) == 1
+            assert await queries.YOUTUBE_SUBSCRIBE.fetchval(db, "UC1", G1, False) is None
+            assert await queries.YOUTUBE_SUBSCRIBE.fetchval(db, "UC1", G2, False) == 1
+            assert tuples(await queries.YOUTUBE_SUBSCRIPTIONS.fetch(db, G1)) == [("channel", True)]
+            assert tuples(await queries.ALL_YOUTUBE_SUBSCRIPTIONS.fetch(db)) == [("UC1", G1, True), ("UC1", G2, False)]
+            assert tuples(await queries.YOUTUBE_CHANNEL_IDS.fetch(db)) == [("UC1",)]
+
+            # the channel stays while another guild is subscribed
+            assert await queries.YOUTUBE_UNSUBSCRIBE.fetchval(db, "UC1", G1) == 1
+            assert await queries.YOUTUBE_UNSUBSCRIBE.fetchval(db, "UC1", G1) is None
+            await queries.REMOVE_YOUTUBE_CHANNEL.execute(db, "UC1")
+            assert await queries.YOUTUBE_VIDEO_STATS.fetchrow(db, "UC1") is not None
+            await queries.YOUTUBE_UNSUBSCRIBE.fetchval(db, "UC1", G2)
+            await queries.REMOVE_YOUTUBE_CHANNEL.execute(db, "UC1")
+            assert await queries.YOUTUBE_VIDEO_STATS.fetchrow(db, "UC1") is None
+
+    loop.run_until_complete(check())
+
+
+def test_twitch_queries(pool, loop):
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, G1, G2)
+            await queries.ADD_TWITCH_CHANNEL.execute(db, "123", "streamer", LIVE)
+            await queries.ADD_TWITCH_CHANNEL.execute(db, "123", "other", None)
+            assert await queries.TWITCH_LAST_LIVE.fetchval(db, "123") == LIVE
+
+            assert await queries.TWITCH_SUBSCRIBE.fetchval(db, "123", G1) == 1
+            assert await queries.TWITCH_SUBSCRIBE.fetchval(db, "123", G1) is None
+            assert await queries.TWITCH_SUBSCRIBE.fetchval(db, "123", G2) == 1
+            assert tuples(await queries.TWITCH_SUBSCRIPTIONS.fetch(db, G1)) == [("streamer",)]
+            assert tuples(await queries.ALL_TWITCH_SUBSCRIPTIONS.fetch(db)) == [("123", G1), ("123", G2)]
+            assert tuples(await queries.TWITCH_CHANNEL_IDS.fetch(db)) == [("123",)]
+
+            assert await queries.TWITCH_UNSUBSCRIBE.fetchval(db, "123", G1) == 1
+            await queries.REMOVE_TWITCH_CHANNEL.execute(db, "123")
+            assert await queries.TWITCH_LAST_LIVE.fetchrow(db, "123") is not None
+            await queries.TWITCH_UNSUBSCRIBE.fetchval(db, "123", G2)
+            await queries.REMOVE_TWITCH_CHANNEL.execute(db, "123")
+            assert await queries.TWITCH_LAST_LIVE.fetchrow(db, "123") is None
+
+    loop.run_until_complete(check())
+
+
+def test_reddit_queries(pool, loop):
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, G1, G2)
+            await queries.ADD_SUBREDDIT.execute(db, "t5_1", "Python", "t3_1", 1577836800.5, False, "icon", "snakes")
+            await queries.ADD_SUBREDDIT.execute(db, "t5_1", "Other", None, None, True, None, None)
+            assert await queries.SUBREDDIT_BY_NAME.fetchrow(db, "python") == queries.SubredditInfo(
+                "t5_1", "Python", False, "icon", "snakes")
+            assert await queries.SUBREDDIT_BY_NAME.fetchrow(db, "other") is None
+            assert await queries.SUBREDDIT_KNOWN.fetchval(db, "t5_1") == 1
+            assert await queries.SUBREDDIT_KNOWN.fetchval(db, "t5_2") is None
+            await queries.UPDATE_SUBREDDIT.execute(db, True, None, "more snakes", "t5_1")
+            assert (await queries.SUBREDDIT_BY_NAME.fetchrow(db, "python")).over18
+
+            states = await queries.SUBREDDIT_POLL_STATES.fetch(db)
+            assert [(row[0], row[1], row[2], float(row[3])) for row in states] == [("t5_1", "Python", "t3_1", 1577836800.5)]
+
+            assert await queries.REDDIT_SUBSCRIBE.fetchval(db, "t5_1", G1) == 1
+            assert await queries.REDDIT_SUBSCRIBE.fetchval(db, "t5_1", G1) is None
+            assert await queries.REDDIT_SUBSCRIBE.fetchval(db, "t5_1", G2) == 1
+            assert tuples(await queries.REDDIT_SUBSCRIPTIONS.fetch(db, G1)) == [("Python",)]
+            assert tuples(await queries.ALL_REDDIT_SUBSCRIPTIONS.fetch(db)) == [("t5_1", G1), ("t5_1", G2)]
+
+            assert await queries.REDDIT_UNSUBSCRIBE.fetchval(db, "t5_1", G1) == 1
+            assert await queries.REDDIT_UNSUBSCRIBE.fetchval(db, "t5_1", G1) is None
+            assert await queries.REMOVE_SUBREDDIT.fetchval(db, "t5_1") is None
+            await queries.REDDIT_UNSUBSCRIBE.fetchval(db, "t5_1", G2)
+            assert await queries.REMOVE_SUBREDDIT.fetchval(db, "t5_1") == 1
+            assert await queries.SUBREDDIT_KNOWN.fetchval(db, "t5_1") is None
+
+    loop.run_until_complete(check())
+
+
+def test_surrenderat20_queries(pool, loop):
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, G1, G2)
+            await queries.SURRENDERAT20_SUBSCRIBE.execute(db, G1, True, False, True, False, True, True)
+            assert await queries.SURRENDERAT20_CATEGORIES.fetchrow(db, G1) == queries.SurrenderAt20Categories(
+                True, False, True, False, True, True)
+            assert await queries.SURRENDERAT20_CATEGORIES.fetchrow(db, G2) is None
+            await queries.SET_SURRENDERAT20_CATEGORIES.execute(db, False, True, False, True, False, True, G1)
+            await queries.SURRENDERAT20_DROP_OTHER.execute(db, G1)
+            assert await queries.SURRENDERAT20_CATEGORIES.fetchrow(db, G1) == queries.SurrenderAt20Categories(
+                False, True, False, True, False, False)
+            assert tuples(await queries.ALL_SURRENDERAT20_SUBSCRIPTIONS.fetch(db)) == [
+                (G1, False, True, False, True, False, False)]
+
+            # only guilds that got a post are tracked
+            await queries.SURRENDERAT20_SUBSCRIBE.execute(db, G2, True, True, True, True, True, True)
+            await db.execute("UPDATE SurrenderAt20Subscriptions SET LastPostID=$1, LastUpdated=$2, Updates=$3, \
+                              LastPostMessage=$4 WHERE Guild=$5", "post", 1577836800, 0, CHANNEL, G2)
+            assert tuples(await queries.SURRENDERAT20_TRACKED_POSTS.fetch(db, -1, 10)) == [
+                (G2, "post", 1577836800, 0, CHANNEL)]
+
+            assert await queries.ADD_KEYWORD.fetchval(db, "jinx", G1) == 1
+            assert await queries.ADD_KEYWORD.fetchval(db, "jinx", G1) is None
+            assert await queries.ADD_KEYWORD.fetchval(db, "vi", G1) == 1
+            assert await queries.ADD_KEYWORD.fetchval(db, "jinx", G2) == 1
+            assert tuples(await queries.GUILD_KEYWORDS.fetch(db, G1)) == [("jinx",), ("vi",)]
+            assert tuples(await queries.ALL_KEYWORDS.fetch(db)) == [(G1, "jinx"), (G1, "vi"), (G2, "jinx")]
+            assert await queries.REMOVE_KEYWORD.fetchval(db, "vi", G1) == 1
+            assert await queries.REMOVE_KEYWORD.fetchval(db, "vi", G1) is None
+            assert tuples(await queries.GUILD_KEYWORDS.fetch(db, G1)) == [("jinx",)]
+
+            await queries.SURRENDERAT20_UNSUBSCRIBE.execute(db, G1)
+            assert await queries.SURRENDERAT20_CATEGORIES.fetchrow(db, G1) is None
+
+    loop.run_until_complete(check())
+
+
+# the state updates of the hot paths, written in batches per named query
+def test_write_behind(pool, loop):
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, G1, G2)
+            await queries.ADD_YOUTUBE_CHANNEL.execute(db, "UC1", "channel", None, None, 0)
+            await queries.ADD_TWITCH_CHANNEL.execute(db, "123", "streamer", None)
+            await queries.ADD_SUBREDDIT.execute(db, "t5_1", "Python", None, None, False, None, None)
+            for guild_id in (G1, G2):
+                await queries.SURRENDERAT20_SUBSCRIBE.execute(db, guild_id, True, True, True, True, True, True)
+
+        buffer = writebehind.WriteBehind(types.SimpleNamespace(loop=loop, pool=pool))
+        calls = queries.query_seconds.values.get(("set surrenderat20 last post",), [0])[-1]
+        buffer.update(queries.SET_YOUTUBE_LAST_LIVE, "UC1", LIVE, "UC1")
+        buffer.update(queries.SET_YOUTUBE_LAST_VIDEO, "UC1", "video", 3, "UC1")
+        buffer.update(queries.SET_TWITCH_LAST_LIVE, "123", LIVE, "123")
+        buffer.update(queries.SET_SUBREDDIT_LAST_POST, "t5_1", "t3_1", 1577836800.5, "t5_1")
+        for guild_id in (G1, G2):
+            buffer.update(queries.SET_SURRENDERAT20_LAST_POST, guild_id, "post", 1577836800, 0, CHANNEL, guild_id)
+        buffer.update(queries.SET_SURRENDERAT20_POST_UPDATE, G2, 1577836900, 1, G2)
+        # a newer update of a row replaces the buffered one
+        buffer.update(queries.SET_TWITCH_LAST_LIVE, "123", None, "123")
+        assert buffer.get(queries.SET_TWITCH_LAST_LIVE, "123") == (None, "123")
+        await buffer.close()
+
+        assert len(buffer) == 0
+        # both guilds went out in one batch
+        assert queries.query_seconds.values[("set surrenderat20 last post",)][-1] == calls + 1
+        async with pool.acquire() as db:
+            assert await queries.YOUTUBE_LAST_LIVE.fetchval(db, "UC1") == LIVE
+            assert await queries.YOUTUBE_VIDEO_STATS.fetchrow(db, "UC1") == queries.YoutubeVideoStats("video", 3)
+            assert await queries.TWITCH_LAST_LIVE.fetchval(db, "123") is None
+            states = await queries.SUBREDDIT_POLL_STATES.fetch(db)
+            assert [(row[2], float(row[3])) for row in states] == [("t3_1", 1577836800.5)]
+            assert tuples(await queries.SURRENDERAT20_TRACKED_POSTS.fetch(db, -1, 10)) == [
+                (G1, "post", 1577836800, 0, CHANNEL), (G2, "post", 1577836900, 1, CHANNEL)]
+
+    loop.run_until_complete(check())
+
+
+# every named query is run by one of the tests above
+def test_every_query_is_tested():
+    with open(__file__) as file:
+        source = file.read()
+    untested = [name for name, value in vars(queries).items()
+                if isinstance(value, queries.Query) and "queries." + name not in source]
+    assert untested == []
+
+
+# connections go back to the pool between the acquisitions, their queries have to keep working
+def test_queries_across_acquisitions(pool, loop):
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, G1)
+        for _ in range(6):
+            async with pool.acquire() as db:
+                assert await queries.GUILD_CHANNELS.fetchrow(db, G1) is not None
+                assert await queries.ADD_KEYWORD.fetchval(db, "jinx", G1) in (1, None)
+
+    loop.run_until_complete(check())
+
+
+def test_remove_guilds(pool, loop):
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, G1, G2)
+            await queries.ADD_YOUTUBE_CHANNEL.execute(db, "shared", "shared", None, None, 0)
+            await queries.YOUTUBE_SUBSCRIBE.fetchval(db, "shared", G1, False)
+            await queries.YOUTUBE_SUBSCRIBE.fetchval(db, "shared", G2, False)
+            await queries.ADD_TWITCH_CHANNEL.execute(db, "only g1", "only g1", None)
+            await queries.TWITCH_SUBSCRIBE.fetchval(db, "only g1", G1)
+            await queries.ADD_SUBREDDIT.execute(db, "t5_1", "g1", None, None, False, None, None)
+            await queries.REDDIT_SUBSCRIBE.fetchval(db, "t5_1", G1)
+            await queries.ADD_SUBREDDIT.execute(db, "t5_2", "g2", None, None, False, None, None)
+            await queries.REDDIT_SUBSCRIBE.fetchval(db, "t5_2", G2)
+            await queries.SURRENDERAT20_SUBSCRIBE.execute(db, G1, True, True, True, True, True, True)
+            await queries.ADD_KEYWORD.fetchval(db, "jinx", G1)
+
+            removed, subreddits = await pool.remove_guilds(db, [G1, G3])
+            assert list(removed) == [G1]
+            assert list(subreddits) == ["t5_1"]
+
+            assert await guild_ids(db) == [G2]
+            assert tuples(await queries.YOUTUBE_CHANNEL_IDS.fetch(db)) == [("shared",)]
+            assert await queries.YOUTUBE_VIDEO_STATS.fetchrow(db, "shared") is not None
+            assert await queries.TWITCH_LAST_LIVE.fetchrow(db, "only g1") is None
+            assert await queries.SUBREDDIT_KNOWN.fetchval(db, "t5_1") is None
+            assert await queries.SUBREDDIT_KNOWN.fetchval(db, "t5_2") == 1
+            assert await queries.SURRENDERAT20_CATEGORIES.fetchrow(db, G1) is None
+            assert await queries.ALL_KEYWORDS.fetch(db) == []
+
+            # nothing to remove
+            removed, subreddits = await pool.remove_guilds(db, [])
+            assert list(removed) == [] and list(subreddits) == []
+
+    loop.run_until_complete(check())
+
+
+# the reconcile of main.py, run twice so the LiveGuilds table is set up again
+def test_load_live_guilds(pool, loop):
+    async def reconcile(live):
+        async with pool.acquire() as db:
+            async with db.transaction():
+                await pool.load_live_guilds(db, live)
+                joined = await queries.ADD_LIVE_GUILDS.fetch(db)
+                left = await queries.LEFT_GUILDS.fetch(db)
+                await pool.remove_guilds(db, [row[0] for row in left])
+        return tuples(joined), tuples(left)
+
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, G1, G2)
+        assert await reconcile([(G2, "b"), (G3, "c")]) == ([(G3, "c")], [(G1, f"guild {G1}")])
+        assert await reconcile([(G3, "c")]) == ([], [(G2, f"guild {G2}")])
+        async with pool.acquire() as db:
+            assert await guild_ids(db) == [G3]
+
+    loop.run_until_complete(check())
+
+
+def test_transactions(pool, loop):
+    async def check():
+        async with pool.acquire() as db:
+            with pytest.raises(RuntimeError):
+                async with db.transaction():
+                    await add_guilds(db, G1)
+                    raise RuntimeError
+            assert await guild_ids(db) == []
+
+            async with db.transaction():
+                await add_guilds(db, G1)
+                # a savepoint rolls back on its own, the outer transaction goes on
+                with pytest.raises(RuntimeError):
+                    async with db.transaction():
+                        await add_guilds(db, G2)
+                        raise RuntimeError
+                # so does a failed statement inside one
+                with pytest.raises(Exception):
+                    async with db.transaction():
+                        await db.execute("INSERT INTO Guilds (ID, Name) VALUES ($1, $2)", G1, "duplicate")
+                async with db.transaction():
+                    await add_guilds(db, G3)
+            assert await guild_ids(db) == [G1, G3]
+
+    loop.run_until_complete(check())
+
+
+def test_cursor(pool, loop):
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, G1, G2, G3)
+            async with db.transaction():
+                rows = [row async for row in queries.ALL_GUILD_CHANNELS.cursor(db, prefetch=2)]
+        assert tuples(rows) == [(G1, None, None, None, None), (G2, None, None, None, None), (G3, None, None, None, None)]
+
+    loop.run_until_complete(check())
+
+
+def test_stream(pool, loop, monkeypatch):
+    monkeypatch.setattr(config, "db_page_size", 2)
+    guilds = [G1 + offset for offset in range(7)]
+
+    async def check():
+        async with pool.acquire() as db:
+            await add_guilds(db, *guilds)
+            for guild_id in guilds:
+                await queries.SURRENDERAT20_SUBSCRIBE.execute(db, guild_id, True, True, True, True, True, True)
+            # guilds without a post are left out
+            await db.execute("UPDATE SurrenderAt20Subscriptions SET LastPostID=$1, LastUpdated=0, Updates=0 \
+                              WHERE Guild<>$2", "post", guilds[3])
+
+        rows = [row async for row in database.stream(pool, queries.SURRENDERAT20_TRACKED_POSTS, -1)]
+        assert [row[0] for row in rows] == guilds[:3] + guilds[4:]
+
+        # stopping early drops the page that is read ahead
+        rows = database.stream(pool, queries.SURRENDERAT20_TRACKED_POSTS, -1)
+        async for row in rows:
+            assert row[0] == guilds[0]
+            break
+        await rows.aclose()
+        async with pool.acquire() as db:
+            assert len(await guild_ids(db)) == len(guilds)
+
+    loop.run_until_complete(check())